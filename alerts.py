@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def active_alerts(data):
+    # regionId -> (regionName, frozenset типов активных тревог)
+    return {
+        str(region["regionId"]): (region.get("regionName", ""), frozenset(alert["type"] for alert in region["activeAlerts"]))
+        for region in data
+        if region.get("activeAlerts")
+    }
+
+
+def diff_alerts(previous, current):
+    # Регионы, где набор тревог изменился: regionId -> (имя, старые типы, новые типы)
+    changed = {}
+    for region_id in previous.keys() | current.keys():
+        old_name, old_types = previous.get(region_id, ("", frozenset()))
+        new_name, new_types = current.get(region_id, ("", frozenset()))
+        if old_types != new_types:
+            changed[region_id] = (new_name or old_name, old_types, new_types)
+    return changed
+
+
+def transitions(changed):
+    # -> (начавшиеся [(regionId, имя, тип)], закончившиеся [(regionId, тип)])
+    started, ended = [], []
+    for region_id, (name, old_types, new_types) in changed.items():
+        started.extend((region_id, name, alert_type) for alert_type in sorted(new_types - old_types))
+        ended.extend((region_id, alert_type) for alert_type in sorted(old_types - new_types))
+    return started, ended
+
+
+def render_change(name, old_types, new_types):
+    if new_types:
+        return f"🚨 Тревога в регионе {name}: {', '.join(sorted(new_types))}"
+    return f"✅ Отбой тревоги в регионе {name}"
+
+
+# --- СНИМОК ТРЕВОГ ---
+class AlertSnapshot:
+    # Активные тревоги всей страны в одном словаре regionId -> (имя, типы)
+    # на процесс. Снимок обновляется не чаще раза в max_age секунд, сколько бы
+    # пользователей ни нажимали «Проверить сейчас»; одновременные запросы ждут
+    # одно общее обновление. Перед загрузкой полного списка проверяется
+    # дешёвый /alerts/status: если lastActionIndex не сдвинулся, список тот же.
+    def __init__(self, http, url, headers, status_url=None, max_age=10):
+        self.http = http
+        self.url = url
+        self.headers = headers
+        self.status_url = status_url
+        self.max_age = max_age
+        self.alerts = {}
+        self.action_index = None
+        self.updated_at = None
+        self._inflight = None
+        self.hits = 0
+        self.coalesced = 0
+        self.status_checks = 0
+        self.unchanged = 0
+        self.fetches = 0
+
+    @property
+    def fresh(self):
+        return self.updated_at is not None and time.monotonic() - self.updated_at < self.max_age
+
+    async def get(self):
+        if self.fresh:
+            self.hits += 1
+            return self.alerts
+        if self._inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(self._inflight)
+        future = self._inflight = asyncio.get_running_loop().create_future()
+        try:
+            await self._refresh()
+        except BaseException as e:
+            # Отмена обновляющего не должна оставить ожидающих висеть
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("обновление тревог прервано"))
+            # Исключение уже отдано ожидающим; не даём asyncio ругаться на него
+            future.exception()
+            raise
+        else:
+            future.set_result(self.alerts)
+            return self.alerts
+        finally:
+            self._inflight = None
+
+    async def region(self, region_id):
+        # Типы активных тревог региона; пустое множество — тревоги нет
+        return (await self.get()).get(str(region_id), ("", frozenset()))[1]
+
+    async def _status(self):
+        async with self.http.get(self.status_url, headers=self.headers) as response:
+            if response.status != 200:
+                return None
+            return (await response.json()).get("lastActionIndex")
+
+    async def _refresh(self):
+        action_index = None
+        if self.status_url:
+            self.status_checks += 1
+            try:
+                action_index = await self._status()
+            except Exception as e:
+                logger.warning(f"Не удалось проверить статус тревог: {e}")
+            if action_index is not None and action_index == self.action_index:
+                self.unchanged += 1
+                self.updated_at = time.monotonic()
+                return
+        async with self.http.get(self.url, headers=self.headers) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Ошибка API: {response.status}")
+            data = await response.json()
+        self.fetches += 1
+        self.alerts = active_alerts(data)
+        self.action_index = action_index
+        self.updated_at = time.monotonic()
+
+    def stats(self):
+        return {
+            "regions": len(self.alerts),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "status_checks": self.status_checks,
+            "unchanged": self.unchanged,
+            "fetches": self.fetches,
+        }
+
+
+# --- ОПРОС ТРЕВОГ ---
+class AlertPoller:
+    # Одна фоновая задача берёт общий AlertSnapshot и сравнивает набор
+    # активных тревог с тем, что видела в прошлый раз. Подписчики изменившихся
+    # регионов ищутся по индексу users.reg_id, так что стоимость опроса
+    # не зависит от числа пользователей. Начала и отбои тревог пишутся
+    # в history одной транзакцией на опрос, старше retention — удаляются.
+    def __init__(self, snapshot, users, notify, interval=30, history=None,
+                 retention=30 * 86400, prune_interval=3600):
+        self.snapshot = snapshot
+        self.users = users
+        self.notify = notify
+        self.interval = interval
+        self.history = history
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.seen = None
+        self.polls = 0
+        self.notifications = 0
+        self.transitions = 0
+        self.pruned = 0
+
+    async def record(self, changed):
+        started, ended = transitions(changed)
+        if self.history is not None and (started or ended):
+            await self.history.record(started, ended, int(time.time()))
+            self.transitions += len(started) + len(ended)
+
+    async def poll_once(self):
+        current = await self.snapshot.get()
+        self.polls += 1
+        if self.seen is None:
+            # Первый опрос задаёт точку отсчёта, уведомлять не о чем. История
+            # сверяется с открытыми в ней тревогами: пока бот был остановлен,
+            # какие-то из них могли закончиться, а другие начаться.
+            if self.history is not None:
+                await self.record(diff_alerts(await self.history.open_alerts(), current))
+            self.seen = current
+            return {}
+        changed = diff_alerts(self.seen, current)
+        # Снимок обновляется после записи: при ошибке БД переходы повторятся в следующем опросе
+        await self.record(changed)
+        self.seen = current
+        for region_id, (name, old_types, new_types) in changed.items():
+            text = render_change(name, old_types, new_types)
+            for user_id in await self.users.subscribers(region_id):
+                await self.notify(user_id, text)
+                self.notifications += 1
+        return changed
+
+    async def prune(self):
+        self.pruned += await self.history.prune(int(time.time()) - self.retention)
+
+    async def run_forever(self):
+        pruned_at = 0.0
+        while True:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.error(f"Ошибка при опросе тревог: {e}")
+            if self.history is not None and time.monotonic() - pruned_at >= self.prune_interval:
+                pruned_at = time.monotonic()
+                try:
+                    await self.prune()
+                except Exception as e:
+                    logger.error(f"Ошибка очистки истории тревог: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        return {
+            "polls": self.polls,
+            "notifications": self.notifications,
+            "transitions": self.transitions,
+            "pruned": self.pruned,
+            "active_regions": len(self.seen or ()),
+        }
@@ -0,0 +1,29 @@
+# Накладные расходы метрик: тот же сквозной прогон harness с METRICS_ENABLED
+# выключенным и включённым.
+#
+#   python -m benchmarks.bench_metrics --users 50 --iterations 10
+
+import asyncio
+import logging
+
+from benchmarks.harness import make_parser, run
+
+
+def main():
+    parser = make_parser()
+    parser.set_defaults(memory=False)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    off, _, _ = asyncio.run(run(args, {"METRICS_ENABLED": "False"}))
+    on, _, _ = asyncio.run(run(args, {"METRICS_ENABLED": "True"}))
+
+    print(f"{'сценарий':<10} {'апд/с без':>10} {'апд/с с':>10} {'p50 без':>9} {'p50 с':>9} {'разница':>8}")
+    for name in off:
+        overhead = (off[name]["throughput"] - on[name]["throughput"]) / off[name]["throughput"] * 100
+        print(f"{name:<10} {off[name]['throughput']:>10.0f} {on[name]['throughput']:>10.0f} "
+              f"{off[name]['p50_ms']:>9.2f} {on[name]['p50_ms']:>9.2f} {overhead:>7.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Микро-бенчмарк CRUD планов: старый подход (sqlite3.connect + CREATE TABLE
+# на каждый вызов, прямо в цикле событий) против PlanRepository.
+#
+#   python -m benchmarks.bench_plans --users 50 --ops 20
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from db import Database, PlanRepository, PLANS_SCHEMA
+
+
+CREATE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS plans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        plan TEXT NOT NULL
+    )
+'''
+
+
+class LegacyPlans:
+    # Повторяет то, что раньше делали обработчики в main.py
+    def __init__(self, path):
+        self.path = path
+
+    def _run(self, sql, params, fetch=None):
+        with sqlite3.connect(self.path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(CREATE_TABLE)
+            cursor.execute(sql, params)
+            result = getattr(cursor, fetch)() if fetch else cursor.rowcount
+            conn.commit()
+        return result
+
+    async def add(self, user_id, plan_text):
+        return self._run('INSERT INTO plans (user_id, plan) VALUES (?, ?)', (user_id, plan_text))
+
+    async def get(self, plan_id, user_id):
+        return self._run("SELECT id, plan FROM plans WHERE id = ? AND user_id = ?", (plan_id, user_id), "fetchone")
+
+    async def page(self, user_id):
+        # Старый список планов читал и показывал все планы пользователя разом
+        rows = self._run("SELECT id, plan FROM plans WHERE user_id = ?", (user_id,), "fetchall")
+        return rows, False, False
+
+
+async def user_session(repo, user_id, ops):
+    for i in range(ops):
+        await repo.add(user_id, f"План {i} пользователя {user_id}")
+        await repo.get(i + 1, user_id)
+        await repo.page(user_id)
+
+
+async def measure_loop_lag(stop):
+    # Насколько цикл событий «залипает», пока идут запросы к БД
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - started - 0.001)
+    return worst
+
+
+async def run_scenario(repo, users, ops):
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(repo, user_id, ops) for user_id in range(users)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    worst_lag = await lag_task
+    return users * ops * 3 / elapsed, worst_lag
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--ops", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = LegacyPlans(os.path.join(tmp, "legacy.db"))
+        rps, lag = await run_scenario(legacy, args.users, args.ops)
+        print(f"до    (sqlite3.connect на вызов): {rps:9.0f} запросов/с, макс. задержка цикла {lag * 1000:7.1f} мс")
+
+        db = Database(os.path.join(tmp, "repo.db"))
+        await db.connect(PLANS_SCHEMA)
+        rps, lag = await run_scenario(PlanRepository(db), args.users, args.ops)
+        await db.close()
+        print(f"после (PlanRepository, WAL):       {rps:9.0f} запросов/с, макс. задержка цикла {lag * 1000:7.1f} мс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
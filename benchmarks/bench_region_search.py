@@ -0,0 +1,61 @@
+# Задержка inline-поиска регионов: префиксное дерево и нечёткий обход
+# против линейного перебора каталога. Каталог — как у заглушки ukrainealarm.
+#
+#   python -m benchmarks.bench_region_search --queries 2000
+
+import argparse
+import random
+import time
+
+from benchmarks.stubs import build_regions
+from region_search import RegionIndex, normalize_name
+from regions import RegionCatalog
+
+
+def linear_search(regions, text, limit):
+    query = normalize_name(text)
+    return [region for region in regions if query in normalize_name(region.name)][:limit]
+
+
+def typo(text, rnd):
+    i = rnd.randrange(len(text))
+    return text[:i] + text[i + 1:]
+
+
+def measure(fn, queries):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rnd = random.Random(args.seed)
+
+    _, by_id = RegionCatalog.build(build_regions()["states"])
+    regions = list(by_id.values())
+    started = time.perf_counter()
+    index = RegionIndex(regions)
+    print(f"построение индекса по {len(regions)} регионам: {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    names = [rnd.choice(regions).name for _ in range(args.queries)]
+    prefixes = [name[:rnd.randint(3, len(name))] for name in names]
+    typos = [typo(name, rnd) for name in names]
+    print(f"{'запросы':<10} {'способ':<14} {'p50, мс':>9} {'p99, мс':>9}")
+    for label, queries in (("префикс", prefixes), ("опечатка", typos)):
+        for name, fn in (("RegionIndex", lambda q: index.search(q, args.limit)),
+                         ("перебор", lambda q: linear_search(regions, q, args.limit))):
+            p50, p99 = measure(fn, queries)
+            print(f"{label:<10} {name:<14} {p50:>9.3f} {p99:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
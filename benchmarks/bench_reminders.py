@@ -0,0 +1,114 @@
+# Бенчмарк напоминаний: загрузка кучи из таблицы plans при старте,
+# schedule/cancel из обработчиков и срабатывание пачками через take_reminders.
+#
+#   python -m benchmarks.bench_reminders --rows 500000 --pending 300000
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from db import Database, PlanRepository, PLANS_SCHEMA
+from reminders import ReminderScheduler
+
+
+def generate_plans(rows, pending, users, start, horizon, rnd):
+    # Первые pending планов со сроком, равномерно в пределах horizon секунд
+    for index in range(rows):
+        due_at = start + rnd.randrange(1, horizon) if index < pending else None
+        yield rnd.randrange(users), f"План {index}", due_at
+
+
+def fill(conn, plans):
+    conn.executemany("INSERT INTO plans (user_id, plan, due_at) VALUES (?, ?, ?)", plans)
+    conn.commit()
+
+
+def sync_due(conn, due):
+    conn.executemany("UPDATE plans SET due_at = ? WHERE id = ?", [(due_at, plan_id) for plan_id, due_at in due])
+    conn.commit()
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--pending", type=int, default=300_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--ops", type=int, default=200_000, help="операций schedule/cancel")
+    parser.add_argument("--fire", type=int, default=50_000, help="сколько напоминаний сработает разом")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rnd = random.Random(args.seed)
+    start = int(time.time())
+    horizon = 30 * 86400
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "plans.db"))
+        await db.connect(PLANS_SCHEMA)
+        repo = PlanRepository(db)
+        await db.run(fill, generate_plans(args.rows, args.pending, args.users, start, horizon, rnd))
+        started = time.perf_counter()
+        await repo.init_reminders()
+        print(f"индекс по due_at на {args.rows} строк: {time.perf_counter() - started:.2f} с")
+
+        fired = 0
+
+        async def notify(user_id, text):
+            nonlocal fired
+            fired += 1
+
+        clock = Clock(start)
+        scheduler = ReminderScheduler(repo, notify, batch_size=args.batch, clock=clock)
+        tracemalloc.start()
+        started = time.perf_counter()
+        await scheduler.load()
+        elapsed = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"загрузка {len(scheduler._due)} напоминаний: {elapsed:.2f} с, "
+              f"память {memory / len(scheduler._due):.0f} Б на напоминание")
+
+        # Правки из обработчиков: перенос срока, отмена и новое напоминание
+        plan_ids = list(scheduler._due)
+        started = time.perf_counter()
+        for _ in range(args.ops):
+            plan_id = rnd.choice(plan_ids)
+            if rnd.random() < 0.7:
+                scheduler.schedule(plan_id, start + rnd.randrange(1, horizon))
+            else:
+                scheduler.cancel(plan_id)
+        elapsed = time.perf_counter() - started
+        stats = scheduler.stats()
+        print(f"schedule/cancel: {args.ops / elapsed:,.0f} операций/с, куча {stats['heap_size']} "
+              f"при {stats['pending']} живых, пересборок {stats['compactions']}")
+
+        # Срабатывание: часы переводятся так, чтобы наступил срок fire напоминаний.
+        # Сроки в БД синхронизируются с кучей, иначе take_reminders их отбросит.
+        due = sorted(scheduler._due.items(), key=lambda item: item[1])[:args.fire]
+        await db.run(sync_due, due)
+        clock.now = due[-1][1]
+        task = asyncio.create_task(scheduler.run_forever())
+        started = time.perf_counter()
+        while fired < len(due):
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - started
+        task.cancel()
+        print(f"срабатывание {len(due)} напоминаний пачками по {args.batch}: {len(due) / elapsed:,.0f} в секунду, "
+              f"пропущено {scheduler.missed}")
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+# Стоимость маршрутизации одного апдейта в зависимости от числа кнопок меню:
+# цепочка фильтров `lambda message: message.text == "..."` против TextRouter.
+#
+#   python -m benchmarks.bench_router --updates 3000
+
+import argparse
+import asyncio
+import datetime
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message, Update, User
+
+from router import TextRouter
+
+TOKEN = "123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+
+
+class SilentSession(BaseSession):
+    # Обработчики в бенчмарке ничего не отправляют, но Bot требует сессию
+    async def make_request(self, bot, method, timeout=None):
+        raise RuntimeError("бенчмарк не ходит в Bot API")
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+async def noop(message):
+    return None
+
+
+def linear_dispatcher(texts):
+    dp = Dispatcher()
+    for text in texts:
+        dp.message.register(noop, lambda message, text=text: message.text == text)
+    return dp
+
+
+def hashed_dispatcher(texts):
+    dp = Dispatcher()
+    menu = TextRouter()
+    for text in texts:
+        menu.button(text)(noop)
+    menu.register(dp.message)
+    return dp
+
+
+def make_update(update_id, text):
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime.datetime.now(), text=text,
+        chat=Chat(id=1, type="private"), from_user=User(id=1, is_bot=False, first_name="bench"),
+    ))
+
+
+async def measure(dp, bot, updates):
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / len(updates)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--sizes", default="5,20,100,500")
+    args = parser.parse_args()
+
+    bot = Bot(TOKEN, session=SilentSession())
+    print(f"{'кнопок':>7} {'линейно, мкс':>14} {'TextRouter, мкс':>16}")
+    for size in map(int, args.sizes.split(",")):
+        texts = [f"Кнопка {i}" for i in range(size)]
+        # Худший случай для цепочки фильтров — последняя кнопка
+        updates = [make_update(i, texts[-1]) for i in range(args.updates)]
+        linear = await measure(linear_dispatcher(texts), bot, updates)
+        hashed = await measure(hashed_dispatcher(texts), bot, updates)
+        print(f"{size:>7} {linear * 1e6:>14.1f} {hashed * 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+    asyncio.run(main())
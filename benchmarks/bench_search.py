@@ -0,0 +1,104 @@
+# Бенчмарк поиска по планам: FTS5 (PlanRepository.search) против LIKE '%...%'
+# на большой таблице. Текст планов — слова из словаря с распределением Ципфа,
+# запросы берутся из частых, средних и редких слов.
+#
+#   python -m benchmarks.bench_search --rows 1000000 --users 1000
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from db import Database, PlanRepository, PLANS_SCHEMA
+
+SYLLABLES = ["ка", "ро", "ми", "ту", "ле", "но", "ва", "си", "да", "пе", "го", "ры"]
+
+
+def build_vocabulary(size, rnd):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))))
+    return sorted(words, key=lambda _: rnd.random())
+
+
+def generate_plans(rows, users, vocabulary, rnd):
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    for _ in range(rows):
+        words = rnd.choices(vocabulary, cum_weights=weights, k=rnd.randint(3, 10))
+        yield rnd.randrange(users), ", ".join(words)
+
+
+def fill(conn, plans):
+    conn.executemany("INSERT INTO plans (user_id, plan) VALUES (?, ?)", plans)
+    conn.commit()
+
+
+async def measure(fn, queries):
+    latencies = []
+    for args in queries:
+        started = time.perf_counter()
+        await fn(*args)
+        latencies.append(time.perf_counter() - started)
+    return statistics.median(latencies) * 1000, max(latencies) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=30, help="запросов на каждую группу слов")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rnd = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "plans.db"))
+        await db.connect(PLANS_SCHEMA)
+        repo = PlanRepository(db)
+        vocabulary = build_vocabulary(args.vocabulary, rnd)
+
+        started = time.perf_counter()
+        await db.run(fill, generate_plans(args.rows, args.users, vocabulary, rnd))
+        print(f"заполнение {args.rows} строк: {time.perf_counter() - started:.1f} с")
+        started = time.perf_counter()
+        await repo.init_search()
+        print(f"построение FTS-индекса: {time.perf_counter() - started:.1f} с")
+        if not repo.fts:
+            print("FTS5 недоступен в этой сборке SQLite")
+            await db.close()
+            return
+
+        async def like_user(user_id, word):
+            return await db.fetchall("SELECT id, plan FROM plans WHERE user_id = ? AND plan LIKE ? ORDER BY id LIMIT ?",
+                                     (user_id, f"%{word}%", args.limit))
+
+        async def like_all(user_id, word):
+            return await db.fetchall("SELECT id, plan FROM plans WHERE plan LIKE ? LIMIT ?",
+                                     (f"%{word}%", args.limit))
+
+        async def fts(user_id, word):
+            return await repo.search(user_id, word, limit=args.limit)
+
+        groups = {
+            "частые": vocabulary[:10],
+            "средние": vocabulary[100:1000],
+            "редкие": vocabulary[-1000:],
+        }
+        print(f"{'слова':<9} {'способ':<22} {'p50, мс':>9} {'макс, мс':>9}")
+        for group, words in groups.items():
+            queries = [(rnd.randrange(args.users), rnd.choice(words)) for _ in range(args.queries)]
+            for name, fn in (("FTS5, пользователь", fts), ("LIKE, пользователь", like_user),
+                             ("LIKE, вся таблица", like_all)):
+                p50, worst = await measure(fn, queries)
+                print(f"{group:<9} {name:<22} {p50:>9.2f} {worst:>9.2f}")
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
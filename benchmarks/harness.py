@@ -0,0 +1,304 @@
+# Офлайн нагрузочный бенчмарк бота: синтетические Update прогоняются через
+# dp.feed_update для каждого сценария (погода, CRUD планов, мастер GitHub,
+# мастер регионов). Bot API подменён FakeSession, внешние API — локальными
+# aiohttp-заглушками с настраиваемой задержкой и долей ошибок.
+#
+#   python -m benchmarks.harness --users 50 --iterations 10 --api-latency 0.02
+#   python -m benchmarks.harness --scenarios weather,plans --json bench.json
+#
+# С --workers 1,2,4 бот запускается воркерами в отдельных процессах за
+# ShardedIngress (как при WORKERS > 0), а Bot API отвечает заглушка.
+
+import argparse
+import asyncio
+import datetime
+import importlib
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from aiogram.types import Chat, Message, Update, User
+
+from benchmarks.stubs import FakeSession, StubApis
+from db import Database, PlanRepository
+from workers import ShardedIngress, make_workers
+
+TOKEN = "123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CITIES = [f"Город {chr(0x0410 + i // 8)}{chr(0x0430 + i % 8)}" for i in range(40)]
+REPOS = [("owner", f"repo{i}") for i in range(30)]
+
+
+def bot_env(base_url, env=None):
+    return {
+        "TOKEN": TOKEN, "WEATHER_TOKEN": "bench", "GITHUB_TOKEN": "bench", "ALARM_API_TOKEN": "bench",
+        "WEATHER_API_URL": base_url, "GITHUB_API_URL": base_url, "ALARM_API_URL": base_url,
+        "HTTP_STATS_INTERVAL": "0", "METRICS_PORT": "0",
+        # Синтетические пользователи шлют апдейты без пауз, лимиты исказили бы замер
+        "THROTTLE_ENABLED": "False",
+        **(env or {}),
+    }
+
+
+def load_bot(base_url, workdir, env=None):
+    # main.py читает настройки при импорте, поэтому окружение задаётся до него
+    os.environ.update(bot_env(base_url, env))
+    # Бот работает во временном каталоге, чтобы не трогать боевые БД
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    if "main" in sys.modules:
+        return importlib.reload(sys.modules["main"])
+    return importlib.import_module("main")
+
+
+def make_update(update_id, user_id, text):
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime.datetime.now(), text=text,
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="bench"),
+    ))
+
+
+class Client:
+    # Отправляет апдейты от имени пользователей и меряет время обработки
+    def __init__(self, bot_module, bot):
+        self.bot_module = bot_module
+        self.dp = bot_module.dp
+        self.bot = bot
+        self.plans_repo = self.dp["plans_repo"]
+        self.ids = itertools.count(1)
+        self.latencies = []
+
+    async def send(self, user_id, text):
+        update = make_update(next(self.ids), user_id, text)
+        started = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        self.latencies.append(time.perf_counter() - started)
+
+
+class ShardedClient:
+    # Те же апдейты, но через ShardedIngress: ответ воркера приходит после
+    # обработки, так что задержка включает пересылку между процессами
+    def __init__(self, ingress, plans_repo):
+        self.ingress = ingress
+        self.plans_repo = plans_repo
+        self.ids = itertools.count(1)
+        self.latencies = []
+
+    async def send(self, user_id, text):
+        update = make_update(next(self.ids), user_id, text).model_dump(mode="json", by_alias=True, exclude_none=True)
+        started = time.perf_counter()
+        await self.ingress.forward(update)
+        self.latencies.append(time.perf_counter() - started)
+
+
+# --- СЦЕНАРИИ ---
+async def weather_session(client, user_id, iterations, rnd):
+    for _ in range(iterations):
+        await client.send(user_id, "🌦 Прогноз погоды")
+        await client.send(user_id, rnd.choice(CITIES))
+
+
+async def plans_session(client, user_id, iterations, rnd):
+    plans_repo = client.plans_repo
+    for i in range(iterations):
+        await client.send(user_id, "📅 Планы")
+        await client.send(user_id, "➕Добавить план")
+        await client.send(user_id, f"План {i}: купить, позвонить, написать")
+        await client.send(user_id, "📋Список планов")
+        # Страница перед максимальным rowid SQLite — последний план пользователя
+        plans, _, _ = await plans_repo.page(user_id, before_id=2**63 - 1, limit=1)
+        plan_id = plans[-1][0]
+        await client.send(user_id, "✏️Изменить план")
+        await client.send(user_id, str(plan_id))
+        await client.send(user_id, f"План {i}: обновлён")
+        if i % 2:
+            await client.send(user_id, "🗑️Удалить план")
+            await client.send(user_id, str(plan_id))
+
+
+async def github_session(client, user_id, iterations, rnd):
+    for _ in range(iterations):
+        owner, repo = rnd.choice(REPOS)
+        await client.send(user_id, "🐙 GitHub Коммиты")
+        await client.send(user_id, owner)
+        await client.send(user_id, repo)
+
+
+async def regions_session(client, user_id, iterations, rnd):
+    states = client.stubs.regions["states"]
+    await client.send(user_id, "🚨 Уведомления о тревогах")
+    for i in range(iterations):
+        if i:
+            await client.send(user_id, "✏️ Изменить регион")
+        oblast = rnd.choice(states)
+        district = rnd.choice(oblast["regionChildIds"])
+        community = rnd.choice(district["regionChildIds"])
+        await client.send(user_id, oblast["regionName"])
+        await client.send(user_id, district["regionName"])
+        await client.send(user_id, community["regionName"])
+        await client.send(user_id, "🔔 Проверить сейчас")
+
+
+SCENARIOS = {
+    "weather": weather_session,
+    "plans": plans_session,
+    "github": github_session,
+    "regions": regions_session,
+}
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def run_scenario(client, session, users, iterations, seed, user_offset):
+    client.latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        session(client, user_offset + user, iterations, random.Random(seed + user)) for user in range(users)
+    ))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(client.latencies)
+    return {
+        "updates": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run_scenarios(client, args):
+    results = {}
+    offsets = itertools.count(0, 1_000_000)
+    for name in args.scenarios.split(","):
+        session_fn = SCENARIOS[name]
+        result = await run_scenario(client, session_fn, args.users, args.iterations, args.seed, next(offsets))
+        if args.memory:
+            tracemalloc.start()
+            await run_scenario(client, session_fn, args.users, args.iterations, args.seed, next(offsets))
+            result["peak_mem_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+        results[name] = result
+    return results
+
+
+async def run(args, env=None):
+    stubs = StubApis(latency=args.api_latency, jitter=args.api_jitter, error_rate=args.error_rate)
+    base_url = await stubs.start()
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    cwd = os.getcwd()
+    bot_module = load_bot(base_url, workdir, env)
+    dp = bot_module.dp
+    session = FakeSession(latency=args.telegram_latency)
+    bot = bot_module.Bot(TOKEN, session=session)
+    await dp.emit_startup(bot=bot, dispatcher=dp, bots=[bot])
+    client = Client(bot_module, bot)
+    client.stubs = stubs
+
+    try:
+        results = await run_scenarios(client, args)
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, bots=[bot])
+        await stubs.close()
+        os.chdir(cwd)
+    return results, stubs, session
+
+
+async def run_sharded(args, workers, env=None):
+    stubs = StubApis(latency=args.api_latency, jitter=args.api_jitter, error_rate=args.error_rate,
+                     telegram_latency=args.telegram_latency)
+    base_url = await stubs.start()
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    cwd = os.getcwd()
+    # Воркеры наследуют рабочий каталог, там же лежат их БД
+    os.chdir(workdir)
+    secret = "bench"
+    ingress = ShardedIngress(make_workers(workers, args.worker_port, secret, os.path.join(ROOT, "main.py"),
+                                          bot_env(base_url, {"TELEGRAM_API_URL": base_url, "LOG_LEVEL": "WARNING",
+                                                            **(env or {})})), secret)
+    plans_db = None
+    try:
+        await ingress.start()
+        plans_db = Database(os.path.join(workdir, "plans.db"))
+        await plans_db.connect()
+        client = ShardedClient(ingress, PlanRepository(plans_db))
+        client.stubs = stubs
+        args.memory = False
+        results = await run_scenarios(client, args)
+    finally:
+        await ingress.close()
+        if plans_db is not None:
+            await plans_db.close()
+        await stubs.close()
+        os.chdir(cwd)
+    return results, stubs, ingress
+
+
+def print_results(results):
+    print(f"{'сценарий':<10} {'апдейтов':>9} {'апд/с':>9} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'пик, КБ':>9}")
+    for name, r in results.items():
+        peak = f"{r['peak_mem_kb']:9.0f}" if "peak_mem_kb" in r else f"{'-':>9}"
+        print(f"{name:<10} {r['updates']:>9} {r['throughput']:>9.0f} {r['p50_ms']:>9.2f} "
+              f"{r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {peak}")
+
+
+def make_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка заглушек API, с")
+    parser.add_argument("--api-jitter", type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500 от заглушек")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="задержка фейкового Bot API, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="не делать второй прогон под tracemalloc для пиковой памяти")
+    parser.add_argument("--workers", help="через запятую: число процессов-воркеров для каждого прогона")
+    parser.add_argument("--worker-port", type=int, default=18100, help="порт первого воркера")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    return parser
+
+
+def print_scaling(by_workers):
+    counts = list(by_workers)
+    print(f"{'сценарий':<10} " + " ".join(f"{f'апд/с ×{n}':>14}" for n in counts))
+    for name in next(iter(by_workers.values())):
+        print(f"{name:<10} " + " ".join(f"{by_workers[n][name]['throughput']:>14.0f}" for n in counts))
+
+
+def main():
+    args = make_parser().parse_args()
+    # Лог каждого апдейта в aiogram заметно искажает замеры
+    logging.disable(logging.INFO)
+    if args.workers:
+        by_workers = {}
+        for count in map(int, args.workers.split(",")):
+            results, stubs, ingress = asyncio.run(run_sharded(args, count))
+            print(f"воркеров: {count}, переслано: {ingress.stats()['forwarded']}, "
+                  f"вызовов Bot API: {sum(stubs.telegram_calls.values())}")
+            print_results(results)
+            by_workers[count] = results
+        print_scaling(by_workers)
+        results = by_workers
+    else:
+        results, stubs, session = asyncio.run(run(args))
+        print_results(results)
+        print(f"запросов к заглушкам API: {stubs.requests}")
+        print(f"вызовов Bot API: {session.calls}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
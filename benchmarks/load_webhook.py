@@ -0,0 +1,67 @@
+# Нагрузочный тест webhook-режима: шлёт синтетические апдейты POST-запросами
+# на запущенный бот (BOT_MODE=webhook) и меряет, как быстро он отвечает 200.
+#
+#   python -m benchmarks.load_webhook --url http://127.0.0.1:8080/webhook --secret ... --updates 5000
+#
+# Ответы бота уходят в Telegram API, поэтому для чистого замера запускайте
+# бот с тестовым токеном или заглушкой Bot API.
+
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+TEXTS = ["/start", "📅 Планы", "📋Список планов", "🔙Назад"]
+
+
+def make_update(update_id, user_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "load"},
+            "text": text,
+        },
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    latencies = []
+    statuses = {}
+    counter = iter(range(1, args.updates + 1))
+
+    async def worker(session):
+        for update_id in counter:
+            update = make_update(update_id, 1000 + update_id % args.users, TEXTS[update_id % len(TEXTS)])
+            started = time.perf_counter()
+            async with session.post(args.url, json=update, headers=headers) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"апдейтов: {len(latencies)}, статусы: {statuses}")
+    print(f"пропускная способность: {len(latencies) / elapsed:.0f} апдейтов/с")
+    for p in (0.5, 0.95, 0.99):
+        print(f"p{int(p * 100)}: {latencies[int(len(latencies) * p) - 1] * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
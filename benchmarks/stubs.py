@@ -0,0 +1,180 @@
+# Локальные заглушки внешних API и Telegram для бенчмарков.
+# Заглушки отвечают в формате weatherapi.com, api.github.com и
+# api.ukrainealarm.com с настраиваемой задержкой и долей ошибок.
+
+import asyncio
+import datetime
+import itertools
+import random
+
+from aiohttp import web
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message
+
+
+def build_regions(oblasts=25, districts=8, communities=10):
+    states = []
+    for o in range(oblasts):
+        oblast = {"regionId": str(o + 1), "regionName": f"Область {o + 1}", "regionType": "State", "regionChildIds": []}
+        for d in range(districts):
+            district_id = f"{o + 1}{d:02d}"
+            district = {"regionId": district_id, "regionName": f"Район {o + 1}-{d + 1}", "regionType": "District",
+                        "regionChildIds": []}
+            for c in range(communities):
+                district["regionChildIds"].append({
+                    "regionId": f"{district_id}{c:02d}",
+                    "regionName": f"Громада {o + 1}-{d + 1}-{c + 1}",
+                    "regionType": "Community",
+                    "regionChildIds": [],
+                })
+            oblast["regionChildIds"].append(district)
+        states.append(oblast)
+    return {"states": states}
+
+
+def build_forecast(city):
+    day = {"maxtemp_c": 21.0, "mintemp_c": 12.0, "condition": {"text": "Partly cloudy"}}
+    return {
+        "location": {"name": city},
+        "current": {"temp_c": 17.0, "condition": {"text": "Sunny"}, "wind_kph": 11.2, "humidity": 54},
+        "forecast": {"forecastday": [
+            {"date": (datetime.date.today() + datetime.timedelta(days=i)).isoformat(), "day": day} for i in range(3)
+        ]},
+    }
+
+
+def build_commits(owner, repo, count):
+    date = datetime.datetime(2025, 1, 1).isoformat() + "Z"
+    return [{"sha": f"{i:040x}", "commit": {"author": {"name": f"{owner} dev {i}"},
+                                               "committer": {"date": date},
+                                               "message": f"Commit {i} in {repo}"}} for i in range(count)]
+
+
+# --- ЗАГЛУШКИ API ---
+class StubApis:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=1, telegram_latency=0.0):
+        self.latency = latency
+        self.telegram_latency = telegram_latency
+        self.telegram_calls = {}
+        self._message_ids = itertools.count(1)
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.regions = build_regions()
+        self.alerts = []
+        # Растёт при каждой смене alerts, как lastActionIndex у настоящего API
+        self.alert_index = 1
+        self.requests = {}
+        self._runner = None
+        self.base_url = None
+
+    @web.middleware
+    async def _conditions(self, request, handler):
+        name = request.match_info.route.name or request.path
+        if name == "telegram":
+            # Bot API живёт по своим правилам: только telegram_latency, без ошибок
+            return await handler(request)
+        self.requests[name] = self.requests.get(name, 0) + 1
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return web.json_response({"error": "stub failure"}, status=500)
+        return await handler(request)
+
+    async def weather(self, request):
+        city = request.query.get("q", "")
+        if not city:
+            return web.json_response({"error": {"message": "q missing"}}, status=400)
+        return web.json_response(build_forecast(city))
+
+    async def commits(self, request):
+        per_page = int(request.query.get("per_page", 30))
+        etag = f'"{request.match_info["owner"]}-{request.match_info["repo"]}"'
+        headers = {"ETag": etag, "X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "4999"}
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        commits = build_commits(request.match_info["owner"], request.match_info["repo"], per_page)
+        return web.json_response(commits, headers=headers)
+
+    async def regions_handler(self, request):
+        return web.json_response(self.regions)
+
+    async def alerts_handler(self, request):
+        return web.json_response(self.alerts)
+
+    async def alerts_status(self, request):
+        return web.json_response({"lastActionIndex": self.alert_index})
+
+    def set_alerts(self, alerts):
+        self.alerts = alerts
+        self.alert_index += 1
+
+    async def telegram(self, request):
+        # Bot API для воркеров в отдельных процессах, где FakeSession не подставить
+        method = request.match_info["method"].lower()
+        self.telegram_calls[method] = self.telegram_calls.get(method, 0) + 1
+        if self.telegram_latency:
+            await asyncio.sleep(self.telegram_latency)
+        form = await request.post()
+        if method in ("sendmessage", "senddocument", "editmessagetext"):
+            chat_id = int(form.get("chat_id") or 0)
+            result = {"message_id": next(self._message_ids), "date": int(datetime.datetime.now().timestamp()),
+                      "chat": {"id": chat_id, "type": "private"}, "text": form.get("text", "")}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def make_app(self):
+        app = web.Application(middlewares=[self._conditions])
+        app.router.add_get("/v1/forecast.json", self.weather, name="weather")
+        app.router.add_get("/repos/{owner}/{repo}/commits", self.commits, name="github")
+        app.router.add_get("/api/v3/regions", self.regions_handler, name="regions")
+        app.router.add_get("/api/v3/alerts", self.alerts_handler, name="alerts")
+        app.router.add_get("/api/v3/alerts/status", self.alerts_status, name="alerts_status")
+        app.router.add_post("/bot{token}/{method}", self.telegram, name="telegram")
+        return app
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+# --- ЗАГЛУШКА TELEGRAM ---
+class FakeSession(BaseSession):
+    # Сессия бота, которая не ходит в сеть: считает вызовы Bot API и
+    # отвечает правдоподобными объектами с настраиваемой задержкой.
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = {}
+        self.sent = []
+        self.keep_sent = False
+
+    async def make_request(self, bot, method, timeout=None):
+        name = type(method).__name__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, SendMessage):
+            if self.keep_sent:
+                self.sent.append((method.chat_id, method.text))
+            return Message(message_id=self.calls[name], date=datetime.datetime.now(),
+                           chat=Chat(id=method.chat_id, type="private"), text=method.text)
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
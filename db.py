@@ -0,0 +1,482 @@
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=256)
+def statement_label(sql):
+    return " ".join(sql.split())[:120]
+
+
+# --- ПОДКЛЮЧЕНИЕ ---
+class Database:
+    # Одно долгоживущее соединение в режиме WAL. Все запросы выполняются
+    # в отдельном потоке, чтобы не блокировать цикл событий aiogram.
+    def __init__(self, path, metrics=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.metrics = metrics
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sqlite-{path}")
+        self._conn = None
+
+    async def connect(self, schema=""):
+        await self._submit(self._open, schema)
+
+    def _open(self, schema):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        if schema:
+            conn.executescript(schema)
+        conn.commit()
+        self._conn = conn
+
+    async def close(self):
+        if self._conn is not None:
+            await self._submit(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def _submit(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def _timed(self, statement, fn, *args):
+        if self.metrics is None:
+            return await self._submit(fn, *args)
+        started = time.perf_counter()
+        try:
+            return await self._submit(fn, *args)
+        finally:
+            # Время считаем вместе с ожиданием в очереди потока БД
+            self.metrics.sqlite.observe((self.name, statement_label(statement)), time.perf_counter() - started)
+
+    async def run(self, fn, *args):
+        # Выполняет fn(conn, *args) в потоке БД. Для нескольких запросов,
+        # которые должны пройти одной транзакцией.
+        return await self._timed(fn.__name__, fn, self._conn, *args)
+
+    def _execute(self, sql, params):
+        cursor = self._conn.execute(sql, params)
+        self._conn.commit()
+        return cursor.rowcount, cursor.lastrowid
+
+    async def execute(self, sql, params=()):
+        return await self._timed(sql, self._execute, sql, params)
+
+    async def fetchone(self, sql, params=()):
+        return await self._timed(sql, lambda: self._conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self._timed(sql, lambda: self._conn.execute(sql, params).fetchall())
+
+
+# --- ПЛАНЫ ---
+PLANS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS plans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        plan TEXT NOT NULL,
+        due_at INTEGER
+    );
+    DROP INDEX IF EXISTS idx_plans_user_id;
+    CREATE INDEX IF NOT EXISTS idx_plans_user_id_id ON plans (user_id, id);
+'''
+
+# Срок напоминания — unix-секунды. Частичный индекс содержит только планы
+# с напоминанием и покрывает загрузку планировщика при старте.
+PLANS_DUE_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_plans_due_at ON plans (due_at, user_id) WHERE due_at IS NOT NULL;
+'''
+
+# Полнотекстовый индекс по плану. user_id тоже индексируется, чтобы фильтр
+# по владельцу выполнялся внутри FTS, а не после поиска по всем пользователям.
+PLANS_FTS_SCHEMA = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS plans_fts USING fts5(
+        plan, user_id,
+        content='plans', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', detail='column'
+    );
+    CREATE TRIGGER IF NOT EXISTS plans_fts_insert AFTER INSERT ON plans BEGIN
+        INSERT INTO plans_fts (rowid, plan, user_id) VALUES (new.id, new.plan, new.user_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS plans_fts_delete AFTER DELETE ON plans BEGIN
+        INSERT INTO plans_fts (plans_fts, rowid, plan, user_id) VALUES ('delete', old.id, old.plan, old.user_id);
+    END;
+    DROP TRIGGER IF EXISTS plans_fts_update;
+    {update_trigger}
+    -- Заполняется из существующих планов только только что созданный индекс
+    INSERT INTO plans_fts (plans_fts) SELECT 'rebuild' WHERE NOT EXISTS (SELECT 1 FROM plans_fts_docsize);
+'''
+
+# Только по изменению текста или владельца: смена due_at индекс не трогает.
+# Пересоздаётся при каждом старте, чтобы обновить его в старых базах.
+PLANS_FTS_UPDATE_TRIGGER = '''
+    CREATE TRIGGER plans_fts_update AFTER UPDATE OF plan, user_id ON plans BEGIN
+        INSERT INTO plans_fts (plans_fts, rowid, plan, user_id) VALUES ('delete', old.id, old.plan, old.user_id);
+        INSERT INTO plans_fts (rowid, plan, user_id) VALUES (new.id, new.plan, new.user_id);
+    END;
+'''
+PLANS_FTS_SCHEMA = PLANS_FTS_SCHEMA.format(update_trigger=PLANS_FTS_UPDATE_TRIGGER)
+
+SEARCH_MAX_TERMS = 8
+
+
+def fts_query(user_id, text):
+    # Слова запроса объединяются через AND; слово со звёздочкой на конце ищется
+    # как префикс. Слова режутся как в unicode61 — только буквы и цифры, «_»
+    # разделитель, — иначе «foo_bar» в кавычках стал бы фразой, которую индекс
+    # с detail='column' не поддерживает. Кавычки исключают синтаксис FTS5 из ввода.
+    words = re.findall(r"([^\W_]+)(\*?)", text.lower())[:SEARCH_MAX_TERMS]
+    if not words:
+        return None
+    terms = " AND ".join(f'"{word}"{star}' for word, star in words)
+    return f'user_id:"{user_id}" AND plan:({terms})'
+
+
+class PlanRepository:
+    def __init__(self, db):
+        self.db = db
+        self.fts = False
+
+    async def init_search(self):
+        # Индекс создаётся один раз и заполняется из существующих планов;
+        # дальше его поддерживают триггеры. Без FTS5 поиск идёт через LIKE.
+        # BEGIN IMMEDIATE и IF NOT EXISTS: воркеры стартуют одновременно.
+        def create_plans_fts(conn):
+            try:
+                conn.executescript(f"BEGIN IMMEDIATE; {PLANS_FTS_SCHEMA} COMMIT;")
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                if "no such module: fts5" not in str(e):
+                    raise
+                logger.warning(f"FTS5 недоступен, поиск планов будет через LIKE: {e}")
+                return False
+            return True
+
+        self.fts = await self.db.run(create_plans_fts)
+
+    async def init_reminders(self):
+        # Колонка due_at добавляется в таблицы, созданные до напоминаний.
+        # Проверка и ALTER под одной блокировкой: воркеры стартуют одновременно.
+        def add_plans_due_at(conn):
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(plans)")}
+                if "due_at" not in columns:
+                    conn.execute("ALTER TABLE plans ADD COLUMN due_at INTEGER")
+                conn.execute(PLANS_DUE_INDEX)
+
+        await self.db.run(add_plans_due_at)
+
+    async def add(self, user_id, plan_text, due_at=None):
+        _, plan_id = await self.db.execute('INSERT INTO plans (user_id, plan, due_at) VALUES (?, ?, ?)',
+                                           (user_id, plan_text, due_at))
+        return plan_id
+
+    async def add_many(self, user_id, plan_texts):
+        def add_plans(conn, user_id, plan_texts):
+            with conn:
+                conn.executemany('INSERT INTO plans (user_id, plan) VALUES (?, ?)',
+                                 ((user_id, plan_text) for plan_text in plan_texts))
+
+        await self.db.run(add_plans, user_id, plan_texts)
+
+    async def get(self, plan_id, user_id):
+        # (id, plan, due_at) или None
+        return await self.db.fetchone("SELECT id, plan, due_at FROM plans WHERE id = ? AND user_id = ?",
+                                      (plan_id, user_id))
+
+    async def update(self, plan_id, user_id, plan_text):
+        rowcount, _ = await self.db.execute("UPDATE plans SET plan = ? WHERE id = ? AND user_id = ?",
+                                            (plan_text, plan_id, user_id))
+        return rowcount
+
+    async def set_due(self, plan_id, user_id, due_at):
+        # 0, если плана нет или срок уже такой
+        rowcount, _ = await self.db.execute(
+            "UPDATE plans SET due_at = ? WHERE id = ? AND user_id = ? AND due_at IS NOT ?",
+            (due_at, plan_id, user_id, due_at))
+        return rowcount
+
+    async def reminders(self):
+        # [(id, user_id, due_at)] всех планов с напоминанием — по частичному индексу
+        return await self.db.fetchall("SELECT id, user_id, due_at FROM plans WHERE due_at IS NOT NULL")
+
+    async def take_reminders(self, items):
+        # items: [(id, due_at)]. Снимает напоминания, срок которых в БД совпал,
+        # и возвращает для них [(id, user_id, plan)].
+        def take_plan_reminders(conn, items):
+            taken = []
+            with conn:
+                for plan_id, due_at in items:
+                    row = conn.execute("SELECT id, user_id, plan FROM plans WHERE id = ? AND due_at = ?",
+                                       (plan_id, due_at)).fetchone()
+                    if row:
+                        taken.append(row)
+                conn.executemany("UPDATE plans SET due_at = NULL WHERE id = ?", [(row[0],) for row in taken])
+            return taken
+
+        return await self.db.run(take_plan_reminders, items)
+
+    async def delete(self, plan_id, user_id):
+        rowcount, _ = await self.db.execute("DELETE FROM plans WHERE id = ? AND user_id = ?", (plan_id, user_id))
+        return rowcount
+
+    async def page(self, user_id, after_id=0, before_id=0, limit=10):
+        # Keyset-пагинация по индексу (user_id, id): стоимость страницы не зависит
+        # от её номера и общего числа планов. Возвращает (rows, has_prev, has_next),
+        # строки — (id, plan, due_at).
+        def plans_page(conn, user_id, after_id, before_id, limit):
+            if before_id:
+                rows = conn.execute("SELECT id, plan, due_at FROM plans WHERE user_id = ? AND id < ? "
+                                    "ORDER BY id DESC LIMIT ?", (user_id, before_id, limit + 1)).fetchall()
+                has_prev = len(rows) > limit
+                rows = rows[:limit][::-1]
+            else:
+                rows = conn.execute("SELECT id, plan, due_at FROM plans WHERE user_id = ? AND id > ? "
+                                    "ORDER BY id LIMIT ?", (user_id, after_id, limit + 1)).fetchall()
+                has_next = len(rows) > limit
+                rows = rows[:limit]
+            if rows:
+                exists = "SELECT EXISTS (SELECT 1 FROM plans WHERE user_id = ? AND id {} ?)"
+                if before_id:
+                    has_next = bool(conn.execute(exists.format(">"), (user_id, rows[-1][0])).fetchone()[0])
+                else:
+                    has_prev = bool(conn.execute(exists.format("<"), (user_id, rows[0][0])).fetchone()[0])
+                return rows, has_prev, has_next
+            return rows, False, False
+
+        return await self.db.run(plans_page, user_id, after_id, before_id, limit)
+
+    async def search(self, user_id, text, limit=10):
+        # Лучшие совпадения по bm25; вес колонки user_id нулевой
+        if not self.fts:
+            return await self.search_like(user_id, text, limit)
+        query = fts_query(user_id, text)
+        if query is None:
+            return []
+        try:
+            return await self.db.fetchall(
+                "SELECT plans.id, plans.plan, plans.due_at FROM plans_fts JOIN plans ON plans.id = plans_fts.rowid "
+                "WHERE plans_fts MATCH ? ORDER BY bm25(plans_fts, 1.0, 0.0) LIMIT ?",
+                (query, limit))
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS-запрос {query!r} не выполнен, ищем через LIKE: {e}")
+            return await self.search_like(user_id, text, limit)
+
+    async def search_like(self, user_id, text, limit=10):
+        pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return await self.db.fetchall(
+            "SELECT id, plan, due_at FROM plans WHERE user_id = ? AND plan LIKE ? ESCAPE '\\' ORDER BY id LIMIT ?",
+            (user_id, pattern, limit))
+
+
+# --- ПОЛЬЗОВАТЕЛИ ---
+USERS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        region_id TEXT,
+        reg_id INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_users_reg_id ON users (reg_id);
+"""
+
+
+class UserRepository:
+    def __init__(self, db):
+        self.db = db
+
+    async def get_region(self, user_id):
+        # (region_id, reg_id) или None, если регион не выбран
+        row = await self.db.fetchone("SELECT region_id, reg_id FROM users WHERE user_id = ?", (user_id,))
+        return row if row and row[1] is not None else None
+
+    async def set_region(self, user_id, region_name, reg_id):
+        await self.db.execute("INSERT OR REPLACE INTO users (user_id, region_id, reg_id) VALUES (?, ?, ?)",
+                              (user_id, region_name, reg_id))
+
+    async def reset_region(self, user_id):
+        await self.db.execute("UPDATE users SET region_id = NULL, reg_id = NULL WHERE user_id = ?", (user_id,))
+
+    async def subscribers(self, reg_id):
+        rows = await self.db.fetchall("SELECT user_id FROM users WHERE reg_id = ?", (reg_id,))
+        return [row[0] for row in rows]
+
+
+# --- ПОДПИСКИ НА ПОГОДУ ---
+# send_at — время рассылки «ЧЧ:ММ», next_send — ближайшая отправка
+# «ГГГГ-ММ-ДД ЧЧ:ММ». Строки в этом формате сравниваются как даты, поэтому
+# выборка созревших подписок — диапазон по индексу next_send.
+WEATHER_SUBSCRIPTIONS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS weather_subscriptions (
+        user_id INTEGER PRIMARY KEY,
+        city TEXT NOT NULL,
+        send_at TEXT NOT NULL,
+        next_send TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_weather_subscriptions_next_send ON weather_subscriptions (next_send);
+"""
+
+
+class WeatherSubscriptionRepository:
+    def __init__(self, db):
+        self.db = db
+
+    async def get(self, user_id):
+        # (city, send_at) или None
+        return await self.db.fetchone("SELECT city, send_at FROM weather_subscriptions WHERE user_id = ?", (user_id,))
+
+    async def subscribe(self, user_id, city, send_at, next_send):
+        await self.db.execute("INSERT OR REPLACE INTO weather_subscriptions (user_id, city, send_at, next_send) "
+                              "VALUES (?, ?, ?, ?)", (user_id, city, send_at, next_send))
+
+    async def unsubscribe(self, user_id):
+        rowcount, _ = await self.db.execute("DELETE FROM weather_subscriptions WHERE user_id = ?", (user_id,))
+        return rowcount
+
+    async def due(self, now, limit=1000):
+        return await self.db.fetchall("SELECT user_id, city, send_at FROM weather_subscriptions "
+                                      "WHERE next_send <= ? ORDER BY next_send LIMIT ?", (now, limit))
+
+    async def reschedule(self, items):
+        # items: [(next_send, user_id), ...]
+        def reschedule_subscriptions(conn, items):
+            with conn:
+                conn.executemany("UPDATE weather_subscriptions SET next_send = ? WHERE user_id = ?", items)
+
+        await self.db.run(reschedule_subscriptions, items)
+
+
+# --- НАБЛЮДЕНИЕ ЗА РЕПОЗИТОРИЯМИ ---
+# github_repos хранит курсор опроса каждого репозитория (ETag, последний
+# увиденный коммит и его дату для since=), подписки ссылаются на него.
+GITHUB_WATCH_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS github_repos (
+        repo TEXT PRIMARY KEY,
+        etag TEXT,
+        last_sha TEXT,
+        since TEXT
+    );
+    CREATE TABLE IF NOT EXISTS github_subscriptions (
+        user_id INTEGER NOT NULL,
+        repo TEXT NOT NULL REFERENCES github_repos (repo) ON DELETE CASCADE,
+        PRIMARY KEY (user_id, repo)
+    );
+    CREATE INDEX IF NOT EXISTS idx_github_subscriptions_repo ON github_subscriptions (repo);
+"""
+
+
+class GitHubWatchRepository:
+    def __init__(self, db):
+        self.db = db
+
+    async def watch(self, user_id, repo):
+        # True, если подписка новая
+        def watch_repo(conn, user_id, repo):
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO github_repos (repo) VALUES (?)", (repo,))
+                cursor = conn.execute("INSERT OR IGNORE INTO github_subscriptions (user_id, repo) VALUES (?, ?)",
+                                      (user_id, repo))
+            return cursor.rowcount > 0
+
+        return await self.db.run(watch_repo, user_id, repo)
+
+    async def unwatch(self, user_id, repo):
+        # Репозиторий без подписчиков перестаёт опрашиваться
+        def unwatch_repo(conn, user_id, repo):
+            with conn:
+                cursor = conn.execute("DELETE FROM github_subscriptions WHERE user_id = ? AND repo = ?",
+                                      (user_id, repo))
+                conn.execute("DELETE FROM github_repos WHERE repo = ? AND NOT EXISTS "
+                             "(SELECT 1 FROM github_subscriptions WHERE repo = ?)", (repo, repo))
+            return cursor.rowcount
+
+        return await self.db.run(unwatch_repo, user_id, repo)
+
+    async def watched(self, user_id):
+        rows = await self.db.fetchall("SELECT repo FROM github_subscriptions WHERE user_id = ? ORDER BY repo",
+                                      (user_id,))
+        return [row[0] for row in rows]
+
+    async def repos(self):
+        # [(repo, etag, last_sha, since), ...]
+        return await self.db.fetchall("SELECT repo, etag, last_sha, since FROM github_repos ORDER BY repo")
+
+    async def subscribers(self, repo):
+        rows = await self.db.fetchall("SELECT user_id FROM github_subscriptions WHERE repo = ?", (repo,))
+        return [row[0] for row in rows]
+
+    async def save_cursor(self, repo, etag, last_sha, since):
+        await self.db.execute("UPDATE github_repos SET etag = ?, last_sha = ?, since = ? WHERE repo = ?",
+                              (etag, last_sha, since, repo))
+
+
+# --- ИСТОРИЯ ТРЕВОГ ---
+# Одна строка на тревогу: добавляется при начале, при отбое заполняется
+# ended_at, больше не меняется. Время — unix-секунды. Открытые тревоги
+# (ended_at IS NULL) и завершившиеся после момента since — два диапазона
+# одного индекса (region_id, ended_at).
+ALERT_HISTORY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS alert_history (
+        id INTEGER PRIMARY KEY,
+        region_id TEXT NOT NULL,
+        region_name TEXT NOT NULL,
+        alert_type TEXT NOT NULL,
+        started_at INTEGER NOT NULL,
+        ended_at INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_alert_history_region_ended ON alert_history (region_id, ended_at);
+    CREATE INDEX IF NOT EXISTS idx_alert_history_ended ON alert_history (ended_at);
+"""
+
+
+class AlertHistoryRepository:
+    def __init__(self, db):
+        self.db = db
+
+    async def open_alerts(self):
+        # regionId -> (regionName, frozenset типов) — в том же виде, что alerts.active_alerts
+        rows = await self.db.fetchall("SELECT region_id, region_name, alert_type FROM alert_history "
+                                      "WHERE ended_at IS NULL")
+        alerts = {}
+        for region_id, region_name, alert_type in rows:
+            name, types = alerts.get(region_id, (region_name, frozenset()))
+            alerts[region_id] = (name, types | {alert_type})
+        return alerts
+
+    async def record(self, started, ended, at):
+        # started: [(region_id, region_name, alert_type)], ended: [(region_id, alert_type)].
+        # Все переходы одного опроса пишутся одной транзакцией.
+        def record_alert_transitions(conn, started, ended, at):
+            with conn:
+                conn.executemany("UPDATE alert_history SET ended_at = ? "
+                                 "WHERE region_id = ? AND alert_type = ? AND ended_at IS NULL",
+                                 [(at, region_id, alert_type) for region_id, alert_type in ended])
+                conn.executemany("INSERT INTO alert_history (region_id, region_name, alert_type, started_at) "
+                                 "VALUES (?, ?, ?, ?)",
+                                 [(region_id, name, alert_type, at) for region_id, name, alert_type in started])
+
+        await self.db.run(record_alert_transitions, started, ended, at)
+
+    async def region_history(self, region_id, since, limit=100):
+        # [(alert_type, started_at, ended_at)] тревог, которые шли после since, от новых к старым
+        return await self.db.fetchall(
+            "SELECT alert_type, started_at, ended_at FROM ("
+            "SELECT alert_type, started_at, ended_at FROM alert_history WHERE region_id = ? AND ended_at IS NULL "
+            "UNION ALL "
+            "SELECT alert_type, started_at, ended_at FROM alert_history WHERE region_id = ? AND ended_at >= ?"
+            ") ORDER BY started_at DESC LIMIT ?",
+            (region_id, region_id, since, limit))
+
+    async def prune(self, before):
+        rowcount, _ = await self.db.execute("DELETE FROM alert_history WHERE ended_at < ?", (before,))
+        return rowcount
@@ -0,0 +1,105 @@
+import asyncio
+import datetime
+import logging
+import re
+
+from sender import PRIORITY_BULK
+from weather import normalize_city
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def parse_send_at(text):
+    # «7:30», «07.30», «7 30» -> «07:30»; None, если это не время суток
+    match = re.fullmatch(r"\s*(\d{1,2})[:.\s](\d{2})\s*", text or "")
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if hour > 23 or minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+
+def next_occurrence(send_at, now):
+    hour, minute = map(int, send_at.split(":"))
+    moment = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if moment <= now:
+        moment += datetime.timedelta(days=1)
+    return moment.strftime(SCHEDULE_FORMAT)
+
+
+# --- ЕЖЕДНЕВНЫЙ ПРОГНОЗ ---
+class WeatherDigest:
+    # Раз в interval секунд выбирает созревшие подписки по индексу next_send,
+    # группирует их по нормализованному городу и запрашивает каждый город
+    # один раз через WeatherCache. Сообщения уходят через SendQueue с низким
+    # приоритетом, чтобы не задерживать ответы и уведомления о тревогах.
+    def __init__(self, subscriptions, weather, send_queue, interval=30, batch_size=1000,
+                 concurrency=10, retry_delay=600, tz=None):
+        self.subscriptions = subscriptions
+        self.weather = weather
+        self.send_queue = send_queue
+        self.interval = interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retry_delay = retry_delay
+        self.tz = tz
+        self.runs = 0
+        self.sent = 0
+        self.cities = 0
+        self.failed = 0
+
+    def now(self):
+        # Время рассылки хранится без зоны, в зоне tz (или локальной)
+        return datetime.datetime.now(self.tz).replace(tzinfo=None)
+
+    async def run_once(self):
+        now = self.now()
+        due = await self.subscriptions.due(now.strftime(SCHEDULE_FORMAT), self.batch_size)
+        if not due:
+            return 0
+        by_city = {}
+        for user_id, city, send_at in due:
+            by_city.setdefault(normalize_city(city), []).append((user_id, city, send_at))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        retry_at = (now + datetime.timedelta(seconds=self.retry_delay)).strftime(SCHEDULE_FORMAT)
+
+        async def deliver(group):
+            async with semaphore:
+                current_weather, forecast_text = await self.weather.get(group[0][1])
+            if forecast_text is None:
+                # Ошибка API: вся группа повторится через retry_delay
+                logger.warning(f"Прогноз для рассылки не получен ({group[0][1]}): {current_weather}")
+                self.failed += len(group)
+                return [(retry_at, user_id) for user_id, _, _ in group]
+            text = f"{current_weather}\n\n{forecast_text}"
+            for user_id, _, _ in group:
+                await self.send_queue.put(user_id, text, priority=PRIORITY_BULK)
+            self.sent += len(group)
+            return [(next_occurrence(send_at, now), user_id) for user_id, _, send_at in group]
+
+        results = await asyncio.gather(*(deliver(group) for group in by_city.values()))
+        await self.subscriptions.reschedule([item for result in results for item in result])
+        self.runs += 1
+        self.cities += len(by_city)
+        return len(due)
+
+    async def run_forever(self):
+        while True:
+            try:
+                # Полная пачка — значит, созревших подписок больше; добираем сразу
+                while await self.run_once() >= self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error(f"Ошибка рассылки прогнозов: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "sent": self.sent,
+            "cities": self.cities,
+            "failed": self.failed,
+        }
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import time
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+FSM_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS fsm (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_fsm_updated_at ON fsm (updated_at);
+"""
+
+
+def storage_key(key):
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny,
+    ))
+
+
+class _Entry:
+    __slots__ = ("state", "data", "updated_at", "touched_at", "checked_at")
+
+    def __init__(self, state, data, updated_at):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+        self.touched_at = time.monotonic()
+        self.checked_at = self.touched_at
+
+
+# --- ХРАНИЛИЩЕ FSM ---
+class SQLiteStorage(BaseStorage):
+    # FSM в SQLite (WAL), ключ — bot:chat:user:thread:business:destiny.
+    # Горячие состояния живут в памяти, изменения сбрасываются на диск
+    # пачкой раз в flush_interval секунд одной транзакцией. Брошенные
+    # мастера удаляются через state_ttl секунд.
+    #
+    # Ingress закрепляет пользователя за одним воркером, поэтому кэшу
+    # можно верить: чистая запись сверяется с БД не чаще раза в
+    # revalidate_after секунд. Так состояние, которое записал другой
+    # процесс (переезд пользователя, несколько webhook-инстансов), будет
+    # видно с задержкой не больше этого окна. При сбросе строка
+    # перезаписывается, только если наша запись не старее.
+    def __init__(self, path, state_ttl=24 * 3600, flush_interval=0.5, cache_idle=300, revalidate_after=5.0,
+                 metrics=None):
+        self.db = Database(path, metrics)
+        self.state_ttl = state_ttl
+        self.flush_interval = flush_interval
+        self.cache_idle = cache_idle
+        self.revalidate_after = revalidate_after
+        self._cache = {}
+        self._dirty = set()
+        self._task = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.cache_hits = 0
+        self.reads = 0
+
+    async def start(self):
+        await self.db.connect(FSM_SCHEMA)
+        await self.prune()
+        self._task = asyncio.create_task(self._flush_forever())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        await self.flush()
+        await self.db.close()
+
+    async def _entry(self, key):
+        key = storage_key(key)
+        entry = cached = self._cache.get(key)
+        now = time.monotonic()
+        if cached is not None and (key in self._dirty or now - cached.checked_at < self.revalidate_after):
+            self.cache_hits += 1
+        else:
+            seen = cached.updated_at if cached is not None else None
+            row = await self.db.fetchone("SELECT updated_at, state, data FROM fsm WHERE key = ?", (key,))
+            self.reads += 1
+            entry = self._cache.get(key)
+            if entry is None:
+                entry = self._cache[key] = _Entry(None, {}, 0.0)
+                self._refresh(entry, row)
+            elif entry is cached and entry.updated_at == seen and key not in self._dirty:
+                # Пока шёл запрос, этот процесс запись не менял — строка из БД не старее
+                self._refresh(entry, row)
+            entry.checked_at = now
+        if time.time() - entry.updated_at > self.state_ttl:
+            entry.state, entry.data = None, {}
+        entry.touched_at = now
+        return key, entry
+
+    @staticmethod
+    def _refresh(entry, row):
+        # Строку мог изменить или удалить другой процесс; data разбирается,
+        # только если запись действительно поменялась
+        if row is None:
+            entry.state, entry.data = None, {}
+        elif row[0] != entry.updated_at:
+            entry.updated_at, entry.state, entry.data = row[0], row[1], json.loads(row[2])
+
+    def _touch(self, key, entry):
+        entry.updated_at = time.time()
+        self._dirty.add(key)
+
+    async def set_state(self, key, state=None):
+        key, entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._touch(key, entry)
+
+    async def get_state(self, key):
+        _, entry = await self._entry(key)
+        return entry.state
+
+    async def set_data(self, key, data):
+        key, entry = await self._entry(key)
+        entry.data = dict(data)
+        self._touch(key, entry)
+
+    async def get_data(self, key):
+        _, entry = await self._entry(key)
+        return dict(entry.data)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for key in keys:
+            entry = self._cache[key]
+            if entry.state is None and not entry.data:
+                deletes.append((key, entry.updated_at))
+            else:
+                upserts.append((key, entry.state, json.dumps(entry.data, ensure_ascii=False), entry.updated_at))
+
+        def write(conn):
+            with conn:
+                conn.executemany("""
+                    INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data,
+                                                   updated_at = excluded.updated_at
+                    WHERE excluded.updated_at >= fsm.updated_at
+                """, upserts)
+                conn.executemany("DELETE FROM fsm WHERE key = ? AND updated_at <= ?", deletes)
+
+        try:
+            await self.db.run(write)
+        except Exception:
+            # Не теряем изменения: запишем их при следующем сбросе
+            self._dirty |= keys
+            raise
+        self.flushes += 1
+        self.rows_written += len(upserts) + len(deletes)
+
+    async def prune(self):
+        rowcount, _ = await self.db.execute("DELETE FROM fsm WHERE updated_at < ?", (time.time() - self.state_ttl,))
+        if rowcount:
+            logger.info(f"Удалено брошенных состояний FSM: {rowcount}")
+
+    def _evict_idle(self):
+        deadline = time.monotonic() - self.cache_idle
+        for key in [key for key, entry in self._cache.items() if entry.touched_at < deadline and key not in self._dirty]:
+            del self._cache[key]
+
+    async def _flush_forever(self):
+        last_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_prune > 60:
+                    last_prune = time.monotonic()
+                    self._evict_idle()
+                    await self.prune()
+            except Exception as e:
+                logger.error(f"Ошибка записи состояний FSM: {e}")
+
+    def stats(self):
+        return {
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "cache_hits": self.cache_hits,
+            "reads": self.reads,
+        }
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+GITHUB_API = "https://api.github.com"
+RATE_LIMIT_HEADERS = {
+    "X-RateLimit-Limit": "limit",
+    "X-RateLimit-Remaining": "remaining",
+    "X-RateLimit-Used": "used",
+    "X-RateLimit-Reset": "reset",
+}
+
+
+def render_commits(commits):
+    return "\n".join(
+        f"👤 {commit['commit']['author']['name']}: {commit['commit']['message']}" for commit in commits
+    )
+
+
+# --- GITHUB КЛИЕНТ ---
+class GitHubClient:
+    # Асинхронный клиент поверх общего HttpClient. Готовые сводки коммитов
+    # лежат в LRU+TTL кэше; после истечения TTL ответ перепроверяется через
+    # If-None-Match, и 304 не расходует лимит запросов GitHub. Пока GitHub
+    # недоступен, вместо ошибки отдаётся последняя сводка из кэша, если она есть.
+    def __init__(self, http, token="", base_url=GITHUB_API, per_page=5, cache_size=256, ttl=60):
+        self.http = http
+        self.base_url = base_url
+        self.per_page = per_page
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.headers = {"Accept": "application/vnd.github+json"}
+        if token:
+            self.headers["Authorization"] = f"token {token}"
+        self._cache = OrderedDict()
+        self.rate_limit = {}
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    def _remember_rate_limit(self, response):
+        for header, name in RATE_LIMIT_HEADERS.items():
+            value = response.headers.get(header)
+            if value is not None and value.isdigit():
+                self.rate_limit[name] = int(value)
+
+    def _store(self, key, etag, summary):
+        self._cache[key] = (etag, summary, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def recent_commits(self, owner, repo):
+        # Возвращает (status, summary). summary == "" — в репозитории нет коммитов.
+        key = (owner.lower(), repo.lower())
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[2] < self.ttl:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return 200, cached[1]
+
+        headers = dict(self.headers)
+        if cached and cached[0]:
+            headers["If-None-Match"] = cached[0]
+        url = f"{self.base_url}/repos/{owner}/{repo}/commits"
+        try:
+            async with self.http.get(url, headers=headers, params={"per_page": self.per_page}) as response:
+                self._remember_rate_limit(response)
+                if response.status == 304 and cached:
+                    self.revalidated += 1
+                    self._store(key, cached[0], cached[1])
+                    return 200, cached[1]
+                if response.status >= 500 and cached:
+                    self.fallbacks += 1
+                    return 200, cached[1]
+                if response.status != 200:
+                    return response.status, None
+                commits = await response.json()
+                self.misses += 1
+                summary = render_commits(commits[:self.per_page])
+                self._store(key, response.headers.get("ETag"), summary)
+                return 200, summary
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not cached:
+                raise
+            logger.warning(f"GitHub недоступен ({e}), отдаём сводку {owner}/{repo} из кэша")
+            self.fallbacks += 1
+            return 200, cached[1]
+
+    async def commits_since(self, owner, repo, since=None, etag=None, per_page=30):
+        # Условный запрос для наблюдателя: (status, commits, etag).
+        # 304 означает, что с прошлого опроса ничего не изменилось.
+        headers = dict(self.headers)
+        if etag:
+            headers["If-None-Match"] = etag
+        params = {"per_page": per_page}
+        if since:
+            params["since"] = since
+        url = f"{self.base_url}/repos/{owner}/{repo}/commits"
+        async with self.http.get(url, headers=headers, params=params) as response:
+            self._remember_rate_limit(response)
+            if response.status != 200:
+                return response.status, None, etag
+            return 200, await response.json(), response.headers.get("ETag")
+
+    def stats(self):
+        return {
+            "cache_size": len(self._cache),
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "fallbacks": self.fallbacks,
+            **{f"rate_limit_{name}": value for name, value in self.rate_limit.items()},
+        }
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import re
+import time
+
+from github_client import render_commits
+
+logger = logging.getLogger(__name__)
+
+REPO_RE = re.compile(r"[A-Za-z0-9](?:[A-Za-z0-9-]{0,38})/[A-Za-z0-9._-]{1,100}")
+
+
+def parse_repo(text):
+    # «owner/repo» или ссылка на github.com -> «owner/repo» в нижнем регистре
+    text = (text or "").strip().removeprefix("https://").removeprefix("github.com/").rstrip("/")
+    text = text.removesuffix(".git")
+    return text.lower() if REPO_RE.fullmatch(text) else None
+
+
+def new_commits(commits, last_sha):
+    # Коммиты приходят от новых к старым; всё до последнего увиденного — новое
+    fresh = []
+    for commit in commits:
+        if commit["sha"] == last_sha:
+            break
+        fresh.append(commit)
+    return fresh
+
+
+# --- НАБЛЮДАТЕЛЬ ЗА РЕПОЗИТОРИЯМИ ---
+class GitHubWatcher:
+    # Каждый отслеживаемый репозиторий опрашивается один раз за interval,
+    # сколько бы у него ни было подписчиков. Запросы равномерно разнесены
+    # по интервалу, а If-None-Match и since= делают опрос неизменившегося
+    # репозитория ответом 304, который не расходует лимит GitHub.
+    def __init__(self, github, watches, notify, interval=300, max_commits=10):
+        self.github = github
+        self.watches = watches
+        self.notify = notify
+        self.interval = interval
+        self.max_commits = max_commits
+        self.polls = 0
+        self.not_modified = 0
+        self.errors = 0
+        self.notifications = 0
+
+    async def poll_repo(self, repo, etag, last_sha, since):
+        owner, name = repo.split("/", 1)
+        status, commits, etag = await self.github.commits_since(owner, name, since=since, etag=etag)
+        self.polls += 1
+        if status == 304:
+            self.not_modified += 1
+            return []
+        if status != 200:
+            self.errors += 1
+            logger.warning(f"GitHub вернул {status} для {repo}")
+            return []
+        if not commits:
+            await self.watches.save_cursor(repo, etag, last_sha, since)
+            return []
+
+        head = commits[0]
+        await self.watches.save_cursor(repo, etag, head["sha"], head["commit"]["committer"]["date"])
+        if last_sha is None:
+            # Первый опрос задаёт точку отсчёта, уведомлять не о чем
+            return []
+        fresh = new_commits(commits, last_sha)
+        if fresh:
+            text = f"Новые коммиты в {repo}:\n{render_commits(fresh[:self.max_commits])}"
+            if len(fresh) > self.max_commits:
+                text += f"\n…и ещё {len(fresh) - self.max_commits}"
+            for user_id in await self.watches.subscribers(repo):
+                await self.notify(user_id, text)
+                self.notifications += 1
+        return fresh
+
+    async def wait_for_rate_limit(self):
+        # При исчерпанном лимите ждём его сброса, а не тратим запросы на 403
+        if self.github.rate_limit.get("remaining") == 0:
+            delay = self.github.rate_limit.get("reset", 0) - time.time()
+            if delay > 0:
+                logger.warning(f"Лимит GitHub исчерпан, опрос продолжится через {delay:.0f} с")
+                await asyncio.sleep(delay)
+
+    async def run_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                repos = await self.watches.repos()
+            except Exception as e:
+                logger.error(f"Ошибка чтения отслеживаемых репозиториев: {e}")
+                repos = []
+            if not repos:
+                await asyncio.sleep(self.interval)
+                continue
+            step = self.interval / len(repos)
+            for row in repos:
+                started = loop.time()
+                await self.wait_for_rate_limit()
+                try:
+                    await self.poll_repo(*row)
+                except Exception as e:
+                    logger.error(f"Ошибка опроса репозитория {row[0]}: {e}")
+                await asyncio.sleep(max(0.0, step - (loop.time() - started)))
+
+    def stats(self):
+        return {
+            "polls": self.polls,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+            "notifications": self.notifications,
+        }
@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import random
+import time
+
+import aiohttp
+from yarl import URL
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class CircuitOpenError(aiohttp.ClientError):
+    # Хост помечен нездоровым: запрос не отправлялся
+    def __init__(self, host, retry_in):
+        super().__init__(f"{host} временно недоступен, повтор через {retry_in:.0f} с")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class HostBusyError(aiohttp.ClientError):
+    # Все слоты хоста заняты дольше queue_timeout
+    def __init__(self, host):
+        super().__init__(f"{host} перегружен: нет свободного слота для запроса")
+        self.host = host
+
+
+# --- ПРЕДОХРАНИТЕЛЬ ---
+class CircuitBreaker:
+    # closed: запросы идут как обычно. После failure_threshold ошибок подряд
+    # переходит в open и reset_timeout секунд отказывает сразу. Затем
+    # half_open: пропускает один пробный запрос, его исход закрывает
+    # предохранитель или снова открывает его.
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, host, failure_threshold=5, reset_timeout=30.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = None
+        self.opens = 0
+        self.rejected = 0
+
+    def retry_in(self):
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self.trial_started = None
+        if self.state == self.HALF_OPEN:
+            # Пробный запрос, который так и не завершился (отменён),
+            # не должен держать предохранитель полуоткрытым вечно
+            if self.trial_started is not None and now - self.trial_started < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.trial_started = now
+        return True
+
+    def success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"Связь с {self.host} восстановлена")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trial_started = None
+
+    def failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.trial_started = None
+            self.opens += 1
+            logger.warning(f"{self.host}: {self.failures} ошибок подряд, запросы приостановлены "
+                           f"на {self.reset_timeout:.0f} с")
+
+    def stats(self):
+        return {
+            "state": self.STATE_VALUES[self.state],
+            "failures": self.failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
+
+
+class _Host:
+    __slots__ = ("semaphore", "breaker", "retries", "timeouts")
+
+    def __init__(self, host, concurrency, failure_threshold, reset_timeout):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.breaker = CircuitBreaker(host, failure_threshold, reset_timeout)
+        self.retries = 0
+        self.timeouts = 0
+
+
+class _Request:
+    # async with http.get(...) as response: слот хоста держится, пока
+    # ответ не прочитан, и освобождается вместе с соединением
+    __slots__ = ("client", "method", "url", "kwargs", "response", "host")
+
+    def __init__(self, client, method, url, kwargs):
+        self.client = client
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+        self.response = None
+        self.host = None
+
+    async def __aenter__(self):
+        self.response, self.host = await self.client._send(self.method, self.url, self.kwargs)
+        return self.response
+
+    async def __aexit__(self, *exc_info):
+        self.response.release()
+        self.host.semaphore.release()
+
+
+# --- ОБЩИЙ HTTP КЛИЕНТ ---
+class HttpClient:
+    # Одна ClientSession на весь процесс: keep-alive пулы по хостам и кэш DNS,
+    # чтобы каждое нажатие кнопки не платило за TCP, TLS и DNS заново.
+    #
+    # У каждого внешнего хоста свои слоты (не больше limit_per_host запросов
+    # сразу, ожидание слота — не дольше queue_timeout) и свой предохранитель.
+    # Идемпотентные запросы повторяются при сетевых ошибках, таймаутах и
+    # 429/5xx с экспоненциальной паузой со случайным разбросом.
+    def __init__(self, limit=100, limit_per_host=20, ttl_dns_cache=300, keepalive_timeout=30, metrics=None,
+                 connect_timeout=3.0, read_timeout=10.0, total_timeout=15.0, queue_timeout=5.0,
+                 retries=2, backoff=0.5, backoff_max=5.0, breaker_failures=5, breaker_reset=30.0):
+        self.metrics = metrics
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=connect_timeout,
+                                             sock_read=read_timeout)
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.session = None
+        self.hosts = {}
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.requests = 0
+
+    async def start(self):
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._on_request_start)
+        trace.on_connection_create_end.append(self._on_connection_create)
+        trace.on_connection_reuseconn.append(self._on_connection_reuse)
+        if self.metrics is not None:
+            trace.on_request_end.append(self._on_request_end)
+            trace.on_request_exception.append(self._on_request_exception)
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, trace_configs=[trace])
+
+    async def close(self):
+        if self.session is not None:
+            logger.info("HTTP пул при остановке: %s", self.stats())
+            await self.session.close()
+            self.session = None
+
+    async def _on_request_start(self, session, ctx, params):
+        self.requests += 1
+        ctx.started = time.perf_counter()
+
+    async def _on_request_end(self, session, ctx, params):
+        self.metrics.http.observe((params.url.host, str(params.response.status)), time.perf_counter() - ctx.started)
+
+    async def _on_request_exception(self, session, ctx, params):
+        self.metrics.http.observe((params.url.host, "error"), time.perf_counter() - ctx.started)
+
+    async def _on_connection_create(self, session, ctx, params):
+        self.connections_created += 1
+
+    async def _on_connection_reuse(self, session, ctx, params):
+        self.connections_reused += 1
+
+    def host(self, name):
+        host = self.hosts.get(name)
+        if host is None:
+            host = self.hosts[name] = _Host(name, self.limit_per_host, self.breaker_failures, self.breaker_reset)
+        return host
+
+    def retry_delay(self, attempt, response=None):
+        # Retry-After от сервера важнее своей паузы, но не длиннее backoff_max
+        retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+        if retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    async def _acquire(self, name, host):
+        try:
+            await asyncio.wait_for(host.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HostBusyError(name) from None
+
+    async def _send(self, method, url, kwargs):
+        name = URL(url).host
+        host = self.host(name)
+        retries = self.retries if method.upper() in IDEMPOTENT_METHODS else 0
+        attempt = 0
+        while True:
+            if not host.breaker.allow():
+                raise CircuitOpenError(name, host.breaker.retry_in())
+            await self._acquire(name, host)
+            try:
+                response = await self.session.request(method, url, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                host.semaphore.release()
+                host.breaker.failure()
+                if isinstance(e, asyncio.TimeoutError):
+                    host.timeouts += 1
+                if attempt >= retries:
+                    raise
+                delay = self.retry_delay(attempt)
+            except BaseException:
+                host.semaphore.release()
+                raise
+            else:
+                if response.status >= 500:
+                    host.breaker.failure()
+                else:
+                    host.breaker.success()
+                if response.status not in RETRY_STATUSES or attempt >= retries:
+                    # Слот освободит _Request.__aexit__ после чтения ответа
+                    return response, host
+                delay = self.retry_delay(attempt, response)
+                response.release()
+                host.semaphore.release()
+            attempt += 1
+            host.retries += 1
+            logger.debug(f"Повтор {method} {name} через {delay:.2f} с (попытка {attempt + 1})")
+            await asyncio.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return _Request(self, "GET", url, kwargs)
+
+    def request(self, method, url, **kwargs):
+        return _Request(self, method, url, kwargs)
+
+    def host_stats(self):
+        # Состояние хостов для метрик: state 0 — closed, 1 — half_open, 2 — open
+        return {
+            name: {
+                **host.breaker.stats(),
+                "in_flight": self.limit_per_host - host.semaphore._value,
+                "retries": host.retries,
+                "timeouts": host.timeouts,
+            }
+            for name, host in self.hosts.items()
+        }
+
+    def stats(self):
+        # У коннектора нет публичного API для состояния пула,
+        # поэтому читаем его внутренние структуры.
+        connector = self.session.connector if self.session else None
+        in_use = len(getattr(connector, "_acquired", ())) if connector else 0
+        idle_by_host = {}
+        if connector:
+            for key, conns in getattr(connector, "_conns", {}).items():
+                idle_by_host[key.host] = idle_by_host.get(key.host, 0) + len(conns)
+        total = self.connections_created + self.connections_reused
+        return {
+            "requests": self.requests,
+            "connections_in_use": in_use,
+            "connections_idle": sum(idle_by_host.values()),
+            "idle_by_host": idle_by_host,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_ratio": round(self.connections_reused / total, 3) if total else 0.0,
+            "retries": sum(host.retries for host in self.hosts.values()),
+            "timeouts": sum(host.timeouts for host in self.hosts.values()),
+            "breakers_open": sum(host.breaker.state != CircuitBreaker.CLOSED for host in self.hosts.values()),
+            "breaker_states": {name: host.breaker.state for name, host in self.hosts.items()},
+        }
+
+    async def report_stats(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            logger.info("HTTP пул: %s", self.stats())
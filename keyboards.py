@@ -0,0 +1,81 @@
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+
+
+class FrozenReplyKeyboardMarkup(ReplyKeyboardMarkup):
+    # Клавиатуры строятся один раз при импорте и переиспользуются во всех
+    # ответах, поэтому случайное изменение одной из них запрещено.
+    model_config = {**ReplyKeyboardMarkup.model_config, "frozen": True}
+
+
+def build_keyboard(*rows):
+    return FrozenReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=text)] for text in rows],
+        resize_keyboard=True
+    )
+
+
+# --- КЛАВИАТУРЫ ---
+MAIN_MENU = build_keyboard(
+    "📅 Планы",
+    "🌦 Прогноз погоды",
+    "🌅 Утренний прогноз",
+    "🐙 GitHub Коммиты",
+    "🚨 Уведомления о тревогах",
+)
+
+PLAN_MENU = build_keyboard(
+    "➕Добавить план",
+    "✏️Изменить план",
+    "🗑️Удалить план",
+    "📋Список планов",
+    "🔍Поиск плана",
+    "📥Импорт планов",
+    "📤Экспорт планов",
+    "🔙Назад",
+)
+
+ALERT_MENU = build_keyboard(
+    "🔙 Назад",
+    "🔔 Проверить сейчас",
+    "📜 История тревог",
+    "✏️ Изменить регион",
+)
+
+# Вставляет в поле ввода «@бот », дальше работает inline-поиск регионов
+REGION_SEARCH = InlineKeyboardMarkup(inline_keyboard=[[
+    InlineKeyboardButton(text="🔎 Найти регион по названию", switch_inline_query_current_chat=""),
+]])
+
+
+# --- ПАГИНАЦИЯ ПЛАНОВ ---
+class PlansPage(CallbackData, prefix="plans"):
+    # Курсор keyset-пагинации: следующая страница — id > after,
+    # предыдущая — id < before. Номер страницы не хранится.
+    after: int = 0
+    before: int = 0
+
+
+def plans_page_keyboard(rows, has_prev, has_next):
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="⬅️", callback_data=PlansPage(before=rows[0][0]).pack()))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="➡️", callback_data=PlansPage(after=rows[-1][0]).pack()))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
+# --- ИСТОРИЯ ТРЕВОГ ---
+ALERT_HISTORY_PERIODS = {24: "24 часа", 168: "7 дней"}
+
+
+class AlertHistoryPeriod(CallbackData, prefix="alerts"):
+    hours: int = 24
+
+
+def alert_history_keyboard(hours):
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text=f"• {title} •" if period == hours else title,
+                             callback_data=AlertHistoryPeriod(hours=period).pack())
+        for period, title in ALERT_HISTORY_PERIODS.items()
+    ]])
@@ -1,18 +1,49 @@
 import asyncio
 import logging
-import aiohttp
-import sqlite3
-import requests
-import json
+import os
+import re
+import secrets
+import signal
+import tempfile
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from aiohttp import web
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram import Bot, Dispatcher, types
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram import Bot, Dispatcher, Router, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramAPIError
 from aiogram.filters import Command
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from decouple import config
+from db import (Database, PlanRepository, UserRepository, WeatherSubscriptionRepository, GitHubWatchRepository,
+                AlertHistoryRepository, PLANS_SCHEMA, USERS_SCHEMA, WEATHER_SUBSCRIPTIONS_SCHEMA, GITHUB_WATCH_SCHEMA,
+                ALERT_HISTORY_SCHEMA)
+from http_client import CircuitOpenError, HostBusyError, HttpClient
+from github_client import GitHubClient
+from github_watcher import GitHubWatcher, parse_repo
+from weather import WeatherCache
+from regions import RegionCatalog
+from region_search import region_path
+from alerts import AlertPoller, AlertSnapshot
+from sender import SendQueue, PRIORITY_ALERT, PRIORITY_NORMAL
+from fsm_storage import SQLiteStorage
+from keyboards import (MAIN_MENU, PLAN_MENU, ALERT_MENU, REGION_SEARCH, ALERT_HISTORY_PERIODS, AlertHistoryPeriod,
+                       PlansPage, alert_history_keyboard, plans_page_keyboard)
+from replies import ReplyBuffer, ReplyMiddleware
+from throttle import USER_FEATURE, ThrottleMiddleware
+from router import TextRouter
+from metrics import Metrics, MetricsMiddleware
+from digest import WeatherDigest, next_occurrence, parse_send_at
+from workers import ShardedIngress, jump_hash, make_workers
+from plans_io import IMPORT_FORMATS, import_format, import_plans, export_plans
+from reminders import CLEAR_DUE, ReminderScheduler, clears_due, parse_due, split_due
 
 # --- ЛОГИРОВАНИЕ ---
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=config('LOG_LEVEL', default='INFO'))
 logger = logging.getLogger(__name__)
 
 # --- ТОКЕНЫ ---
@@ -21,65 +52,155 @@ WEATHER_TOKEN = config('WEATHER_TOKEN')
 GITHUB_TOKEN = config('GITHUB_TOKEN')
 ALARM_API_TOKEN = config('ALARM_API_TOKEN')
 
-bot = Bot(token=TOKEN)
-dp = Dispatcher()
-
 DB_PATH = 'plans.db'
+USERS_DB_PATH = 'bot_data.db'
+FSM_DB_PATH = config('FSM_DB_PATH', default='fsm.db')
+FSM_STATE_TTL = config('FSM_STATE_TTL', default=24 * 3600, cast=int)
+FSM_FLUSH_INTERVAL = config('FSM_FLUSH_INTERVAL', default=0.5, cast=float)
+# Как долго состояние из кэша не сверяется с БД (записи других процессов)
+FSM_REVALIDATE_INTERVAL = config('FSM_REVALIDATE_INTERVAL', default=5.0, cast=float)
+
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_HOST = config('METRICS_HOST', default='127.0.0.1')
+METRICS_PORT = config('METRICS_PORT', default=9100, cast=int)
+metrics = Metrics() if METRICS_ENABLED else None
+
+# Лимиты на пользователя: rate — апдейтов в секунду, burst — сколько можно
+# отправить подряд. Функции, которые ходят во внешние API, ограничены сильнее.
+THROTTLE_ENABLED = config('THROTTLE_ENABLED', default=True, cast=bool)
+THROTTLE_RATE = config('THROTTLE_RATE', default=2.0, cast=float)
+THROTTLE_BURST = config('THROTTLE_BURST', default=20, cast=int)
+THROTTLE_WEATHER_RATE = config('THROTTLE_WEATHER_RATE', default=0.2, cast=float)
+THROTTLE_WEATHER_BURST = config('THROTTLE_WEATHER_BURST', default=5, cast=int)
+THROTTLE_GITHUB_RATE = config('THROTTLE_GITHUB_RATE', default=0.1, cast=float)
+THROTTLE_GITHUB_BURST = config('THROTTLE_GITHUB_BURST', default=5, cast=int)
+THROTTLE_ALERTS_RATE = config('THROTTLE_ALERTS_RATE', default=0.2, cast=float)
+THROTTLE_ALERTS_BURST = config('THROTTLE_ALERTS_BURST', default=5, cast=int)
+THROTTLE_MAX_BUCKETS = config('THROTTLE_MAX_BUCKETS', default=100000, cast=int)
+# Обработчики, которые запрашивают внешние API, -> их корзина
+THROTTLE_FEATURES = {
+    "process_city": "weather",
+    "process_digest_city": "weather",
+    "process_repo": "github",
+    "watch_repo": "github",
+    "check_alert_now": "alerts",
+}
 
-# --- БД ---
-def create_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                plan TEXT NOT NULL
-            )
-        ''')
-        conn.commit()
-        logger.info("Таблица 'plans' успешно создана или уже существует")
-
-def greate_db_user():
-    conn = sqlite3.connect("bot_data.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY,
-        region_id TEXT,
-        reg_id INTEGER
-    )
-    """)
-    conn.commit()
-
-def get_db_connection():
-    conn = sqlite3.connect('bot_data.db')  # Укажите путь к вашей базе данных
-    return conn
-
-def save_plan(user_id, plan_text):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                plan TEXT NOT NULL
-            )
-        ''')
-        cursor.execute('INSERT INTO plans (user_id, plan) VALUES (?, ?)', (user_id, plan_text))
-        conn.commit()
-
-# --- ГЛАВНОЕ МЕНЮ ---
-def main_menu():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📅 Планы")],
-            [KeyboardButton(text="🌦 Прогноз погоды")],
-            [KeyboardButton(text="🐙 GitHub Коммиты")],
-            [KeyboardButton(text="🚨 Уведомления о тревогах")]
-        ],
-        resize_keyboard=True
-    )
+# Свой сервер Bot API (или заглушка в бенчмарках); пусто — api.telegram.org
+TELEGRAM_API_URL = config('TELEGRAM_API_URL', default='')
+bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+          if TELEGRAM_API_URL else None)
+# Состояния мастеров переживают перезапуск и общие для нескольких процессов
+dp = Dispatcher(storage=SQLiteStorage(FSM_DB_PATH, state_ttl=FSM_STATE_TTL,
+                                      flush_interval=FSM_FLUSH_INTERVAL,
+                                      revalidate_after=FSM_REVALIDATE_INTERVAL, metrics=metrics))
+# Кнопки меню регистрируются первыми и срабатывают в любом состоянии
+menu = TextRouter()
+menu.register(dp.message)
+# Шаги мастеров — во вложенном роутере: диспетчер проверяет его только после
+# своих обработчиков, поэтому команды вроде /search или /watch посреди
+# мастера выполняются, а не принимаются за ввод
+wizards = Router(name="wizards")
+dp.include_router(wizards)
+if metrics is not None:
+    dp.message.middleware(MetricsMiddleware(metrics, menu))
+    dp.callback_query.middleware(MetricsMiddleware(metrics))
+    dp.inline_query.middleware(MetricsMiddleware(metrics))
+# Лишние апдейты отбрасываются до обработчика и буфера ответов
+throttle = None
+if THROTTLE_ENABLED:
+    throttle = ThrottleMiddleware({
+        USER_FEATURE: (THROTTLE_RATE, THROTTLE_BURST),
+        "weather": (THROTTLE_WEATHER_RATE, THROTTLE_WEATHER_BURST),
+        "github": (THROTTLE_GITHUB_RATE, THROTTLE_GITHUB_BURST),
+        "alerts": (THROTTLE_ALERTS_RATE, THROTTLE_ALERTS_BURST),
+    }, THROTTLE_FEATURES, menu, max_size=THROTTLE_MAX_BUCKETS)
+    dp.message.middleware(throttle)
+    dp.callback_query.middleware(throttle)
+# Ответы обработчика через reply склеиваются и уходят после него одним-двумя запросами
+replies = ReplyMiddleware()
+dp.message.middleware(replies)
+
+# --- НАСТРОЙКИ ---
+BOT_MODE = config('BOT_MODE', default='polling')
+WEBHOOK_URL = config('WEBHOOK_URL', default='')
+WEBHOOK_PATH = config('WEBHOOK_PATH', default='/webhook')
+WEBHOOK_SECRET = config('WEBHOOK_SECRET', default='')
+WEBAPP_HOST = config('WEBAPP_HOST', default='0.0.0.0')
+WEBAPP_PORT = config('WEBAPP_PORT', default=8080, cast=int)
+
+# WORKERS > 0: этот процесс только принимает апдейты (polling или webhook)
+# и раздаёт их WORKERS процессам-воркерам по from_user.id
+WORKERS = config('WORKERS', default=0, cast=int)
+WORKER_BASE_PORT = config('WORKER_BASE_PORT', default=8100, cast=int)
+# Задаются супервизором для процессов в режиме worker
+WORKER_INDEX = config('WORKER_INDEX', default=0, cast=int)
+WORKER_PORT = config('WORKER_PORT', default=0, cast=int)
+WORKER_SECRET = config('WORKER_SECRET', default='')
+# Опросы API и рассылки должны идти в одном экземпляре, а не в каждом воркере
+RUN_BACKGROUND_JOBS = BOT_MODE != 'worker' or WORKER_INDEX == 0
+
+HTTP_LIMIT = config('HTTP_LIMIT', default=100, cast=int)
+HTTP_LIMIT_PER_HOST = config('HTTP_LIMIT_PER_HOST', default=20, cast=int)
+HTTP_DNS_TTL = config('HTTP_DNS_TTL', default=300, cast=int)
+HTTP_KEEPALIVE = config('HTTP_KEEPALIVE', default=30, cast=int)
+HTTP_STATS_INTERVAL = config('HTTP_STATS_INTERVAL', default=600, cast=int)
+HTTP_CONNECT_TIMEOUT = config('HTTP_CONNECT_TIMEOUT', default=3.0, cast=float)
+HTTP_READ_TIMEOUT = config('HTTP_READ_TIMEOUT', default=10.0, cast=float)
+HTTP_TOTAL_TIMEOUT = config('HTTP_TOTAL_TIMEOUT', default=15.0, cast=float)
+# Сколько ждать свободного слота хоста (HTTP_LIMIT_PER_HOST), прежде чем отказать
+HTTP_QUEUE_TIMEOUT = config('HTTP_QUEUE_TIMEOUT', default=5.0, cast=float)
+HTTP_RETRIES = config('HTTP_RETRIES', default=2, cast=int)
+HTTP_BACKOFF = config('HTTP_BACKOFF', default=0.5, cast=float)
+HTTP_BACKOFF_MAX = config('HTTP_BACKOFF_MAX', default=5.0, cast=float)
+HTTP_BREAKER_FAILURES = config('HTTP_BREAKER_FAILURES', default=5, cast=int)
+HTTP_BREAKER_RESET = config('HTTP_BREAKER_RESET', default=30.0, cast=float)
+
+WEATHER_CACHE_TTL = config('WEATHER_CACHE_TTL', default=600, cast=int)
+WEATHER_CACHE_STALE_TTL = config('WEATHER_CACHE_STALE_TTL', default=1800, cast=int)
+WEATHER_CACHE_SIZE = config('WEATHER_CACHE_SIZE', default=1000, cast=int)
+
+DIGEST_INTERVAL = config('DIGEST_INTERVAL', default=30, cast=int)
+DIGEST_BATCH = config('DIGEST_BATCH', default=1000, cast=int)
+DIGEST_CONCURRENCY = config('DIGEST_CONCURRENCY', default=10, cast=int)
+# Пусто — локальное время сервера
+DIGEST_TZ = config('DIGEST_TZ', default='Europe/Kyiv')
+LOCAL_TZ = ZoneInfo(DIGEST_TZ) if DIGEST_TZ else None
+
+REGIONS_REFRESH_INTERVAL = config('REGIONS_REFRESH_INTERVAL', default=6 * 3600, cast=int)
+
+ALERTS_POLL_INTERVAL = config('ALERTS_POLL_INTERVAL', default=30, cast=int)
+# Снимок тревог обновляется не чаще раза в ALERTS_SNAPSHOT_MAX_AGE секунд на процесс
+ALERTS_SNAPSHOT_MAX_AGE = config('ALERTS_SNAPSHOT_MAX_AGE', default=10, cast=int)
+ALERT_HISTORY_RETENTION_DAYS = config('ALERT_HISTORY_RETENTION_DAYS', default=30, cast=int)
+ALERT_HISTORY_LIMIT = config('ALERT_HISTORY_LIMIT', default=50, cast=int)
+
+SEND_RATE = config('SEND_RATE', default=30, cast=int)
+SEND_CHAT_INTERVAL = config('SEND_CHAT_INTERVAL', default=1.0, cast=float)
+SEND_CONCURRENCY = config('SEND_CONCURRENCY', default=30, cast=int)
+
+PLANS_PAGE_SIZE = config('PLANS_PAGE_SIZE', default=10, cast=int)
+PLAN_PREVIEW_LEN = config('PLAN_PREVIEW_LEN', default=300, cast=int)
+PLANS_SEARCH_LIMIT = config('PLANS_SEARCH_LIMIT', default=10, cast=int)
+# Bot API не отдаёт ботам файлы больше 20 МБ
+PLANS_IMPORT_MAX_SIZE = config('PLANS_IMPORT_MAX_SIZE', default=20 * 1024 * 1024, cast=int)
+PLANS_IMPORT_BATCH = config('PLANS_IMPORT_BATCH', default=500, cast=int)
+PLANS_IMPORT_PROGRESS_INTERVAL = config('PLANS_IMPORT_PROGRESS_INTERVAL', default=2.0, cast=float)
+PLANS_EXPORT_BATCH = config('PLANS_EXPORT_BATCH', default=1000, cast=int)
+# Сколько сработавших напоминаний снимается в БД одной транзакцией
+REMINDERS_BATCH = config('REMINDERS_BATCH', default=500, cast=int)
+
+GITHUB_CACHE_SIZE = config('GITHUB_CACHE_SIZE', default=256, cast=int)
+GITHUB_CACHE_TTL = config('GITHUB_CACHE_TTL', default=60, cast=int)
+GITHUB_WATCH_INTERVAL = config('GITHUB_WATCH_INTERVAL', default=300, cast=int)
+GITHUB_WATCH_LIMIT = config('GITHUB_WATCH_LIMIT', default=20, cast=int)
+
+REGION_SEARCH_LIMIT = config('REGION_SEARCH_LIMIT', default=20, cast=int)
+
+# Адреса внешних API можно подменить, например на локальные заглушки в бенчмарках
+WEATHER_API_URL = config('WEATHER_API_URL', default='https://api.weatherapi.com')
+GITHUB_API_URL = config('GITHUB_API_URL', default='https://api.github.com')
+ALARM_API_URL = config('ALARM_API_URL', default='https://api.ukrainealarm.com')
 
 # --- ХЕАДЕР ---
 token = config('ALARM_API_TOKEN')
@@ -88,12 +209,16 @@ header = {
     'Content-Type': 'application/json'
 }
 
-url = 'https://api.ukrainealarm.com/api/v3/regions'
-url_alert = 'https://api.ukrainealarm.com/api/v3/alerts'
+url = f'{ALARM_API_URL}/api/v3/regions'
+url_alert = f'{ALARM_API_URL}/api/v3/alerts'
+url_alert_status = f'{ALARM_API_URL}/api/v3/alerts/status'
+WEATHER_URL = f'{WEATHER_API_URL}/v1/forecast.json'
 
 # --- СОСТОЯНИЯ ---
 class WeatherState(StatesGroup):
     waiting_for_city = State()
+    waiting_for_digest_city = State()
+    waiting_for_digest_time = State()
 
 class RegionState(StatesGroup):
     waiting_for_obl = State()
@@ -105,6 +230,8 @@ class PlanState(StatesGroup):
     waiting_for_plan_edit = State()
     waiting_for_new_plan = State()
     waiting_for_plan_delete = State()
+    waiting_for_search = State()
+    waiting_for_import = State()
 
 class GitHubState(StatesGroup):
     waiting_for_owner = State()
@@ -148,63 +275,73 @@ WEATHER_CONDITIONS = {
 # --- СТАРТ ---
 @dp.message(Command("start"))
 async def start(message: types.Message):
-    await message.answer("Выберите действие:", reply_markup=main_menu())
+    await message.answer("Выберите действие:", reply_markup=MAIN_MENU)
 
 # --- ПОГОДА ---
-@dp.message(lambda message: message.text == "🌦 Прогноз погоды")
+@menu.button("🌦 Прогноз погоды")
 async def pogoda(message: types.Message, state: FSMContext):
-    await message.answer("Введите пожалуйста город для просмотра прогноза", reply_markup=main_menu())
+    await message.answer("Введите пожалуйста город для просмотра прогноза", reply_markup=MAIN_MENU)
     await state.set_state(WeatherState.waiting_for_city)
 
-async def get_weather(city):
-    url = f"https://api.weatherapi.com/v1/forecast.json?key={WEATHER_TOKEN}&q={city}&days=3&aqi=yes"
+async def get_weather(city, http: HttpClient):
+    # aqi не запрашиваем: качество воздуха в ответе не показывается
+    params = {"key": WEATHER_TOKEN, "q": city, "days": 3, "aqi": "no"}
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    city_name = data["location"]["name"]
-                    temp = data["current"]["temp_c"]
-                    condition = data["current"]["condition"]["text"]
-                    wind = data["current"]["wind_kph"]
-                    humidity = data["current"]["humidity"]
+        async with http.get(WEATHER_URL, params=params) as response:
+            if response.status == 200:
+                data = await response.json()
+                city_name = data["location"]["name"]
+                temp = data["current"]["temp_c"]
+                condition = data["current"]["condition"]["text"]
+                wind = data["current"]["wind_kph"]
+                humidity = data["current"]["humidity"]
+                condition_ru = WEATHER_CONDITIONS.get(condition, condition)
+                current_weather = (f"Погода в {city_name} сейчас:\n"
+                                   f"\n"
+                                   f"🌡️Температура - {temp}°C\n"
+                                   f"\n"
+                                   f"🔅Состояние - {condition_ru}\n"
+                                   f"\n"
+                                   f"🪁Ветер - {wind} км/ч\n"
+                                   f"\n"
+                                   f"🌧️Влажность - {humidity}%")
+
+                forecast_days = data["forecast"]["forecastday"]
+                forecast_text = "Прогноз на следующие дни:\n"
+                for day in forecast_days[1:]:
+                    date = day["date"]
+                    max_temp = day["day"]["maxtemp_c"]
+                    min_temp = day["day"]["mintemp_c"]
+                    condition = day["day"]["condition"]["text"]
                     condition_ru = WEATHER_CONDITIONS.get(condition, condition)
-                    current_weather = (f"Погода в {city_name} сейчас:\n"
-                                       f"\n"
-                                       f"🌡️Температура - {temp}°C\n"
-                                       f"\n"
-                                       f"🔅Состояние - {condition_ru}\n"
-                                       f"\n"
-                                       f"🪁Ветер - {wind} км/ч\n"
-                                       f"\n"
-                                       f"🌧️Влажность - {humidity}%")
-
-                    forecast_days = data["forecast"]["forecastday"]
-                    forecast_text = "Прогноз на следующие дни:\n"
-                    for day in forecast_days[1:]:
-                        date = day["date"]
-                        max_temp = day["day"]["maxtemp_c"]
-                        min_temp = day["day"]["mintemp_c"]
-                        condition = day["day"]["condition"]["text"]
-                        condition_ru = WEATHER_CONDITIONS.get(condition, condition)
-                        forecast_text += (f"🗓️{date}:\n"
-                                         f"🌡️Температура -> {min_temp}°C - {max_temp}°C\n"
-                                         f"🔅Состояние -> {condition_ru}\n\n")
-
-                    return current_weather, forecast_text
-                else:
-                    error_msg = f"Ошибка {response.status}: "
-                    if response.status == 400:
-                        error_msg += "Неверный запрос, проверьте название города."
-                    elif response.status == 401:
-                        error_msg += "Проблема с API-ключом."
-                    return error_msg, None
+                    forecast_text += (f"🗓️{date}:\n"
+                                     f"🌡️Температура -> {min_temp}°C - {max_temp}°C\n"
+                                     f"🔅Состояние -> {condition_ru}\n\n")
+
+                return current_weather, forecast_text
+            else:
+                error_msg = f"Ошибка {response.status}: "
+                if response.status == 400:
+                    error_msg += "Неверный запрос, проверьте название города."
+                elif response.status == 401:
+                    error_msg += "Проблема с API-ключом."
+                return error_msg, None
+    except (CircuitOpenError, HostBusyError) as e:
+        logger.warning(f"Запрос погоды отклонён: {e}")
+        return "Сервис погоды временно недоступен, попробуйте позже.", None
     except Exception as e:
         logger.error(f"Ошибка при запросе погоды: {e}")
         return f"Произошла ошибка: {str(e)}", None
 
-@dp.message(WeatherState.waiting_for_city)
-async def process_city(message: types.Message, state: FSMContext):
+def weather_fetcher(http: HttpClient):
+    # Ответы с ошибкой (forecast_text is None) не кэшируем
+    async def fetch(city):
+        current_weather, forecast_text = await get_weather(city, http)
+        return (current_weather, forecast_text), forecast_text is not None
+    return fetch
+
+@wizards.message(WeatherState.waiting_for_city)
+async def process_city(message: types.Message, state: FSMContext, weather: WeatherCache, reply: ReplyBuffer):
     city = message.text.strip()
     if not city:
         await message.answer("Вы не ввели город. Пожалуйста, введите название города.")
@@ -213,471 +350,846 @@ async def process_city(message: types.Message, state: FSMContext):
         await message.answer("Название города может содержать только буквы, пробелы или дефисы.")
         return
 
-    current_weather, forecast_text = await get_weather(city)
-    await message.answer(current_weather, reply_markup=main_menu())
+    current_weather, forecast_text = await weather.get(city)
+    reply.answer(current_weather, reply_markup=MAIN_MENU)
     if forecast_text:
-        await message.answer(forecast_text, reply_markup=main_menu())
+        reply.answer(forecast_text, reply_markup=MAIN_MENU)
+    await state.clear()
+
+# --- ЕЖЕДНЕВНЫЙ ПРОГНОЗ ---
+@menu.button("🌅 Утренний прогноз")
+async def digest_menu(message: types.Message, state: FSMContext, weather_subs: WeatherSubscriptionRepository):
+    subscription = await weather_subs.get(message.from_user.id)
+    if subscription:
+        city, send_at = subscription
+        await message.answer(f"Вы получаете прогноз для {city} каждый день в {send_at}.\n"
+                             f"Введите новый город или «Отписаться».", reply_markup=MAIN_MENU)
+    else:
+        await message.answer("Введите город для ежедневного прогноза:", reply_markup=MAIN_MENU)
+    await state.set_state(WeatherState.waiting_for_digest_city)
+
+@wizards.message(WeatherState.waiting_for_digest_city)
+async def process_digest_city(message: types.Message, state: FSMContext, weather: WeatherCache,
+                              weather_subs: WeatherSubscriptionRepository):
+    city = message.text.strip()
+    if city.casefold() == "отписаться":
+        await weather_subs.unsubscribe(message.from_user.id)
+        await message.answer("Ежедневный прогноз отключён.", reply_markup=MAIN_MENU)
+        await state.clear()
+        return
+    if not city or not all(c.isalpha() or c in " -—" for c in city):
+        await message.answer("Название города может содержать только буквы, пробелы или дефисы.")
+        return
+
+    # Город проверяется сразу, чтобы рассылка не упиралась в опечатки
+    current_weather, forecast_text = await weather.get(city)
+    if forecast_text is None:
+        await message.answer(current_weather)
+        return
+    await state.update_data(digest_city=city)
+    await message.answer("Во сколько присылать прогноз? Введите время в формате ЧЧ:ММ, например 07:30.")
+    await state.set_state(WeatherState.waiting_for_digest_time)
+
+@wizards.message(WeatherState.waiting_for_digest_time)
+async def process_digest_time(message: types.Message, state: FSMContext, digest: WeatherDigest,
+                              weather_subs: WeatherSubscriptionRepository):
+    send_at = parse_send_at(message.text)
+    if send_at is None:
+        await message.answer("Не понял время. Введите его в формате ЧЧ:ММ, например 07:30.")
+        return
+    data = await state.get_data()
+    city = data.get("digest_city")
+    await weather_subs.subscribe(message.from_user.id, city, send_at, next_occurrence(send_at, digest.now()))
+    await message.answer(f"Готово! Прогноз для {city} будет приходить каждый день в {send_at}.",
+                         reply_markup=MAIN_MENU)
     await state.clear()
 
 # --- ПЛАНЫ ---
-@dp.message(lambda message: message.text == "📅 Планы")
+@menu.button("📅 Планы")
 async def plan(message: types.Message, state: FSMContext):
-    plan_menu = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="➕Добавить план")],
-            [KeyboardButton(text="✏️Изменить план")],
-            [KeyboardButton(text="🗑️Удалить план")],
-            [KeyboardButton(text="📋Список планов")],
-            [KeyboardButton(text="🔙Назад")]
-        ],
-        resize_keyboard=True
-    )
-    await message.answer("Выберите действие с планами:", reply_markup=plan_menu)
-
-@dp.message(lambda message: message.text == "🔙Назад")
-async def back_to_main_menu(message: types.Message, state: FSMContext):
-    await message.answer("Выберите действие:", reply_markup=main_menu())
-    await state.clear()
+    await message.answer("Выберите действие с планами:", reply_markup=PLAN_MENU)
+
+DUE_HELP = ("Чтобы получить напоминание, добавьте срок через @: «купить хлеб @ завтра 9:00», "
+            "«отчёт @ 25.10 18:00» или «позвонить @ 19:30».")
+DUE_NOT_PARSED = "Срок после @ не распознан или уже прошёл, план сохранён целиком без напоминания."
+
+def local_now():
+    return datetime.now(LOCAL_TZ) if LOCAL_TZ else datetime.now().astimezone()
+
+def format_due(due_at):
+    return datetime.fromtimestamp(due_at, LOCAL_TZ).strftime("%d.%m.%Y %H:%M")
 
-@dp.message(lambda message: message.text == "➕Добавить план")
+@menu.button("➕Добавить план")
 async def add_plan(message: types.Message, state: FSMContext):
-    await message.answer("Введите текст для нового плана:", reply_markup=main_menu())
+    await message.answer(f"Введите текст для нового плана.\n{DUE_HELP}", reply_markup=MAIN_MENU)
     await state.set_state(PlanState.waiting_for_plan)
 
-@dp.message(PlanState.waiting_for_plan)
-async def process_plan(message: types.Message, state: FSMContext):
+@wizards.message(PlanState.waiting_for_plan)
+async def process_plan(message: types.Message, state: FSMContext, plans_repo: PlanRepository,
+                       reminders: ReminderScheduler, reply: ReplyBuffer):
     user_id = message.from_user.id
-    plan_text = message.text.strip()
+    text = (message.text or "").strip()
+    plan_text, when = split_due(text)
+    due = parse_due(when, local_now()) if when is not None else None
+    if when is not None and due is None:
+        # « @ » мог быть частью самого плана — сохраняем текст как есть
+        plan_text = text
     if not plan_text:
         await message.answer("Вы не ввели текст плана. Пожалуйста, попробуйте снова.")
         return
+    due_at = int(due.timestamp()) if due is not None else None
 
-    save_plan(user_id, plan_text)
-    await message.answer(f"Ваш план '{plan_text}' успешно добавлен.", reply_markup=main_menu())
+    plan_id = await plans_repo.add(user_id, plan_text, due_at)
+    if due_at is None:
+        note = f"\n{DUE_NOT_PARSED}" if when is not None else ""
+        reply.answer(f"Ваш план '{plan_text}' успешно добавлен.{note}", reply_markup=MAIN_MENU)
+    else:
+        reminders.schedule(plan_id, due_at)
+        reply.answer(f"Ваш план '{plan_text}' успешно добавлен, напоминание {format_due(due_at)}.",
+                     reply_markup=MAIN_MENU)
     await state.clear()
 
-@dp.message(lambda message: message.text == "✏️Изменить план")
+@menu.button("✏️Изменить план")
 async def edit_plan(message: types.Message, state: FSMContext):
-    await message.answer("Введите ID плана, который хотите изменить:", reply_markup=main_menu())
+    await message.answer("Введите ID плана, который хотите изменить:", reply_markup=MAIN_MENU)
     await state.set_state(PlanState.waiting_for_plan_edit)
 
-@dp.message(PlanState.waiting_for_plan_edit)
-async def process_plan_edit(message: types.Message, state: FSMContext):
+@wizards.message(PlanState.waiting_for_plan_edit)
+async def process_plan_edit(message: types.Message, state: FSMContext, plans_repo: PlanRepository,
+                            reply: ReplyBuffer):
     plan_id = message.text.strip()
     if not plan_id.isdigit():
-        await message.answer("ID плана должен быть числом. Попробуйте снова.", reply_markup=main_menu())
+        await message.answer("ID плана должен быть числом. Попробуйте снова.", reply_markup=MAIN_MENU)
         return
     plan_id = int(plan_id)
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                plan TEXT NOT NULL
-            )
-        ''')
-        cursor.execute("SELECT id, plan FROM plans WHERE id = ? AND user_id = ?", (plan_id, message.from_user.id))
-        plan = cursor.fetchone()
+    plan = await plans_repo.get(plan_id, message.from_user.id)
 
     if not plan:
         await message.answer(f"План с ID {plan_id} не найден. Пожалуйста, проверьте ID и попробуйте снова.",
-                             reply_markup=main_menu())
+                             reply_markup=MAIN_MENU)
         return
 
-    await message.answer(f"Текущий план: {plan[1]}\n\nВведите новый текст для плана:", reply_markup=main_menu())
+    due = f"\nНапоминание: {format_due(plan[2])}" if plan[2] is not None else ""
+    reply.answer(f"Текущий план: {plan[1]}{due}\n\nВведите новый текст для плана. Новый срок задаётся через @: "
+                 f"«купить хлеб @ завтра 9:00», «купить хлеб @ -» убирает напоминание. Чтобы только снять "
+                 f"напоминание и оставить текст, отправьте «-».", reply_markup=MAIN_MENU)
     await state.set_state(PlanState.waiting_for_new_plan)
     await state.update_data(plan_id=plan_id)
 
-@dp.message(PlanState.waiting_for_new_plan)
-async def process_new_plan(message: types.Message, state: FSMContext):
-    new_plan_text = message.text.strip()
-    if not new_plan_text:
-        await message.answer("Вы не ввели новый текст плана. Попробуйте снова.", reply_markup=main_menu())
+@wizards.message(PlanState.waiting_for_new_plan)
+async def process_new_plan(message: types.Message, state: FSMContext, plans_repo: PlanRepository,
+                           reminders: ReminderScheduler, reply: ReplyBuffer):
+    text = (message.text or "").strip()
+    # Без @ срок плана не меняется, «@ -» его снимает, а одно «-» снимает
+    # срок и оставляет прежний текст
+    keep_text = clears_due(text)
+    new_plan_text, when = ("", CLEAR_DUE[0]) if keep_text else split_due(text)
+    clear = when is not None and when.lower() in CLEAR_DUE
+    due = parse_due(when, local_now()) if when is not None and not clear else None
+    due_at, due_text, note = None, "", ""
+    if due is not None:
+        due_at = int(due.timestamp())
+        due_text = f", напоминание {format_due(due_at)}"
+    elif when is not None and not clear:
+        # « @ » мог быть частью самого плана — сохраняем текст как есть
+        new_plan_text, when, note = text, None, f"\n{DUE_NOT_PARSED}"
+    if not new_plan_text and not keep_text:
+        await message.answer("Вы не ввели новый текст плана. Попробуйте снова.", reply_markup=MAIN_MENU)
         return
 
     data = await state.get_data()
     plan_id = data.get("plan_id")
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                plan TEXT NOT NULL
-            )
-        ''')
-        cursor.execute("UPDATE plans SET plan = ? WHERE id = ? AND user_id = ?",
-                       (new_plan_text, plan_id, message.from_user.id))
-        conn.commit()
-
-    await message.answer(f"План с ID {plan_id} успешно обновлён на: '{new_plan_text}'.", reply_markup=main_menu())
+    if not keep_text:
+        await plans_repo.update(plan_id, message.from_user.id, new_plan_text)
+    if when is not None:
+        changed = await plans_repo.set_due(plan_id, message.from_user.id, due_at)
+        # Старая запись в куче планировщика станет неактуальной сама
+        if due_at is not None:
+            reminders.schedule(plan_id, due_at)
+        elif changed:
+            reminders.cancel(plan_id)
+            due_text = ", напоминание снято"
+        else:
+            due_text = ", напоминания у плана не было"
+
+    if keep_text:
+        reply.answer(f"Текст плана с ID {plan_id} не изменён{due_text}.", reply_markup=MAIN_MENU)
+    else:
+        reply.answer(f"План с ID {plan_id} успешно обновлён на: '{new_plan_text}'{due_text}.{note}",
+                     reply_markup=MAIN_MENU)
     await state.clear()
 
-@dp.message(lambda message: message.text == "🗑️Удалить план")
+@menu.button("🗑️Удалить план")
 async def delete_plan(message: types.Message, state: FSMContext):
-    await message.answer("Введите ID плана, который хотите удалить:", reply_markup=main_menu())
+    await message.answer("Введите ID плана, который хотите удалить:", reply_markup=MAIN_MENU)
     await state.set_state(PlanState.waiting_for_plan_delete)
 
-@dp.message(PlanState.waiting_for_plan_delete)
-async def process_plan_delete(message: types.Message, state: FSMContext):
+@wizards.message(PlanState.waiting_for_plan_delete)
+async def process_plan_delete(message: types.Message, state: FSMContext, plans_repo: PlanRepository,
+                              reminders: ReminderScheduler):
     plan_id = message.text.strip()
     if not plan_id.isdigit():
-        await message.answer("ID плана должен быть числом. Попробуйте снова.", reply_markup=main_menu())
+        await message.answer("ID плана должен быть числом. Попробуйте снова.", reply_markup=MAIN_MENU)
         return
     plan_id = int(plan_id)
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                plan TEXT NOT NULL
-            )
-        ''')
-        cursor.execute("DELETE FROM plans WHERE id = ? AND user_id = ?", (plan_id, message.from_user.id))
-        affected_rows = cursor.rowcount
-        conn.commit()
+    affected_rows = await plans_repo.delete(plan_id, message.from_user.id)
 
     if affected_rows > 0:
-        await message.answer(f"План с ID {plan_id} успешно удалён.", reply_markup=main_menu())
+        reminders.cancel(plan_id)
+        await message.answer(f"План с ID {plan_id} успешно удалён.", reply_markup=MAIN_MENU)
     else:
-        await message.answer(f"План с ID {plan_id} не найден.", reply_markup=main_menu())
+        await message.answer(f"План с ID {plan_id} не найден.", reply_markup=MAIN_MENU)
     await state.clear()
 
-@dp.message(lambda message: message.text == "📋Список планов")
-async def list_plans(message: types.Message, state: FSMContext):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                plan TEXT NOT NULL
-            )
-        ''')
-        cursor.execute("SELECT id, plan FROM plans WHERE user_id = ?", (message.from_user.id,))
-        plans = cursor.fetchall()
-
-    if not plans:
-        await message.answer("У вас пока нет планов.", reply_markup=main_menu())
+def render_plans_page(rows, title="Ваши планы:"):
+    # Длинные планы в списке обрезаются, чтобы страница укладывалась в 4096 символов
+    response = f"{title}\n"
+    for plan_id, plan_text, due_at in rows:
+        if len(plan_text) > PLAN_PREVIEW_LEN:
+            plan_text = plan_text[:PLAN_PREVIEW_LEN] + "…"
+        formatted_plan = "\n    ".join(plan_text.split(", "))
+        due = f" ⏰ {format_due(due_at)}" if due_at is not None else ""
+        response += f"ID: {plan_id}{due}\n    {formatted_plan}\n\n"
+    return response
+
+@menu.button("📋Список планов")
+async def list_plans(message: types.Message, state: FSMContext, plans_repo: PlanRepository):
+    rows, has_prev, has_next = await plans_repo.page(message.from_user.id, limit=PLANS_PAGE_SIZE)
+
+    if not rows:
+        await message.answer("У вас пока нет планов.", reply_markup=MAIN_MENU)
     else:
-        response = "Ваши планы:\n"
-        for plan in plans:
-            plan_items = plan[1].split(", ")
-            formatted_plan = "\n    ".join(plan_items)
-            response += f"ID: {plan[0]}\n    {formatted_plan}\n\n"
-        await message.answer(response, reply_markup=main_menu())
+        await message.answer(render_plans_page(rows), reply_markup=plans_page_keyboard(rows, has_prev, has_next))
+
+@dp.callback_query(PlansPage.filter())
+async def plans_page(callback: types.CallbackQuery, callback_data: PlansPage, plans_repo: PlanRepository):
+    rows, has_prev, has_next = await plans_repo.page(callback.from_user.id, after_id=callback_data.after,
+                                                     before_id=callback_data.before, limit=PLANS_PAGE_SIZE)
+    if not rows:
+        # Планы с этой стороны курсора удалены — начинаем с первой страницы
+        rows, has_prev, has_next = await plans_repo.page(callback.from_user.id, limit=PLANS_PAGE_SIZE)
+    if rows:
+        await callback.message.edit_text(render_plans_page(rows),
+                                         reply_markup=plans_page_keyboard(rows, has_prev, has_next))
+    else:
+        await callback.message.edit_text("У вас пока нет планов.")
+    await callback.answer()
+
+@menu.button("🔍Поиск плана")
+async def search_plan(message: types.Message, state: FSMContext):
+    await message.answer("Введите слова для поиска по планам (купи* — поиск по началу слова):", reply_markup=MAIN_MENU)
+    await state.set_state(PlanState.waiting_for_search)
+
+async def answer_search(message: types.Message, plans_repo: PlanRepository, text):
+    rows = await plans_repo.search(message.from_user.id, text, limit=PLANS_SEARCH_LIMIT)
+    if rows:
+        await message.answer(render_plans_page(rows, "Найденные планы:"), reply_markup=MAIN_MENU)
+    else:
+        await message.answer("Ничего не найдено.", reply_markup=MAIN_MENU)
+
+@dp.message(Command("search"))
+async def search_command(message: types.Message, state: FSMContext, plans_repo: PlanRepository):
+    text = message.text.partition(" ")[2].strip()
+    if not text:
+        await search_plan(message, state)
+        return
+    await state.clear()
+    await answer_search(message, plans_repo, text)
+
+@wizards.message(PlanState.waiting_for_search)
+async def process_search(message: types.Message, state: FSMContext, plans_repo: PlanRepository):
+    text = message.text.strip()
+    if not text:
+        await message.answer("Вы не ввели запрос. Попробуйте снова.")
+        return
+    await answer_search(message, plans_repo, text)
+    await state.clear()
+
+@menu.button("📥Импорт планов")
+async def import_plans_start(message: types.Message, state: FSMContext):
+    await message.answer("Пришлите файл CSV, JSON или TXT: один план на строку, "
+                         "в CSV — колонка plan или первая колонка.", reply_markup=MAIN_MENU)
+    await state.set_state(PlanState.waiting_for_import)
+
+@wizards.message(PlanState.waiting_for_import)
+async def process_import(message: types.Message, state: FSMContext, bot: Bot, plans_repo: PlanRepository):
+    document = message.document
+    if document is None:
+        await message.answer("Пришлите планы файлом CSV, JSON или TXT.")
+        return
+    fmt = import_format(document.file_name)
+    if fmt is None:
+        await message.answer(f"Поддерживаются файлы: {', '.join(IMPORT_FORMATS)}. Попробуйте снова.")
+        return
+    if document.file_size and document.file_size > PLANS_IMPORT_MAX_SIZE:
+        await message.answer(f"Файл больше {PLANS_IMPORT_MAX_SIZE // (1024 * 1024)} МБ.", reply_markup=MAIN_MENU)
+        await state.clear()
+        return
+    await state.clear()
+
+    status = await message.answer("Импорт начат…")
+    last_update = time.monotonic()
+
+    async def progress(imported):
+        nonlocal last_update
+        if time.monotonic() - last_update >= PLANS_IMPORT_PROGRESS_INTERVAL:
+            last_update = time.monotonic()
+            # Прогресс необязателен: ошибка правки не должна обрывать импорт
+            try:
+                await bot.edit_message_text(f"Импортировано планов: {imported}…",
+                                            chat_id=status.chat.id, message_id=status.message_id)
+            except TelegramAPIError as e:
+                logger.warning(f"Не удалось обновить прогресс импорта: {e}")
+
+    # Файл скачивается на диск кусками и разбирается потоково
+    with tempfile.TemporaryFile() as file:
+        await bot.download(document, destination=file)
+        imported, skipped, error = await import_plans(plans_repo, message.from_user.id, file, fmt,
+                                                      PLANS_IMPORT_BATCH, progress)
+
+    text = f"Импортировано планов: {imported}."
+    if skipped:
+        text += f" Пропущено слишком длинных: {skipped}."
+    if error:
+        text += f" Импорт остановлен из-за ошибки в файле: {error}"
+    await message.answer(text, reply_markup=MAIN_MENU)
+
+@menu.button("📤Экспорт планов")
+async def export_plans_file(message: types.Message, state: FSMContext, plans_repo: PlanRepository):
+    # Планы пишутся во временный файл постранично, Bot API получает его с диска
+    fd, path = tempfile.mkstemp(prefix="plans-", suffix=".csv")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8-sig", newline="") as file:
+            exported = await export_plans(plans_repo, message.from_user.id, file, PLANS_EXPORT_BATCH)
+        if exported:
+            await message.answer_document(types.FSInputFile(path, filename="plans.csv"),
+                                          caption=f"Планов: {exported}", reply_markup=MAIN_MENU)
+        else:
+            await message.answer("У вас пока нет планов.", reply_markup=MAIN_MENU)
+    finally:
+        os.remove(path)
 
 # --- GITHUB КОММИТЫ ---
-@dp.message(lambda message: message.text == "🐙 GitHub Коммиты")
+@menu.button("🐙 GitHub Коммиты")
 async def github_commits(message: types.Message, state: FSMContext):
     await message.answer("Введите имя владельца репозитория (например, torvalds):")
     await state.set_state(GitHubState.waiting_for_owner)
 
-@dp.message(GitHubState.waiting_for_owner)
+@wizards.message(GitHubState.waiting_for_owner)
 async def process_owner(message: types.Message, state: FSMContext):
     await state.update_data(owner=message.text.strip())
     await message.answer("Теперь введите название репозитория (например, linux):")
     await state.set_state(GitHubState.waiting_for_repo)
 
-@dp.message(GitHubState.waiting_for_repo)
-async def process_repo(message: types.Message, state: FSMContext):
+@wizards.message(GitHubState.waiting_for_repo)
+async def process_repo(message: types.Message, state: FSMContext, github: GitHubClient, reply: ReplyBuffer):
     data = await state.get_data()
     owner = data.get("owner")
     repo = message.text.strip()
-    url = f"https://api.github.com/repos/{owner}/{repo}/commits"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"}
     try:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            commits = response.json()
-            if commits:
-                commit_messages = "\n".join(
-                    [f"👤 {commit['commit']['author']['name']}: {commit['commit']['message']}" for commit in commits[:5]]
-                )
-                await message.answer(f"Последние коммиты в репозитории {owner}/{repo}:\n{commit_messages}")
+        status, commit_messages = await github.recent_commits(owner, repo)
+        if status == 200:
+            if commit_messages:
+                reply.answer(f"Последние коммиты в репозитории {owner}/{repo}:\n{commit_messages}\n\n"
+                             f"Получать новые коммиты: /watch {owner}/{repo}")
             else:
                 await message.answer("В этом репозитории пока нет коммитов.")
         else:
-            await message.answer(f"Ошибка: {response.status_code}. Проверьте имя владельца и репозитория.")
+            await message.answer(f"Ошибка: {status}. Проверьте имя владельца и репозитория.")
     except Exception as e:
         await message.answer(f"Произошла ошибка: {e}")
     await state.clear()
 
 
+@dp.message(Command("watch"))
+async def watch_repo(message: types.Message, github: GitHubClient, github_watches: GitHubWatchRepository):
+    repo = parse_repo(message.text.partition(" ")[2])
+    if repo is None:
+        await message.answer("Укажите репозиторий: /watch owner/repo")
+        return
+    if len(await github_watches.watched(message.from_user.id)) >= GITHUB_WATCH_LIMIT:
+        await message.answer(f"Можно следить не более чем за {GITHUB_WATCH_LIMIT} репозиториями.")
+        return
+    owner, name = repo.split("/", 1)
+    try:
+        status, _ = await github.recent_commits(owner, name)
+    except (CircuitOpenError, HostBusyError):
+        await message.answer("GitHub временно недоступен, попробуйте позже.")
+        return
+    if status != 200:
+        await message.answer(f"Ошибка: {status}. Проверьте имя владельца и репозитория.")
+        return
+    if await github_watches.watch(message.from_user.id, repo):
+        await message.answer(f"Буду присылать новые коммиты из {repo}.")
+    else:
+        await message.answer(f"Вы уже следите за {repo}.")
+
+@dp.message(Command("unwatch"))
+async def unwatch_repo(message: types.Message, github_watches: GitHubWatchRepository):
+    repo = parse_repo(message.text.partition(" ")[2])
+    if repo is None:
+        await message.answer("Укажите репозиторий: /unwatch owner/repo")
+        return
+    if await github_watches.unwatch(message.from_user.id, repo):
+        await message.answer(f"Больше не слежу за {repo}.")
+    else:
+        await message.answer(f"Вы не следите за {repo}.")
+
+@dp.message(Command("watching"))
+async def watching(message: types.Message, github_watches: GitHubWatchRepository):
+    repos = await github_watches.watched(message.from_user.id)
+    if repos:
+        await message.answer("Вы следите за репозиториями:\n" + "\n".join(repos))
+    else:
+        await message.answer("Вы пока не следите ни за одним репозиторием. Добавить: /watch owner/repo")
+
+
 # --- ТРЕВОГА ---
-@dp.message(lambda message: message.text == "🚨 Уведомления о тревогах")
-async def select_region(message: types.Message, state: FSMContext):
-    user_id = message.from_user.id
+async def send_oblasts(reply: ReplyBuffer, regions: RegionCatalog):
+    # Список дописывается к предыдущему ответу: клавиатура MAIN_MENU уже показана
+    try:
+        await regions.ensure_loaded()
+        reply.answer(regions.oblasts_codes, parse_mode="HTML")
+        reply.answer("Пожалуйста, введите область. Нажмите на область для копирования "
+                     "или сразу найдите свою громаду поиском.", reply_markup=REGION_SEARCH)
+    except Exception as e:
+        reply.answer(f"Ошибка при получении данных: {str(e)}")
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT region_id FROM users WHERE user_id = ?", (user_id,))
-    region = cursor.fetchone()
+@menu.button("🚨 Уведомления о тревогах")
+async def select_region(message: types.Message, state: FSMContext, regions: RegionCatalog, users: UserRepository,
+                        reply: ReplyBuffer):
+    region = await users.get_region(message.from_user.id)
 
     # Если регион найден, показываем кнопки для проверки тревоги
     if region:
         region_id = region[0]
-        alert_menu = ReplyKeyboardMarkup(
-            keyboard=[
-                [KeyboardButton(text="🔙 Назад")],
-                [KeyboardButton(text="🔔 Проверить сейчас")],
-                [KeyboardButton(text="✏️ Изменить регион")],
-            ],
-            resize_keyboard=True
-        )
-        await message.answer(f"Вы подписаны на уведомления о тревогах в регионе: {region_id}\nВыберите действие:", reply_markup=alert_menu)
+        reply.answer(f"Вы подписаны на уведомления о тревогах в регионе: {region_id}\nВыберите действие:", reply_markup=ALERT_MENU)
     else:
-        await message.answer("Вы не выбрали регион для уведомлений. Пожалуйста, введите регион.", reply_markup=main_menu())
-    
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=header) as response:
-                    if response.status == 200:
-                        data = await response.json()
-
-                        with open("data.json", "w", encoding="utf-8") as file:
-                            json.dump(data, file, indent=4, ensure_ascii=False)
-
-                        # Обходим все регионы
-                        if 'states' in data:
-                            regions_text = "\n\n".join(f"<code>{obl['regionName']}</code>" for obl in data['states'])
-                            await message.answer(regions_text, parse_mode="HTML", reply_markup=main_menu())
-                            await message.answer("Пожалуйста, введите область. Нажмите на область для копирования", reply_markup=main_menu())
-                        else:
-                            await message.answer("Ошибка: Данные о регионах отсутствуют.")
-                    else:
-                        await message.answer(f"Ошибка API: {response.status}")
-        except Exception as e:
-            await message.answer(f"Ошибка при получении данных: {str(e)}")
+        reply.answer("Вы не выбрали регион для уведомлений. Пожалуйста, введите регион.", reply_markup=MAIN_MENU)
+        await send_oblasts(reply, regions)
         await state.set_state(RegionState.waiting_for_obl)
 
-@dp.message(RegionState.waiting_for_obl)
-async def process_obl_input(message: types.Message, state: FSMContext):
+@dp.inline_query()
+async def region_inline_search(inline_query: types.InlineQuery, regions: RegionCatalog):
+    await regions.ensure_loaded()
+    results = [
+        types.InlineQueryResultArticle(
+            id=region.region_id,
+            title=region.name,
+            description=region_path(region) or None,
+            input_message_content=types.InputTextMessageContent(message_text=f"/region {region.region_id}"),
+        )
+        for region in regions.search(inline_query.query, REGION_SEARCH_LIMIT)
+    ]
+    await inline_query.answer(results, cache_time=300, is_personal=False)
+
+@dp.message(Command("region"))
+async def choose_region(message: types.Message, state: FSMContext, regions: RegionCatalog, users: UserRepository):
+    await regions.ensure_loaded()
+    region = regions.get(message.text.partition(" ")[2].strip())
+    if region is None:
+        await message.answer("Регион не найден. Воспользуйтесь поиском.", reply_markup=REGION_SEARCH)
+        return
+    await users.set_region(message.from_user.id, region.name, region.region_id)
+    await message.answer(f"Вы выбрали регион {region.name}. Информация сохранена в базе данных.", reply_markup=ALERT_MENU)
+    await state.clear()
+
+@wizards.message(RegionState.waiting_for_obl)
+async def process_obl_input(message: types.Message, state: FSMContext, regions: RegionCatalog, users: UserRepository,
+                            reply: ReplyBuffer):
     obl = message.text.strip()
+    oblast = regions.oblast(obl)
+    if not oblast:
+        await message.answer(f"Область {obl} не найдена. Нажмите на область из списка для копирования.", reply_markup=MAIN_MENU)
+        return
 
     await state.update_data(obl=obl)
+    if not oblast.children:
+        # Сохраняем пользователя в базе данных, если у области нет районов
+        await users.set_region(message.from_user.id, obl, oblast.region_id)
+        await message.answer(f"Вы выбрали регион {obl}. Информация сохранена в базе данных.", reply_markup=MAIN_MENU)
+        await state.clear()
+        return
 
-    with open('data.json', 'r', encoding='utf-8') as file:
-        data = json.load(file)
-
-    try:
-        if 'states' in data:
-            for oblast in data['states']:
-                if oblast['regionName'] == obl:
-                    if 'regionChildIds' in oblast and isinstance(oblast['regionChildIds'], list):
-                        if not oblast['regionChildIds']:
-                            # Сохраняем пользователя в базе данных, если regionChildIds пуст
-                            user_id = message.from_user.id
-                            region_name = obl
-                            reg_id = oblast['regionId']
-                            conn = get_db_connection()
-                            cursor = conn.cursor()
-                            cursor.execute("INSERT OR REPLACE INTO users (user_id, region_id, reg_id) VALUES (?, ?, ?)", (user_id, region_name, reg_id))
-                            conn.commit()
-                            conn.close()
-                            await message.answer(f"Вы выбрали регион {obl}. Информация сохранена в базе данных.", reply_markup=main_menu())
-                            return
-                        # Если regionChildIds не пуст, продолжаем обрабатывать дальше
-                        regions_text = "\n\n".join(f"<code>{region['regionName']}</code>" for region in oblast['regionChildIds'] if isinstance(region, dict))
-                        await message.answer(regions_text, parse_mode="HTML", reply_markup=main_menu())
-                        await message.answer("Пожалуйста, введите регион. Нажмите на регион для копирования", reply_markup=main_menu())
-                        break
-        else:
-            await message.answer("Ошибка: Данные о регионах отсутствуют.")
-    except Exception as e:
-        await message.answer(f"Ошибка при получении данных: {str(e)}")
+    reply.answer(oblast.codes, parse_mode="HTML", reply_markup=MAIN_MENU)
+    reply.answer("Пожалуйста, введите регион. Нажмите на регион для копирования", reply_markup=MAIN_MENU)
     await state.set_state(RegionState.waiting_for_regi)
 
 
-@dp.message(RegionState.waiting_for_regi)
-async def process_regi_input(message: types.Message, state: FSMContext):
+@wizards.message(RegionState.waiting_for_regi)
+async def process_regi_input(message: types.Message, state: FSMContext, regions: RegionCatalog, users: UserRepository,
+                             reply: ReplyBuffer):
     rajon = message.text.strip()
 
     data_state = await state.get_data()
-    obl = data_state.get('obl')
-
-    await state.update_data(obl=obl, rajon=rajon)
+    oblast = regions.oblast(data_state.get('obl'))
+    sub = oblast.child(rajon) if oblast else None
+    if not sub:
+        await message.answer(f"Регион {rajon} не найден. Нажмите на регион из списка для копирования.", reply_markup=MAIN_MENU)
+        return
 
-    with open('data.json', 'r', encoding='utf-8') as file:
-        data = json.load(file)
+    await state.update_data(rajon=rajon)
+    if not sub.children:
+        # Сохраняем пользователя в базе данных, если у района нет громад
+        await users.set_region(message.from_user.id, rajon, sub.region_id)
+        await message.answer(f"Вы выбрали регион {rajon}. Информация сохранена в базе данных.", reply_markup=MAIN_MENU)
+        await state.clear()
+        return
 
-    try:
-        if 'states' in data:
-            for oblast in data['states']:
-                if oblast['regionName'] == obl:
-                    if 'regionChildIds' in oblast and isinstance(oblast['regionChildIds'], list):
-                        for sub in oblast['regionChildIds']:
-                            if sub['regionName'] == rajon:
-                                if 'regionChildIds' in sub and isinstance(sub['regionChildIds'], list):
-                                    if not sub['regionChildIds']:
-                                        # Сохраняем пользователя в базе данных, если regionChildIds пуст
-                                        user_id = message.from_user.id
-                                        region_name = rajon
-                                        reg_id = sub['regionId']
-                                        conn = get_db_connection()
-                                        cursor = conn.cursor()
-                                        cursor.execute("INSERT OR REPLACE INTO users (user_id, region_id, reg_id) VALUES (?, ?, ?)", (user_id, region_name, reg_id))
-                                        conn.commit()
-                                        conn.close()
-                                        await message.answer(f"Вы выбрали регион {rajon}. Информация сохранена в базе данных.", reply_markup=main_menu())
-                                        return
-                                    regions_text = "\n\n".join(f"<code>{city['regionName']}</code>" for city in sub['regionChildIds'] if isinstance(city, dict))
-                                    await message.answer(regions_text, parse_mode="HTML", reply_markup=main_menu())
-                                    await message.answer("Пожалуйста, введите свой город. Нажмите на город для копирования", reply_markup=main_menu())
-                        break
-        else:
-            await message.answer("Ошибка: Данные о регионах отсутствуют.")
-    except Exception as e:
-        await message.answer(f"Ошибка при получении данных: {str(e)}")
+    reply.answer(sub.codes, parse_mode="HTML", reply_markup=MAIN_MENU)
+    reply.answer("Пожалуйста, введите свой город. Нажмите на город для копирования", reply_markup=MAIN_MENU)
     await state.set_state(RegionState.waiting_for_city)
 
 
-@dp.message(RegionState.waiting_for_city)
-async def process_city_input(message: types.Message, state: FSMContext):
+@wizards.message(RegionState.waiting_for_city)
+async def process_city_input(message: types.Message, state: FSMContext, regions: RegionCatalog, users: UserRepository):
     citys = message.text.strip()
     data_state = await state.get_data()
-    obl = data_state.get('obl')
-    rajon = data_state.get('rajon')
-
-    await state.update_data(citys=citys)
-
-    with open('data.json', 'r', encoding='utf-8') as file:
-        data = json.load(file)
-    try:
-        if 'states' in data:
-            for oblast in data['states']:
-                if oblast['regionName'] == obl:
-                    if 'regionChildIds' in oblast and isinstance(oblast['regionChildIds'], list):
-                        for sub in oblast['regionChildIds']:
-                            if sub['regionName'] == rajon:
-                                if 'regionChildIds' in sub and isinstance(sub['regionChildIds'], list):
-                                    for city in sub['regionChildIds']:
-                                        if city['regionName'] == citys:
-                                            if 'regionChildIds' not in city or not city['regionChildIds']:
-                                                user_id = message.from_user.id
-                                                region_name = citys
-                                                reg_id = city['regionId']
-                                                conn = get_db_connection()
-                                                cursor = conn.cursor()
-                                                cursor.execute("INSERT OR REPLACE INTO users (user_id, region_id, reg_id) VALUES (?, ?, ?)", (user_id, region_name, reg_id))
-                                                conn.commit()
-                                                conn.close()
-                                                await message.answer(f"Вы выбрали город {citys}. Информация сохранена в базе данных.", reply_markup=main_menu())
-                                                await state.clear()
-                                                return
-                                            await message.answer(f"<code>{city['regionName']}</code>")
-                                            break
-                                else:
-                                    # Если у района нет дочерних регионов, сохраняем район как конечный выбор
-                                    user_id = message.from_user.id
-                                    region_name = rajon
-                                    reg_id = sub['regionId']
-                                    conn = get_db_connection()
-                                    cursor = conn.cursor()
-                                    cursor.execute("INSERT OR REPLACE INTO users (user_id, region_id, reg_id) VALUES (?, ?, ?)", (user_id, region_name, reg_id))
-                                    conn.commit()
-                                    conn.close()
-                                    await message.answer(f"У региона {rajon} нет городов. Вы выбрали регион {rajon}. Информация сохранена в базе данных.", reply_markup=main_menu())
-                                    await state.clear()  # Очищаем состояние
-                                    return
-                    break
-        else:
-            await message.answer("Ошибка: Данные о регионах отсутствуют.")
-    except Exception as e:
-        await message.answer(f"Ошибка при получении данных: {str(e)}")
+    oblast = regions.oblast(data_state.get('obl'))
+    sub = oblast.child(data_state.get('rajon')) if oblast else None
+    city = sub.child(citys) if sub else None
+    if not city:
+        await message.answer(f"Город {citys} не найден. Нажмите на город из списка для копирования.", reply_markup=MAIN_MENU)
+        return
 
-@dp.message(lambda message: message.text == "✏️ Изменить регион")
-async def change_region(message: types.Message, state: FSMContext):
-    user_id = message.from_user.id
+    await users.set_region(message.from_user.id, citys, city.region_id)
+    await message.answer(f"Вы выбрали город {citys}. Информация сохранена в базе данных.", reply_markup=MAIN_MENU)
+    await state.clear()
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET region_id = NULL, reg_id = NULL WHERE user_id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+@menu.button("✏️ Изменить регион")
+async def change_region(message: types.Message, state: FSMContext, regions: RegionCatalog, users: UserRepository,
+                        reply: ReplyBuffer):
+    await users.reset_region(message.from_user.id)
 
     await state.clear()
-    await message.answer("Вы сбросили регион. Пожалуйста, выберите новый регион.", reply_markup=main_menu())
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=header) as response:
-                if response.status == 200:
-                    data = await response.json()
-
-                    with open("data.json", "w", encoding="utf-8") as file:
-                        json.dump(data, file, indent=4, ensure_ascii=False)
-
-                    # Обходим все регионы
-                    if 'states' in data:
-                        regions_text = "\n\n".join(f"<code>{obl['regionName']}</code>" for obl in data['states'])
-                        await message.answer(regions_text, parse_mode="HTML", reply_markup=main_menu())
-                        await message.answer("Пожалуйста, введите область. Нажмите на область для копирования", reply_markup=main_menu())
-                    else:
-                        await message.answer("Ошибка: Данные о регионах отсутствуют.")
-                else:
-                    await message.answer(f"Ошибка API: {response.status}")
-    except Exception as e:
-        await message.answer(f"Ошибка при получении данных: {str(e)}")
+    reply.answer("Вы сбросили регион. Пожалуйста, выберите новый регион.", reply_markup=MAIN_MENU)
+    await send_oblasts(reply, regions)
 
     # Устанавливаем состояние для ожидания ввода области
     await state.set_state(RegionState.waiting_for_obl)
 
 
 # --- КНОПКА ПРОВЕРИТЬ СЕЙЧАС ---"
-@dp.message(lambda message: message.text == "🔔 Проверить сейчас")
-async def check_alert_now(message: types.Message, state: FSMContext):
-    user_id = message.from_user.id
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT reg_id FROM users WHERE user_id = ?", (user_id,))
-    reg_id = cursor.fetchone()
-
-    if reg_id:
-        reg_id = reg_id[0]
+@menu.button("🔔 Проверить сейчас")
+async def check_alert_now(message: types.Message, state: FSMContext, alert_snapshot: AlertSnapshot,
+                          users: UserRepository, reply: ReplyBuffer):
+    region = await users.get_region(message.from_user.id)
+    reg_id = region[1] if region else None
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url_alert, headers=header) as response:
-                if response.status == 200:
-                    data = await response.json()
-
-                    with open("data_alert.json", "w", encoding="utf-8") as file:
-                        json.dump(data, file, indent=4, ensure_ascii=False)
-
-                    # Обходим все регионы
-                    for region in data:
-                        if region["regionId"] == str(reg_id):
-                            if region["activeAlerts"]:
-                                for alert in region["activeAlerts"]:
-                                    await message.answer(f"{alert['type']}")
-                            else:
-                                await message.answer("Нет тревоги")
-                            return
-
-                    await message.answer("Нет тревоги")
-                else:
-                    await message.answer(f"Ошибка API: {response.status}")
+        # Поиск по словарю в общем снимке вместо загрузки всего списка на каждое нажатие
+        alert_types = await alert_snapshot.region(reg_id)
+        if alert_types:
+            for alert_type in sorted(alert_types):
+                reply.answer(alert_type)
+        else:
+            reply.answer("Нет тревоги")
+    except (CircuitOpenError, HostBusyError):
+        await message.answer("Сервис тревог временно недоступен, попробуйте позже.")
     except Exception as e:
         await message.answer(f"Ошибка при получении данных: {str(e)}")
 
+# --- ИСТОРИЯ ТРЕВОГ ---
+HISTORY_UNITS = {"h": 1, "ч": 1, "d": 24, "д": 24}
+
+def parse_history_period(text):
+    # «24h», «7d», «12ч», «3д» -> часы; None, если не разобрали
+    match = re.fullmatch(r"(\d{1,4})\s*([hdчд])", text.strip().lower())
+    if not match:
+        return None
+    return min(int(match.group(1)) * HISTORY_UNITS[match.group(2)], ALERT_HISTORY_RETENTION_DAYS * 24)
+
+def format_duration(seconds):
+    minutes = max(1, round(seconds / 60))
+    if minutes < 60:
+        return f"{minutes} мин"
+    return f"{minutes // 60} ч {minutes % 60:02d} мин"
+
+def render_alert_history(region_name, rows, hours, now):
+    period = ALERT_HISTORY_PERIODS.get(hours) or (f"{hours // 24} дн." if hours % 24 == 0 else f"{hours} ч")
+    if not rows:
+        return f"В регионе {region_name} за {period} тревог не было."
+    lines = [f"Тревоги в регионе {region_name} за {period}:"]
+    for alert_type, started_at, ended_at in rows:
+        start = datetime.fromtimestamp(started_at, LOCAL_TZ)
+        if ended_at is None:
+            end_text, duration = "сейчас", now - started_at
+        else:
+            end = datetime.fromtimestamp(ended_at, LOCAL_TZ)
+            end_text = end.strftime("%H:%M" if end.date() == start.date() else "%d.%m %H:%M")
+            duration = ended_at - started_at
+        lines.append(f"🚨 {alert_type}: {start:%d.%m %H:%M} – {end_text} ({format_duration(duration)})")
+    if len(rows) >= ALERT_HISTORY_LIMIT:
+        lines.append(f"Показаны последние {ALERT_HISTORY_LIMIT}.")
+    return "\n".join(lines)
+
+async def alert_history_text(user_id, hours, users: UserRepository, alert_history: AlertHistoryRepository):
+    # Отвечает из истории в БД, без запроса к API тревог
+    region = await users.get_region(user_id)
+    if region is None:
+        return "Вы не выбрали регион для уведомлений."
+    now = int(time.time())
+    rows = await alert_history.region_history(str(region[1]), now - hours * 3600, ALERT_HISTORY_LIMIT)
+    return render_alert_history(region[0], rows, hours, now)
+
+@menu.button("📜 История тревог")
+async def alert_history_menu(message: types.Message, users: UserRepository, alert_history: AlertHistoryRepository):
+    text = await alert_history_text(message.from_user.id, 24, users, alert_history)
+    await message.answer(text, reply_markup=alert_history_keyboard(24))
+
+@dp.message(Command("alerts"))
+async def alert_history_command(message: types.Message, users: UserRepository,
+                                alert_history: AlertHistoryRepository, reply: ReplyBuffer):
+    argument = message.text.partition(" ")[2]
+    hours = parse_history_period(argument) if argument.strip() else 24
+    if hours is None:
+        reply.answer("Укажите период: /alerts 24h или /alerts 7d")
+        return
+    reply.answer(await alert_history_text(message.from_user.id, hours, users, alert_history))
+
+@dp.callback_query(AlertHistoryPeriod.filter())
+async def alert_history_period(callback: types.CallbackQuery, callback_data: AlertHistoryPeriod,
+                               users: UserRepository, alert_history: AlertHistoryRepository):
+    hours = callback_data.hours
+    text = await alert_history_text(callback.from_user.id, hours, users, alert_history)
+    if text != callback.message.text:
+        await callback.message.edit_text(text, reply_markup=alert_history_keyboard(hours))
+    await callback.answer()
+
 # --- КНОПКА НАЗАД ---"
-@dp.message(lambda message: message.text == "🔙 Назад")
+@menu.button("🔙Назад", "🔙 Назад")
 async def back_to_main_menu(message: types.Message, state: FSMContext):
     await state.clear()  # Сбрасываем текущее состояние
-    await message.answer("Выберите действие:", reply_markup=main_menu())
+    await message.answer("Выберите действие:", reply_markup=MAIN_MENU)
 
 # --- ЗАПУСК БОТА ---
-async def main():
-    create_db()
-    greate_db_user()
+def start_background(dispatcher: Dispatcher, coro):
+    task = asyncio.create_task(coro)
+    dispatcher["resources"].callback(task.cancel)
+    return task
+
+async def on_startup(dispatcher: Dispatcher, bot: Bot):
+    # Общие ресурсы живут от startup до shutdown и одинаковы для polling и webhook
+    resources = AsyncExitStack()
+    dispatcher["resources"] = resources
+
+    await dispatcher.storage.start()
+    resources.push_async_callback(dispatcher.storage.close)
+
+    plans_db = Database(DB_PATH, metrics)
+    await plans_db.connect(PLANS_SCHEMA)
+    resources.push_async_callback(plans_db.close)
+    logger.info("Таблица 'plans' успешно создана или уже существует")
+    plans_repo = PlanRepository(plans_db)
+    await plans_repo.init_search()
+    await plans_repo.init_reminders()
+    dispatcher["plans_repo"] = plans_repo
+    users_db = Database(USERS_DB_PATH, metrics)
+    await users_db.connect(USERS_SCHEMA + WEATHER_SUBSCRIPTIONS_SCHEMA + GITHUB_WATCH_SCHEMA + ALERT_HISTORY_SCHEMA)
+    resources.push_async_callback(users_db.close)
+    users = UserRepository(users_db)
+    dispatcher["users"] = users
+    dispatcher["weather_subs"] = WeatherSubscriptionRepository(users_db)
+    dispatcher["github_watches"] = GitHubWatchRepository(users_db)
+    dispatcher["alert_history"] = AlertHistoryRepository(users_db)
+
+    http = HttpClient(limit=HTTP_LIMIT, limit_per_host=HTTP_LIMIT_PER_HOST,
+                      ttl_dns_cache=HTTP_DNS_TTL, keepalive_timeout=HTTP_KEEPALIVE, metrics=metrics,
+                      connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                      total_timeout=HTTP_TOTAL_TIMEOUT, queue_timeout=HTTP_QUEUE_TIMEOUT,
+                      retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, backoff_max=HTTP_BACKOFF_MAX,
+                      breaker_failures=HTTP_BREAKER_FAILURES, breaker_reset=HTTP_BREAKER_RESET)
+    await http.start()
+    resources.push_async_callback(http.close)
+    dispatcher["http"] = http
+    dispatcher["weather"] = WeatherCache(weather_fetcher(http), ttl=WEATHER_CACHE_TTL,
+                                         stale_ttl=WEATHER_CACHE_STALE_TTL, max_size=WEATHER_CACHE_SIZE)
+    dispatcher["github"] = GitHubClient(http, GITHUB_TOKEN, base_url=GITHUB_API_URL,
+                                        cache_size=GITHUB_CACHE_SIZE, ttl=GITHUB_CACHE_TTL)
+    alert_snapshot = AlertSnapshot(http, url_alert, header, status_url=url_alert_status,
+                                   max_age=ALERTS_SNAPSHOT_MAX_AGE)
+    dispatcher["alert_snapshot"] = alert_snapshot
+    if HTTP_STATS_INTERVAL:
+        start_background(dispatcher, http.report_stats(HTTP_STATS_INTERVAL))
+
+    regions = RegionCatalog(http, url, header, refresh_interval=REGIONS_REFRESH_INTERVAL)
+    try:
+        await regions.load()
+    except Exception as e:
+        logger.error(f"Не удалось загрузить каталог регионов: {e}")
+    dispatcher["regions"] = regions
+    start_background(dispatcher, regions.refresh_forever())
+
+    # Лимит Bot API общий на бота, поэтому воркеры делят его поровну
+    send_rate = SEND_RATE / WORKERS if BOT_MODE == "worker" and WORKERS else SEND_RATE
+    send_queue = SendQueue(bot, rate=send_rate, chat_interval=SEND_CHAT_INTERVAL, concurrency=SEND_CONCURRENCY)
+    send_queue.start()
+    resources.push_async_callback(send_queue.stop)
+    dispatcher["send_queue"] = send_queue
+
+    async def notify_user(user_id, text):
+        await send_queue.put(user_id, text, priority=PRIORITY_ALERT)
+
+    alert_poller = AlertPoller(alert_snapshot, users, notify_user, interval=ALERTS_POLL_INTERVAL,
+                               history=dispatcher["alert_history"], retention=ALERT_HISTORY_RETENTION_DAYS * 86400)
+
+    digest = WeatherDigest(dispatcher["weather_subs"], dispatcher["weather"], send_queue, interval=DIGEST_INTERVAL,
+                           batch_size=DIGEST_BATCH, concurrency=DIGEST_CONCURRENCY,
+                           tz=LOCAL_TZ)
+    dispatcher["digest"] = digest
+
+    async def notify_commits(user_id, text):
+        await send_queue.put(user_id, text, priority=PRIORITY_NORMAL)
+
+    github_watcher = GitHubWatcher(dispatcher["github"], dispatcher["github_watches"], notify_commits,
+                                   interval=GITHUB_WATCH_INTERVAL)
+
+    # Напоминания не фоновая задача одного экземпляра: каждый воркер ведёт
+    # планы своих пользователей, потому что их правки приходят именно к нему
+    owns = None
+    if BOT_MODE == "worker" and WORKERS:
+        def owns(user_id):
+            return jump_hash(user_id, WORKERS) == WORKER_INDEX
+
+    async def notify_reminder(user_id, text):
+        await send_queue.put(user_id, text, priority=PRIORITY_NORMAL)
+
+    reminders = ReminderScheduler(plans_repo, notify_reminder, owns=owns, batch_size=REMINDERS_BATCH)
+    await reminders.load()
+    dispatcher["reminders"] = reminders
+    start_background(dispatcher, reminders.run_forever())
+    if RUN_BACKGROUND_JOBS:
+        start_background(dispatcher, alert_poller.run_forever())
+        start_background(dispatcher, digest.run_forever())
+        start_background(dispatcher, github_watcher.run_forever())
+
+    if metrics is not None:
+        metrics.add_collector("http", http.stats)
+        metrics.add_labeled_collector("upstream", "host", http.host_stats)
+        metrics.add_collector("weather_cache", dispatcher["weather"].stats)
+        metrics.add_collector("github", dispatcher["github"].stats)
+        metrics.add_collector("send_queue", send_queue.stats)
+        metrics.add_collector("alerts", alert_poller.stats)
+        metrics.add_collector("alert_snapshot", alert_snapshot.stats)
+        metrics.add_collector("replies", replies.stats)
+        if throttle is not None:
+            metrics.add_collector("throttle", throttle.stats)
+            metrics.add_labeled_collector("throttle_feature", "feature", throttle.feature_stats)
+        metrics.add_collector("digest", digest.stats)
+        metrics.add_collector("github_watcher", github_watcher.stats)
+        metrics.add_collector("reminders", reminders.stats)
+        metrics.add_collector("fsm", dispatcher.storage.stats)
+        if METRICS_PORT:
+            # У каждого воркера свой порт метрик: METRICS_PORT + номер воркера
+            metrics_port = METRICS_PORT + WORKER_INDEX if BOT_MODE == "worker" else METRICS_PORT
+            metrics_runner = await metrics.serve(METRICS_HOST, metrics_port)
+            resources.push_async_callback(metrics_runner.cleanup)
     logger.info("Бот запущен")
-    await dp.start_polling(bot)
+
+async def on_shutdown(dispatcher: Dispatcher):
+    # Закрываем в обратном порядке: фоновые задачи, очередь, HTTP, БД
+    await dispatcher["resources"].aclose()
+    logger.info("Бот остановлен")
+
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
+async def wait_for_stop():
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: остаётся KeyboardInterrupt
+    await stop.wait()
+
+async def serve_app(app, host, port):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+async def run_webhook():
+    app = web.Application()
+    # handle_in_background: Telegram сразу получает 200, апдейт обрабатывается задачей
+    SimpleRequestHandler(dispatcher=dp, bot=bot, handle_in_background=True,
+                         secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = await serve_app(app, WEBAPP_HOST, WEBAPP_PORT)
+    if WEBHOOK_URL:
+        await bot.set_webhook(f"{WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET,
+                              allowed_updates=dp.resolve_used_update_types())
+    logger.info(f"Webhook слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+    try:
+        await wait_for_stop()
+    finally:
+        await runner.cleanup()
+
+async def run_worker():
+    # Ответ отдаётся после обработки: так входной процесс сохраняет порядок
+    # апдейтов одного пользователя
+    async def health(request):
+        return web.Response(text="ok")
+
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, handle_in_background=False,
+                         secret_token=WORKER_SECRET or None).register(app, path="/update")
+    app.router.add_get("/health", health)
+    setup_application(app, dp, bot=bot)
+
+    runner = await serve_app(app, "127.0.0.1", WORKER_PORT)
+    logger.info(f"Воркер {WORKER_INDEX} слушает 127.0.0.1:{WORKER_PORT}")
+    try:
+        await wait_for_stop()
+    finally:
+        await runner.cleanup()
+
+async def run_ingress():
+    secret = secrets.token_urlsafe(32)
+    ingress = ShardedIngress(make_workers(WORKERS, WORKER_BASE_PORT, secret, os.path.abspath(__file__)), secret)
+    await ingress.start()
+    logger.info(f"Запущено воркеров: {WORKERS}")
+    try:
+        if BOT_MODE == "webhook":
+            app = web.Application()
+            app.router.add_post(WEBHOOK_PATH, ingress.webhook_handler(WEBHOOK_SECRET))
+            runner = await serve_app(app, WEBAPP_HOST, WEBAPP_PORT)
+            if WEBHOOK_URL:
+                await bot.set_webhook(f"{WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET,
+                                      allowed_updates=dp.resolve_used_update_types())
+            try:
+                await wait_for_stop()
+            finally:
+                await runner.cleanup()
+        else:
+            await bot.delete_webhook()
+            polling = asyncio.create_task(ingress.poll(bot, dp.resolve_used_update_types()))
+            try:
+                await wait_for_stop()
+            finally:
+                polling.cancel()
+    finally:
+        await ingress.close()
+        await bot.session.close()
+
+async def main():
+    # Без секрета любой, кто достучится до WEBAPP_HOST:WEBAPP_PORT, пришлёт
+    # апдейт от имени любого пользователя
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+        raise SystemExit("Для BOT_MODE=webhook задайте WEBHOOK_SECRET (A-Z, a-z, 0-9, _ и -, до 256 символов)")
+    if BOT_MODE == "worker":
+        await run_worker()
+    elif WORKERS:
+        await run_ingress()
+    elif BOT_MODE == "webhook":
+        await run_webhook()
+    else:
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
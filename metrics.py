@@ -0,0 +1,138 @@
+import logging
+import time
+from bisect import bisect_left
+
+from aiogram import BaseMiddleware
+from aiohttp import web
+
+from router import handler_name
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм в секундах
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Histogram:
+    __slots__ = ("name", "help", "labels", "series")
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        # значения меток -> [счётчики по корзинам..., +Inf, сумма]
+        self.series = {}
+
+    def observe(self, label_values, value):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(BUCKETS) + 2)
+        series[bisect_left(BUCKETS, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, "+Inf"), series):
+                cumulative += count
+                labels = render_labels((*self.labels, "le"), (*label_values, bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = render_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# --- МЕТРИКИ ---
+class Metrics:
+    # Гистограммы задержек обработчиков, внешних API и запросов SQLite плюс
+    # снимки stats() подсистем. Отдаются в текстовом формате Prometheus.
+    def __init__(self):
+        self.handlers = Histogram("bot_handler_seconds", "Время обработки апдейта", ("handler", "state"))
+        self.http = Histogram("bot_http_request_seconds", "Запросы к внешним API", ("host", "status"))
+        self.sqlite = Histogram("bot_sqlite_query_seconds", "Запросы к SQLite", ("db", "statement"))
+        self._collectors = {}
+        self._labeled_collectors = {}
+
+    def add_collector(self, prefix, stats):
+        # stats() -> dict; числовые значения отдаются как gauge bot_<prefix>_<ключ>
+        self._collectors[prefix] = stats
+
+    def add_labeled_collector(self, prefix, label, stats):
+        # stats() -> {значение метки: dict}; gauge bot_<prefix>_<ключ>{<label>="значение"}
+        self._labeled_collectors[prefix] = (label, stats)
+
+    def render(self):
+        lines = []
+        for histogram in (self.handlers, self.http, self.sqlite):
+            lines.extend(histogram.render())
+        for prefix, stats in self._collectors.items():
+            try:
+                values = stats()
+            except Exception as e:
+                logger.error(f"Ошибка сбора метрик {prefix}: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE bot_{prefix}_{key} gauge")
+                    lines.append(f"bot_{prefix}_{key} {value}")
+        for prefix, (label, stats) in self._labeled_collectors.items():
+            try:
+                groups = stats()
+            except Exception as e:
+                logger.error(f"Ошибка сбора метрик {prefix}: {e}")
+                continue
+            series = {}
+            for label_value, values in groups.items():
+                labels = render_labels((label,), (label_value,))
+                for key, value in values.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        series.setdefault(key, []).append(f"bot_{prefix}_{key}{labels} {value}")
+            for key, key_lines in series.items():
+                lines.append(f"# TYPE bot_{prefix}_{key} gauge")
+                lines.extend(key_lines)
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host, port):
+        async def handle(request):
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8",
+                                headers={"X-Content-Type-Options": "nosniff"})
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+        return runner
+
+
+class MetricsMiddleware(BaseMiddleware):
+    # Внутренний middleware: к этому моменту фильтры уже выбрали обработчик
+    def __init__(self, metrics, text_router=None):
+        self.metrics = metrics
+        self.text_router = text_router
+
+    def handler_name(self, event, data):
+        return handler_name(event, data, self.text_router)
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.metrics.handlers.observe(
+                (self.handler_name(event, data), data.get("raw_state") or ""),
+                time.perf_counter() - started,
+            )
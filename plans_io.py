@@ -0,0 +1,163 @@
+import asyncio
+import codecs
+import csv
+import io
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "json", "txt")
+MAX_PLAN_LEN = 4096
+READ_CHUNK = 64 * 1024
+# Элемент JSON длиннее этого не может быть планом даже с экранированием;
+# на нём разбор останавливается, а не дочитывает файл в буфер целиком
+MAX_JSON_ITEM = 4 * READ_CHUNK
+JSON_SEPARATORS = " \t\r\n,"
+
+
+def import_format(file_name):
+    extension = os.path.splitext(file_name or "")[1].lower().lstrip(".")
+    if extension in ("jsonl", "ndjson"):
+        return "json"
+    return extension if extension in IMPORT_FORMATS else None
+
+
+# --- ЧТЕНИЕ ---
+def text_stream(file):
+    # utf-8-sig убирает BOM, который добавляет Excel при сохранении CSV
+    return io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+
+
+def iter_txt(file):
+    for line in text_stream(file):
+        yield line
+
+
+def iter_csv(file):
+    # Если первая строка — заголовок с колонкой plan, берём её, иначе первую колонку
+    reader = csv.reader(text_stream(file))
+    column = 0
+    for index, row in enumerate(reader):
+        if not row:
+            continue
+        if index == 0:
+            header = [cell.strip().lower() for cell in row]
+            if "plan" in header:
+                column = header.index("plan")
+                continue
+        if column < len(row):
+            yield row[column]
+
+
+def json_plan(value):
+    if isinstance(value, dict):
+        value = value.get("plan")
+    return value if isinstance(value, str) else None
+
+
+def iter_json(file):
+    # Понимает массив JSON и JSON Lines. Элементы разбираются по одному через
+    # raw_decode, поэтому в памяти держится только буфер чтения. Вне массива
+    # каждое значение должно быть планом: иначе объект вроде {"plans": [...]}
+    # молча дал бы 0 планов.
+    decoder = json.JSONDecoder()
+    reader = codecs.getreader("utf-8-sig")(file, errors="replace")
+    buffer, position, eof = "", 0, False
+    in_array = None
+
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+            position += 1
+        if position == len(buffer) and not eof:
+            chunk = reader.read(READ_CHUNK)
+            buffer, position, eof = chunk, 0, not chunk
+            continue
+        if position == len(buffer):
+            return
+        if in_array is None:
+            in_array = buffer[position] == "["
+            position += in_array
+            continue
+        if in_array and buffer[position] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+            # Значение, упёршееся в конец буфера, могло быть прочитано не целиком
+            complete = end < len(buffer) or eof
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            if len(buffer) - position > MAX_JSON_ITEM:
+                raise ValueError(f"элемент JSON длиннее {MAX_JSON_ITEM} символов")
+            chunk = reader.read(READ_CHUNK)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        position = end
+        plan = json_plan(value)
+        if plan is not None:
+            yield plan
+        elif not in_array:
+            raise ValueError('ожидается массив JSON или JSON Lines с объектами {"plan": ...}')
+
+
+READERS = {"csv": iter_csv, "json": iter_json, "txt": iter_txt}
+
+
+def iter_plans(file, fmt):
+    # None вместо текста — строка пропущена (слишком длинный план)
+    for raw in READERS[fmt](file):
+        plan = raw.strip()
+        if not plan:
+            continue
+        yield plan if len(plan) <= MAX_PLAN_LEN else None
+
+
+def next_batch(plans, size):
+    batch, skipped = [], 0
+    for plan in plans:
+        if plan is None:
+            skipped += 1
+            continue
+        batch.append(plan)
+        if len(batch) >= size:
+            break
+    return batch, skipped
+
+
+# --- ИМПОРТ И ЭКСПОРТ ---
+async def import_plans(plans_repo, user_id, file, fmt, batch_size=500, progress=None):
+    # Разбор идёт в потоке пачками по batch_size, каждая пачка — одна транзакция.
+    # Возвращает (импортировано, пропущено, ошибка или None).
+    plans = iter_plans(file, fmt)
+    imported = skipped = 0
+    while True:
+        try:
+            batch, batch_skipped = await asyncio.to_thread(next_batch, plans, batch_size)
+        except (ValueError, csv.Error) as e:
+            logger.warning(f"Ошибка разбора импорта пользователя {user_id}: {e}")
+            return imported, skipped, str(e)
+        skipped += batch_skipped
+        if not batch:
+            return imported, skipped, None
+        await plans_repo.add_many(user_id, batch)
+        imported += len(batch)
+        if progress is not None:
+            await progress(imported)
+
+
+async def export_plans(plans_repo, user_id, file, batch_size=1000):
+    # План за планом через keyset-страницы: в памяти не больше одной страницы
+    writer = csv.writer(file)
+    writer.writerow(("id", "plan"))
+    exported, after_id = 0, 0
+    while True:
+        rows, _, has_next = await plans_repo.page(user_id, after_id=after_id, limit=batch_size)
+        writer.writerows(row[:2] for row in rows)
+        exported += len(rows)
+        if not has_next:
+            return exported
+        after_id = rows[-1][0]
@@ -0,0 +1,102 @@
+import re
+
+# Русская и украинская раскладки часто смешиваются: «Киевская» / «Київська»
+NORMALIZE = str.maketrans({"ё": "е", "є": "е", "э": "е", "ї": "и", "і": "и", "ы": "и", "й": "и", "ґ": "г",
+                           "ь": "", "ъ": "", "'": "", "’": "", "ʼ": "", "`": ""})
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize_name(text):
+    return " ".join(WORD_RE.findall(text.casefold().translate(NORMALIZE)))
+
+
+def depth(region):
+    level = 0
+    while region.parent is not None and region.parent.name is not None:
+        region = region.parent
+        level += 1
+    return level
+
+
+def region_path(region):
+    names = []
+    region = region.parent
+    while region is not None and region.name is not None:
+        names.append(region.name)
+        region = region.parent
+    return " › ".join(reversed(names))
+
+
+class _Node:
+    __slots__ = ("children", "regions")
+
+    def __init__(self):
+        self.children = {}
+        self.regions = []
+
+
+# --- ПОИСК РЕГИОНОВ ---
+class RegionIndex:
+    # Префиксное дерево по нормализованным названиям регионов и по каждому
+    # слову названия. В каждом узле заранее лежат лучшие top совпадений,
+    # поэтому ответ на префикс — проход по его буквам без обхода поддерева.
+    # Если префикс ничего не нашёл, дерево обходится с расстоянием
+    # редактирования и отсечкой ветвей.
+    def __init__(self, regions, top=20):
+        self.top = top
+        self.root = _Node()
+        self.names = {}
+        # Сначала области, потом районы и громады, внутри — по алфавиту
+        for region in sorted(regions, key=lambda r: (depth(r), r.name)):
+            name = normalize_name(region.name)
+            if not name:
+                continue
+            self.names.setdefault(name, []).append(region)
+            words = name.split()
+            keys = {name, *(" ".join(words[i:]) for i in range(1, len(words)))}
+            for key in keys:
+                self._insert(key, region)
+
+    def _insert(self, key, region):
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, _Node())
+            if len(node.regions) < self.top and region not in node.regions:
+                node.regions.append(region)
+
+    def prefix(self, query, limit):
+        node = self.root
+        for char in query:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.regions[:limit]
+
+    def fuzzy(self, query, limit):
+        # Обход дерева со строкой матрицы Левенштейна на каждый узел: ветка
+        # отбрасывается, как только все значения строки больше max_distance.
+        # Узел, путь к которому близок к запросу, отдаёт свои top регионов.
+        max_distance = 1 if len(query) <= 5 else 2
+        found = {}
+        stack = [(self.root, list(range(len(query) + 1)))]
+        while stack:
+            node, row = stack.pop()
+            for char, child in node.children.items():
+                next_row = [row[0] + 1]
+                for j, query_char in enumerate(query, 1):
+                    next_row.append(min(next_row[j - 1] + 1, row[j] + 1, row[j - 1] + (query_char != char)))
+                distance = next_row[-1]
+                if distance <= max_distance:
+                    for region in child.regions:
+                        if distance < found.get(region, max_distance + 1):
+                            found[region] = distance
+                if min(next_row) <= max_distance:
+                    stack.append((child, next_row))
+        ranked = sorted(found.items(), key=lambda item: (item[1], depth(item[0]), item[0].name))
+        return [region for region, _ in ranked[:limit]]
+
+    def search(self, text, limit=10):
+        query = normalize_name(text)
+        if not query:
+            return []
+        return self.prefix(query, limit) or self.fuzzy(query, limit)
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+
+from region_search import RegionIndex
+
+logger = logging.getLogger(__name__)
+
+
+def render_codes(regions):
+    return "\n\n".join(f"<code>{region.name}</code>" for region in regions)
+
+
+class Region:
+    __slots__ = ("region_id", "name", "parent", "children", "codes")
+
+    def __init__(self, region_id, name, parent=None):
+        self.region_id = region_id
+        self.name = name
+        self.parent = parent
+        # Дочерние регионы по имени и заранее отрисованный список <code>
+        self.children = {}
+        self.codes = ""
+
+    def child(self, name):
+        return self.children.get(name)
+
+
+# --- КАТАЛОГ РЕГИОНОВ ---
+class RegionCatalog:
+    # Дерево область → район → громада из /api/v3/regions. Загружается
+    # один раз при старте и периодически обновляется в фоне, так что
+    # каждый шаг выбора региона — поиск в словаре без файлового I/O.
+    def __init__(self, http, url, headers, refresh_interval=6 * 3600):
+        self.http = http
+        self.url = url
+        self.headers = headers
+        self.refresh_interval = refresh_interval
+        self.root = Region(None, None)
+        self.by_id = {}
+        self.index = RegionIndex(())
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self):
+        return bool(self.root.children)
+
+    @property
+    def oblasts_codes(self):
+        return self.root.codes
+
+    def oblast(self, name):
+        return self.root.child(name)
+
+    def get(self, region_id):
+        return self.by_id.get(str(region_id))
+
+    def search(self, text, limit=10):
+        return self.index.search(text, limit)
+
+    async def load(self):
+        async with self.http.get(self.url, headers=self.headers) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Ошибка API: {response.status}")
+            data = await response.json()
+        if 'states' not in data:
+            raise RuntimeError("Данные о регионах отсутствуют.")
+        root, by_id = self.build(data['states'])
+        self.root, self.by_id, self.index = root, by_id, RegionIndex(by_id.values())
+        logger.info(f"Каталог регионов загружен: {len(self.by_id)} регионов")
+
+    async def ensure_loaded(self):
+        # Если загрузка при старте не удалась, пробуем ещё раз по требованию
+        if not self.loaded:
+            async with self._lock:
+                if not self.loaded:
+                    await self.load()
+
+    @staticmethod
+    def build(states):
+        root = Region(None, None)
+        by_id = {}
+        stack = [(root, states)]
+        while stack:
+            parent, items = stack.pop()
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                region = Region(str(item['regionId']), item['regionName'], parent)
+                parent.children[region.name] = region
+                by_id[region.region_id] = region
+                children = item.get('regionChildIds')
+                if isinstance(children, list) and children:
+                    stack.append((region, children))
+        for region in [root, *by_id.values()]:
+            region.codes = render_codes(region.children.values())
+        return root, by_id
+
+    async def refresh_forever(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"Не удалось обновить каталог регионов: {e}")
@@ -0,0 +1,182 @@
+import asyncio
+import datetime
+import heapq
+import logging
+import re
+import time
+
+from digest import parse_send_at
+
+logger = logging.getLogger(__name__)
+
+DUE_RE = re.compile(r"(.*\S)\s+@\s*(.+)", re.DOTALL)
+DATE_RE = re.compile(r"(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?")
+RELATIVE_DAYS = {"сегодня": 0, "завтра": 1, "послезавтра": 2}
+CLEAR_DUE = ("-", "нет")
+
+
+def split_due(text):
+    # «купить хлеб @ завтра 9:00» -> ("купить хлеб", "завтра 9:00"). Перед @
+    # нужен пробел, чтобы адреса вида a@b.com оставались частью текста.
+    match = DUE_RE.fullmatch(text.strip())
+    if not match:
+        return text.strip(), None
+    return match.group(1), match.group(2).strip()
+
+
+def clears_due(text):
+    # «-», «нет», «@ -» целиком — снять напоминание, не трогая текст плана
+    return text.strip().lstrip("@").strip().lower() in CLEAR_DUE
+
+
+def parse_due(text, now):
+    # «25.10 18:00», «25.10.2026 18:00», «завтра 9:00», «18:00» -> datetime
+    # в зоне now. None, если не разобрали или этот момент уже прошёл.
+    words = text.strip().lower().split(maxsplit=1)
+    if not words:
+        return None
+    day, roll_year = None, False
+    if len(words) == 2 and words[0] in RELATIVE_DAYS:
+        day = now.date() + datetime.timedelta(days=RELATIVE_DAYS[words[0]])
+        time_text = words[1]
+    elif len(words) == 2 and DATE_RE.fullmatch(words[0]):
+        day_text, month_text, year_text = DATE_RE.fullmatch(words[0]).groups()
+        # Без года: «01.01» в декабре — это следующий год
+        roll_year = year_text is None
+        try:
+            day = datetime.date(int(year_text) if year_text else now.year, int(month_text), int(day_text))
+        except ValueError:
+            return None
+        time_text = words[1]
+    else:
+        time_text = text
+    send_at = parse_send_at(time_text)
+    if send_at is None:
+        return None
+    hour, minute = map(int, send_at.split(":"))
+    if day is None:
+        moment = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if moment <= now:
+            moment += datetime.timedelta(days=1)
+        return moment
+    moment = datetime.datetime.combine(day, datetime.time(hour, minute), tzinfo=now.tzinfo)
+    if moment <= now and roll_year:
+        try:
+            moment = moment.replace(year=moment.year + 1)
+        except ValueError:
+            return None
+    return moment if moment > now else None
+
+
+# --- НАПОМИНАНИЯ ---
+class ReminderScheduler:
+    # Ближайшие напоминания лежат в куче (due_at, plan_id), актуальный срок
+    # каждого плана — в словаре due. Изменение или удаление плана только
+    # правит словарь; устаревшие записи кучи отбрасываются, когда доходят
+    # до вершины, а если их набирается больше живых, куча пересобирается.
+    # Одна задача спит до ближайшего срока или до пробуждения schedule(),
+    # поэтому БД читается только при старте и в момент срабатывания.
+    #
+    # owns(user_id) -> bool отбирает планы своего воркера: правки плана
+    # приходят в тот же процесс, что и его напоминания.
+    def __init__(self, plans, notify, owns=None, batch_size=500, max_sleep=60.0, retry_delay=5.0, clock=time.time):
+        self.plans = plans
+        self.notify = notify
+        self.owns = owns
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self.retry_delay = retry_delay
+        self.clock = clock
+        self._heap = []
+        self._due = {}
+        self._wakeup = asyncio.Event()
+        self.scheduled = 0
+        self.cancelled = 0
+        self.fired = 0
+        self.missed = 0
+        self.compactions = 0
+
+    async def load(self):
+        rows = await self.plans.reminders()
+        self._due = {plan_id: due_at for plan_id, user_id, due_at in rows if self.owns is None or self.owns(user_id)}
+        self._heap = [(due_at, plan_id) for plan_id, due_at in self._due.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+        logger.info(f"Загружено напоминаний: {len(self._due)}")
+
+    def schedule(self, plan_id, due_at):
+        self._due[plan_id] = due_at
+        heapq.heappush(self._heap, (due_at, plan_id))
+        self.scheduled += 1
+        if self._heap[0] == (due_at, plan_id):
+            # Новый срок раньше того, до которого спит задача
+            self._wakeup.set()
+        self._compact()
+
+    def cancel(self, plan_id):
+        if self._due.pop(plan_id, None) is not None:
+            self.cancelled += 1
+            self._compact()
+
+    def _compact(self):
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            self._heap = [(due_at, plan_id) for plan_id, due_at in self._due.items()]
+            heapq.heapify(self._heap)
+            self.compactions += 1
+
+    def _drop_stale(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now):
+        batch = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            due_at, plan_id = heapq.heappop(self._heap)
+            if self._due.get(plan_id) == due_at:
+                del self._due[plan_id]
+                batch.append((plan_id, due_at))
+        return batch
+
+    async def fire(self, batch):
+        # Срок сверяется с БД и снимается одной транзакцией: план могли удалить
+        # или изменить в обход планировщика
+        rows = await self.plans.take_reminders(batch)
+        self.missed += len(batch) - len(rows)
+        for plan_id, user_id, plan_text in rows:
+            await self.notify(user_id, f"⏰ Напоминание (план {plan_id}):\n{plan_text}")
+            self.fired += 1
+
+    async def run_forever(self):
+        while True:
+            self._drop_stale()
+            now = self.clock()
+            if self._heap and self._heap[0][0] <= now:
+                batch = self._pop_due(now)
+                try:
+                    await self.fire(batch)
+                except Exception as e:
+                    # Срок в БД не снят — возвращаем пачку в кучу и повторяем позже
+                    logger.error(f"Ошибка отправки напоминаний: {e}")
+                    for plan_id, due_at in batch:
+                        self._due.setdefault(plan_id, due_at)
+                        heapq.heappush(self._heap, (due_at, plan_id))
+                    await asyncio.sleep(self.retry_delay)
+                continue
+            # Сон не дольше max_sleep: часы могли перевести
+            delay = min(self.max_sleep, self._heap[0][0] - now) if self._heap else self.max_sleep
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        return {
+            "pending": len(self._due),
+            "heap_size": len(self._heap),
+            "scheduled": self.scheduled,
+            "cancelled": self.cancelled,
+            "fired": self.fired,
+            "missed": self.missed,
+            "compactions": self.compactions,
+        }
@@ -0,0 +1,147 @@
+import html
+import logging
+
+from aiogram import BaseMiddleware
+from aiogram.types import InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+# Лимит Bot API на текст сообщения; Telegram считает его в UTF-16
+MESSAGE_LIMIT = 4096
+PART_SEPARATOR = "\n\n"
+
+
+def text_length(text):
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_line(line, limit):
+    # Строка длиннее лимита режется по последнему пробелу, а без пробелов — как есть
+    while text_length(line) > limit:
+        cut = limit
+        while text_length(line[:cut]) > limit:
+            # Символ занимает одну или две единицы UTF-16
+            cut -= (text_length(line[:cut]) - limit + 1) // 2
+        space = line.rfind(" ", 0, cut)
+        if space > 0:
+            cut = space
+        yield line[:cut]
+        line = line[cut:].lstrip(" ")
+    yield line
+
+
+def split_text(text, limit=MESSAGE_LIMIT):
+    # Режет текст на куски не длиннее limit по переводам строк. HTML-теги
+    # не должны переходить через строку, иначе кусок получится с незакрытым тегом.
+    if text_length(text) <= limit:
+        return [text]
+    chunks, current, size = [], [], 0
+    for line in text.split("\n"):
+        for piece in split_line(line, limit):
+            length = text_length(piece)
+            if current and size + 1 + length > limit:
+                chunks.append("\n".join(current).strip("\n"))
+                current, size = [], 0
+            size += length + bool(current)
+            current.append(piece)
+    if current:
+        chunks.append("\n".join(current).strip("\n"))
+    return [chunk for chunk in chunks if chunk]
+
+
+class _Part:
+    __slots__ = ("text", "parse_mode", "reply_markup")
+
+    def __init__(self, text, parse_mode, reply_markup):
+        self.text = text
+        self.parse_mode = parse_mode
+        self.reply_markup = reply_markup
+
+
+def can_merge(group_markup, markup):
+    # Обычная клавиатура запоминается клиентом, поэтому ответ без клавиатуры
+    # можно дописать к сообщению с ней. Инлайн-кнопки относятся к тексту
+    # своего сообщения, и дописывать к нему нельзя.
+    if markup is None:
+        return not isinstance(group_markup, InlineKeyboardMarkup)
+    return group_markup is None or group_markup == markup
+
+
+def merge_parts(parts):
+    # Соседние ответы -> [(text, parse_mode, reply_markup)]. Если в группе
+    # есть HTML, обычный текст экранируется и вся группа уходит как HTML.
+    groups = []  # [клавиатура группы, части]
+    for part in parts:
+        if groups and can_merge(groups[-1][0], part.reply_markup):
+            groups[-1][1].append(part)
+            groups[-1][0] = part.reply_markup or groups[-1][0]
+        else:
+            groups.append([part.reply_markup, [part]])
+    merged = []
+    for markup, group in groups:
+        if any(part.parse_mode for part in group):
+            text = PART_SEPARATOR.join(part.text if part.parse_mode else html.escape(part.text, quote=False)
+                                       for part in group)
+            merged.append((text, "HTML", markup))
+        else:
+            merged.append((PART_SEPARATOR.join(part.text for part in group), None, markup))
+    return merged
+
+
+# --- БУФЕР ОТВЕТОВ ---
+class ReplyBuffer:
+    # Ответы обработчика копятся и уходят после его завершения: соседние
+    # сообщения склеиваются в одно, длинное делится на куски по 4096
+    # символов. Клавиатура достаётся последнему куску.
+    def __init__(self, bot, chat_id, limit=MESSAGE_LIMIT):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.limit = limit
+        self.parts = []
+        self.added = 0
+        self.sent = 0
+
+    def answer(self, text, parse_mode=None, reply_markup=None):
+        if parse_mode not in (None, "HTML"):
+            raise ValueError(f"Буфер ответов поддерживает только HTML, а не {parse_mode}")
+        if text:
+            self.parts.append(_Part(text, parse_mode, reply_markup))
+            self.added += 1
+
+    async def flush(self):
+        parts, self.parts = self.parts, []
+        for text, parse_mode, markup in merge_parts(parts):
+            chunks = split_text(text, self.limit)
+            for index, chunk in enumerate(chunks):
+                last = index == len(chunks) - 1
+                await self.bot.send_message(self.chat_id, chunk, parse_mode=parse_mode,
+                                            reply_markup=markup if last else None)
+                self.sent += 1
+
+
+class ReplyMiddleware(BaseMiddleware):
+    # Даёт обработчикам сообщений data["reply"] и отправляет накопленное
+    # после обработчика, даже если тот упал на середине
+    def __init__(self, limit=MESSAGE_LIMIT):
+        self.limit = limit
+        self.added = 0
+        self.sent = 0
+
+    async def __call__(self, handler, event, data):
+        reply = ReplyBuffer(data["bot"], event.chat.id, self.limit)
+        data["reply"] = reply
+        try:
+            return await handler(event, data)
+        finally:
+            try:
+                await reply.flush()
+            except Exception as e:
+                logger.error(f"Не удалось отправить ответ в чат {event.chat.id}: {e}")
+            self.added += reply.added
+            self.sent += reply.sent
+
+    def stats(self):
+        return {
+            "added": self.added,
+            "sent": self.sent,
+        }
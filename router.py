@@ -0,0 +1,49 @@
+from aiogram.dispatcher.event.handler import CallableObject
+
+
+def handler_name(event, data, text_router=None):
+    # Имя функции, выбранной фильтрами. Для кнопок меню зарегистрирован
+    # TextRouter.dispatch, поэтому настоящий обработчик ищется по тексту.
+    handler = data.get("handler")
+    callback = getattr(handler, "callback", None)
+    if text_router is not None and getattr(callback, "__self__", None) is text_router:
+        callback = text_router.handler_for(getattr(event, "text", None)) or callback
+    return getattr(callback, "__name__", "unknown")
+
+
+# --- МАРШРУТИЗАЦИЯ КНОПОК ---
+class TextRouter:
+    # Кнопки меню -> обработчик одной проверкой по словарю вместо цепочки
+    # фильтров `message.text == "..."`. В диспетчере регистрируется один
+    # обработчик, а он уже вызывает нужную функцию с её зависимостями.
+    def __init__(self):
+        self._handlers = {}
+
+    def button(self, *texts):
+        def register(callback):
+            handler = CallableObject(callback)
+            for text in texts:
+                if text in self._handlers:
+                    raise ValueError(f"Кнопка {text!r} уже зарегистрирована")
+                self._handlers[text] = handler
+            return callback
+        return register
+
+    def __contains__(self, text):
+        return text in self._handlers
+
+    def __len__(self):
+        return len(self._handlers)
+
+    def handler_for(self, text):
+        handler = self._handlers.get(text)
+        return handler.callback if handler else None
+
+    def matches(self, message):
+        return message.text in self._handlers
+
+    async def dispatch(self, message, **kwargs):
+        return await self._handlers[message.text].call(message, **kwargs)
+
+    def register(self, observer):
+        observer.register(self.dispatch, self.matches)
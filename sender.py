@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from replies import split_text
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_ALERT = 0
+PRIORITY_NORMAL = 10
+PRIORITY_BULK = 20
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Chat:
+    __slots__ = ("items", "ready_at", "busy")
+
+    def __init__(self):
+        self.items = []  # куча (priority, seq, item)
+        self.ready_at = 0.0
+        self.busy = False
+
+
+class _Item:
+    __slots__ = ("chat_id", "text", "kwargs", "priority", "future", "enqueued_at")
+
+    def __init__(self, chat_id, text, kwargs, priority, future):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+# --- ОЧЕРЕДЬ ОТПРАВКИ ---
+class SendQueue:
+    # Очередь исходящих сообщений для массовых рассылок. Общий token bucket
+    # держит ~30 сообщений/с на бота, каждый чат получает не больше одного
+    # сообщения в chat_interval секунд, а тревоги (PRIORITY_ALERT) обгоняют
+    # обычные сообщения. На TelegramRetryAfter сообщение возвращается в
+    # начало очереди чата, а отправка ставится на паузу.
+    def __init__(self, bot, rate=30, chat_interval=1.0, concurrency=30, latency_samples=1000):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.chat_interval = chat_interval
+        self.concurrency = asyncio.Semaphore(concurrency)
+        self._seq = itertools.count()
+        self._chats = {}
+        self._ready = []    # куча (priority, seq, chat_id) — чаты, готовые к отправке
+        self._delayed = []  # куча (ready_at, chat_id) — чаты на паузе
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+        self._task = None
+        self._sending = set()
+        self.depth = 0
+        self.sent = 0
+        self.failed = 0
+        self.retry_after = 0
+        self.latencies = deque(maxlen=latency_samples)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_timeout=5.0):
+        deadline = time.monotonic() + drain_timeout
+        while (self.depth or self._sending) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def put(self, chat_id, text, priority=PRIORITY_NORMAL, **kwargs):
+        # Ставит сообщение в очередь и сразу возвращает future с результатом отправки.
+        # Текст длиннее лимита Telegram уходит несколькими сообщениями подряд,
+        # клавиатура — у последнего; future относится к последнему куску.
+        chunks = split_text(text)
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat()
+        for index, chunk in enumerate(chunks):
+            chunk_kwargs = kwargs if index == len(chunks) - 1 else {
+                key: value for key, value in kwargs.items() if key != "reply_markup"}
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(chat.items, (priority, next(self._seq), _Item(chat_id, chunk, chunk_kwargs, priority, future)))
+            self.depth += 1
+        self._schedule(chat_id, chat)
+        return future
+
+    def _schedule(self, chat_id, chat):
+        if chat.busy or not chat.items:
+            return
+        if chat.ready_at <= time.monotonic():
+            heapq.heappush(self._ready, (chat.items[0][0], next(self._seq), chat_id))
+        else:
+            heapq.heappush(self._delayed, (chat.ready_at, chat_id))
+        self._wakeup.set()
+
+    def _promote_delayed(self):
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, chat_id = heapq.heappop(self._delayed)
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.busy or chat.ready_at > now:
+                continue
+            if chat.items:
+                heapq.heappush(self._ready, (chat.items[0][0], next(self._seq), chat_id))
+            else:
+                del self._chats[chat_id]
+
+    def _next_chat(self):
+        # В куче могут быть устаревшие записи: чат уже занят или опустел
+        while self._ready:
+            _, _, chat_id = heapq.heappop(self._ready)
+            chat = self._chats.get(chat_id)
+            if chat and not chat.busy and chat.items:
+                return chat_id, chat
+        return None, None
+
+    async def _run(self):
+        while True:
+            self._promote_delayed()
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            chat_id, chat = self._next_chat()
+            if chat is None:
+                self._wakeup.clear()
+                timeout = self._delayed[0][0] - time.monotonic() if self._delayed else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.bucket.acquire()
+            await self.concurrency.acquire()
+            _, _, item = heapq.heappop(chat.items)
+            self.depth -= 1
+            chat.busy = True
+            task = asyncio.create_task(self._send(chat_id, chat, item))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, chat_id, chat, item):
+        started = time.monotonic()
+        try:
+            result = await self.bot.send_message(item.chat_id, item.text, **item.kwargs)
+        except TelegramRetryAfter as e:
+            self.retry_after += 1
+            logger.warning(f"Flood control для чата {chat_id}: ждём {e.retry_after} с")
+            heapq.heappush(chat.items, (item.priority, -next(self._seq), item))
+            self.depth += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            chat.ready_at = time.monotonic() + e.retry_after
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+            if not item.future.done():
+                item.future.set_exception(e)
+                item.future.exception()
+            chat.ready_at = started + self.chat_interval
+        else:
+            self.sent += 1
+            self.latencies.append(time.monotonic() - item.enqueued_at)
+            if not item.future.done():
+                item.future.set_result(result)
+            chat.ready_at = started + self.chat_interval
+        finally:
+            self.concurrency.release()
+            chat.busy = False
+            if chat.items:
+                self._schedule(chat_id, chat)
+            else:
+                # Пустой чат помним до конца паузы, потом он удаляется в _promote_delayed
+                heapq.heappush(self._delayed, (chat.ready_at, chat_id))
+                self._wakeup.set()
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3) if latencies else 0.0
+
+        return {
+            "depth": self.depth,
+            "in_flight": len(self._sending),
+            "chats_waiting": len(self._chats),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retry_after": self.retry_after,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+        }
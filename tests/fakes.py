@@ -0,0 +1,36 @@
+# Фейки для тестов: сессия бота, которая не ходит в Telegram.
+
+import datetime
+import itertools
+import time
+
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message
+
+
+class RecordingSession(BaseSession):
+    # Запоминает время и порядок отправок. retry_after: {chat_id: секунды} —
+    # первая отправка в чат получает TelegramRetryAfter.
+    def __init__(self, retry_after=None):
+        super().__init__()
+        self.retry_after = dict(retry_after or {})
+        self.log = []  # (время, chat_id, текст)
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        if not isinstance(method, SendMessage):
+            return True
+        delay = self.retry_after.pop(method.chat_id, None)
+        if delay is not None:
+            raise TelegramRetryAfter(method, "Too Many Requests", delay)
+        self.log.append((time.monotonic(), method.chat_id, method.text))
+        return Message(message_id=next(self._message_ids), date=datetime.datetime.now(),
+                       chat=Chat(id=method.chat_id, type="private"), text=method.text)
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
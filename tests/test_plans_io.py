@@ -0,0 +1,64 @@
+# Тесты разбора импорта JSON: массив и JSON Lines читаются потоково,
+# а файл не того вида останавливает импорт с ошибкой, а не даёт 0 планов.
+#
+#   python -m unittest tests.test_plans_io
+
+import io
+import json
+import unittest
+
+from plans_io import MAX_JSON_ITEM, READ_CHUNK, import_plans, iter_json
+
+
+class CountingFile(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.read_bytes += len(data)
+        return data
+
+
+def json_file(text):
+    return CountingFile(text.encode("utf-8"))
+
+
+class IterJsonTest(unittest.TestCase):
+    def test_array(self):
+        text = json.dumps([{"plan": "первый"}, "второй", 3, {"id": 1}])
+        self.assertEqual(list(iter_json(json_file(text))), ["первый", "второй"])
+
+    def test_json_lines(self):
+        text = '{"plan": "первый"}\n{"plan": "второй"}\n'
+        self.assertEqual(list(iter_json(json_file(text))), ["первый", "второй"])
+
+    def test_top_level_object_is_rejected(self):
+        text = json.dumps({"plans": [{"plan": "первый"}]})
+        with self.assertRaises(ValueError):
+            list(iter_json(json_file(text)))
+
+    def test_malformed_stops_without_reading_whole_file(self):
+        file = json_file('[{"plan": "первый"}, {"plan": ' + "x" * (10 * MAX_JSON_ITEM))
+        plans = iter_json(file)
+        self.assertEqual(next(plans), "первый")
+        with self.assertRaises(ValueError):
+            next(plans)
+        self.assertLessEqual(file.read_bytes, MAX_JSON_ITEM + 2 * READ_CHUNK)
+
+
+class ImportPlansTest(unittest.IsolatedAsyncioTestCase):
+    async def test_error_is_reported(self):
+        class Repo:
+            async def add_many(self, user_id, plans):
+                pass
+
+        file = json_file(json.dumps({"plans": []}))
+        imported, skipped, error = await import_plans(Repo(), 1, file, "json")
+        self.assertEqual(imported, 0)
+        self.assertIsNotNone(error)
+
+
+if __name__ == "__main__":
+    unittest.main()
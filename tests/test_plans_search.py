@@ -0,0 +1,60 @@
+# Тесты поиска по планам: запрос к FTS5 должен разбиваться на слова так же,
+# как токенизатор unicode61, и не падать на вводе пользователя.
+#
+#   python -m unittest tests.test_plans_search
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from db import Database, PlanRepository, PLANS_SCHEMA, fts_query
+
+
+class FtsQueryTest(unittest.TestCase):
+    def test_underscore_splits_words(self):
+        self.assertEqual(fts_query(1, "foo_bar"), 'user_id:"1" AND plan:("foo" AND "bar")')
+
+    def test_prefix_applies_to_last_part(self):
+        self.assertEqual(fts_query(1, "foo_ba*"), 'user_id:"1" AND plan:("foo" AND "ba"*)')
+
+    def test_no_words(self):
+        self.assertIsNone(fts_query(1, "_ * ()"))
+
+
+class PlanSearchTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db = Database(os.path.join(tmp.name, "plans.db"))
+        await self.db.connect(PLANS_SCHEMA)
+        self.addAsyncCleanup(self.db.close)
+        self.repo = PlanRepository(self.db)
+        await self.repo.init_search()
+        await self.repo.add(1, "купить foo_bar молоко")
+        await self.repo.add(1, "позвонить маме")
+        await self.repo.add(2, "купить foo_bar хлеб")
+
+    async def search_texts(self, text):
+        return [row[1] for row in await self.repo.search(1, text)]
+
+    async def test_underscore_word(self):
+        self.assertEqual(await self.search_texts("foo_bar"), ["купить foo_bar молоко"])
+
+    async def test_syntax_is_not_injected(self):
+        for text in ('"', "NEAR(a b)", "молоко OR user_id:2", "-", "*"):
+            await self.repo.search(1, text)
+        self.assertEqual(await self.search_texts("молоко OR хлеб"), [])
+
+    async def test_fts_error_falls_back_to_like(self):
+        # Фраза в индексе с detail='column' — OperationalError от FTS5
+        with mock.patch("db.fts_query", return_value='user_id:"1" AND plan:"foo bar"'):
+            self.assertEqual(await self.search_texts("foo_bar"), ["купить foo_bar молоко"])
+
+    async def test_like_fallback(self):
+        self.repo.fts = False
+        self.assertEqual(await self.search_texts("foo_bar"), ["купить foo_bar молоко"])
+
+
+if __name__ == "__main__":
+    unittest.main()
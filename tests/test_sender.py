@@ -0,0 +1,80 @@
+# Тесты SendQueue на фейковой сессии бота: Bot API не вызывается, сессия
+# запоминает время и порядок отправок и умеет отвечать flood control.
+#
+#   python -m unittest tests.test_sender
+
+import asyncio
+import time
+import unittest
+
+from aiogram import Bot
+
+from sender import PRIORITY_ALERT, PRIORITY_BULK, SendQueue
+from tests.fakes import RecordingSession
+
+TOKEN = "123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+
+
+class SendQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.session = RecordingSession()
+        self.bot = Bot(TOKEN, session=self.session)
+
+    def make_queue(self, **kwargs):
+        queue = SendQueue(self.bot, **kwargs)
+        self.addAsyncCleanup(queue.stop, 0)
+        return queue
+
+    async def test_global_rate(self):
+        # Первые rate сообщений уходят сразу, остальные — со скоростью rate в секунду
+        queue = self.make_queue(rate=20, chat_interval=0)
+        futures = [await queue.put(chat_id, "текст") for chat_id in range(30)]
+        started = time.monotonic()
+        queue.start()
+        await asyncio.gather(*futures)
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
+        self.assertEqual(len(self.session.log), 30)
+        self.assertEqual(queue.stats()["sent"], 30)
+
+    async def test_chat_interval(self):
+        queue = self.make_queue(rate=100, chat_interval=0.2)
+        futures = [await queue.put(1, f"сообщение {i}") for i in range(3)]
+        queue.start()
+        await asyncio.gather(*futures)
+        times = [sent_at for sent_at, _, _ in self.session.log]
+        self.assertEqual([text for _, _, text in self.session.log], ["сообщение 0", "сообщение 1", "сообщение 2"])
+        for previous, current in zip(times, times[1:]):
+            self.assertGreaterEqual(current - previous, 0.19)
+
+    async def test_alert_jumps_ahead_of_bulk(self):
+        queue = self.make_queue(rate=100, chat_interval=0, concurrency=1)
+        futures = [await queue.put(chat_id, "рассылка", priority=PRIORITY_BULK) for chat_id in range(5)]
+        futures.append(await queue.put(1, "тревога", priority=PRIORITY_ALERT))
+        queue.start()
+        await asyncio.gather(*futures)
+        self.assertEqual(self.session.log[0][1:], (1, "тревога"))
+
+    async def test_retry_after_requeues_at_head_of_chat(self):
+        self.session.retry_after = {1: 1}
+        queue = self.make_queue(rate=100, chat_interval=0)
+        first = await queue.put(1, "первое")
+        second = await queue.put(1, "второе")
+        started = time.monotonic()
+        queue.start()
+        await asyncio.gather(first, second)
+        self.assertEqual([text for _, _, text in self.session.log], ["первое", "второе"])
+        self.assertGreaterEqual(self.session.log[0][0] - started, 0.95)
+        self.assertEqual(queue.stats()["retry_after"], 1)
+
+    async def test_stop_drains_queue(self):
+        queue = SendQueue(self.bot, rate=50, chat_interval=0)
+        futures = [await queue.put(chat_id, "текст") for chat_id in range(60)]
+        queue.start()
+        await queue.stop(drain_timeout=5)
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(len(self.session.log), 60)
+        self.assertEqual(queue.stats()["depth"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
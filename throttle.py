@@ -0,0 +1,166 @@
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+from router import handler_name
+
+logger = logging.getLogger(__name__)
+
+# Корзина, общая для всех апдейтов пользователя
+USER_FEATURE = "user"
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "warned")
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+        self.warned = False
+
+
+# --- ОГРАНИЧЕНИЕ ЧАСТОТЫ ---
+class RateLimiter:
+    # Токен-бакеты одного вида по user_id. OrderedDict упорядочен по
+    # последнему обращению, поэтому простаивающие корзины лежат в начале
+    # и выселяются при вставке новой без обхода всего словаря. Корзина,
+    # которая простояла burst / rate секунд, снова полна и ничем не
+    # отличается от новой, так что в памяти только недавно активные.
+    def __init__(self, rate, burst, max_size=100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_size = max_size
+        self.idle = burst / rate
+        self._buckets = OrderedDict()
+        self.allowed = 0
+        self.throttled = 0
+        self.evictions = 0
+
+    def take(self, user_id, now):
+        wait = self.peek(user_id, now)
+        if not wait:
+            self.spend(user_id)
+        return wait
+
+    def peek(self, user_id, now):
+        # 0, если токен есть, иначе сколько секунд ждать следующего. Токен не
+        # тратится: апдейт пропускается, только если токен есть во всех корзинах.
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = _Bucket(self.burst, now)
+            self._evict(now)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            return 0.0
+        self.throttled += 1
+        return (1 - bucket.tokens) / self.rate
+
+    def spend(self, user_id):
+        # Только после peek, вернувшего 0: корзина есть и в ней есть токен
+        bucket = self._buckets[user_id]
+        bucket.tokens -= 1
+        bucket.warned = False
+        self.allowed += 1
+
+    def warn(self, user_id):
+        # True только для первого отказа подряд: один ответ на серию апдейтов
+        bucket = self._buckets.get(user_id)
+        if bucket is None or bucket.warned:
+            return False
+        bucket.warned = True
+        return True
+
+    def _evict(self, now):
+        # При переполнении выселяется и не до конца наполненная корзина:
+        # пользователь лишь получит лимит заново, раньше срока
+        deadline = now - self.idle
+        buckets = self._buckets
+        while buckets:
+            oldest = buckets[next(iter(buckets))]
+            if len(buckets) <= self.max_size and oldest.updated > deadline:
+                break
+            buckets.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def stats(self):
+        return {
+            "buckets": len(self._buckets),
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+            "evictions": self.evictions,
+        }
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    # Внутренний middleware сообщений и колбэков: к этому моменту фильтры
+    # выбрали обработчик, и по его имени определяется функция бота. Апдейт
+    # тратит токен общей корзины пользователя и корзины функции, если она
+    # есть, — и только если токен есть в обеих: отказ одной функции не
+    # расходует общий лимит. Апдейт сверх лимита отбрасывается, а
+    # пользователь получает один короткий ответ на всю серию.
+    #
+    # limits: {функция: (rate, burst)}, features: {имя обработчика: функция}
+    def __init__(self, limits, features=None, text_router=None, max_size=100_000, clock=time.monotonic):
+        self.limiters = {feature: RateLimiter(rate, burst, max_size) for feature, (rate, burst) in limits.items()}
+        self.features = features or {}
+        self.text_router = text_router
+        self.clock = clock
+        self.warnings = 0
+
+    def check(self, user_id, feature, now):
+        # (ограничитель, ожидание) для первой пустой корзины или (None, 0)
+        limiters = [limiter for limiter in (self.limiters.get(USER_FEATURE), self.limiters.get(feature))
+                    if limiter is not None]
+        for limiter in limiters:
+            wait = limiter.peek(user_id, now)
+            if wait:
+                return limiter, wait
+        for limiter in limiters:
+            limiter.spend(user_id)
+        return None, 0.0
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        feature = self.features.get(handler_name(event, data, self.text_router))
+        limiter, wait = self.check(user.id, feature, self.clock())
+        if limiter is None:
+            return await handler(event, data)
+        if limiter.warn(user.id):
+            self.warnings += 1
+            await self.reply_throttled(event, wait)
+        elif isinstance(event, CallbackQuery):
+            # Колбэк отвечается всегда, иначе часики на кнопке крутятся до таймаута
+            try:
+                await event.answer()
+            except Exception as e:
+                logger.error(f"Не удалось ответить на колбэк: {e}")
+        return None
+
+    async def reply_throttled(self, event, wait):
+        # У сообщения это sendMessage, у колбэка — answerCallbackQuery,
+        # который всё равно нужен, чтобы погасить часики на кнопке
+        try:
+            await event.answer(f"⏳ Слишком много запросов, попробуйте через {max(1, round(wait))} с.")
+        except Exception as e:
+            logger.error(f"Не удалось ответить о превышении лимита: {e}")
+
+    def stats(self):
+        return {
+            "throttled": sum(limiter.throttled for limiter in self.limiters.values()),
+            "warnings": self.warnings,
+            "buckets": sum(len(limiter) for limiter in self.limiters.values()),
+        }
+
+    def feature_stats(self):
+        return {feature: limiter.stats() for feature, limiter in self.limiters.items()}
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_city(city):
+    return " ".join(city.split()).casefold()
+
+
+# --- КЭШ ПОГОДЫ ---
+class WeatherCache:
+    # Кэш готовых прогнозов по нормализованному названию города.
+    # Свежая запись (моложе ttl) отдаётся сразу. Устаревшая, но моложе
+    # ttl + stale_ttl, тоже отдаётся сразу, а обновляется в фоне.
+    # Одновременные промахи по одному городу ждут один общий запрос.
+    #
+    # fetch(city) -> (value, cacheable); некэшируемые ответы (ошибки API)
+    # возвращаются вызывающему, но не сохраняются. Если при этом в кэше
+    # есть запись старше stale_ttl, отдаётся она: старый прогноз лучше ошибки,
+    # пока API недоступен.
+    def __init__(self, fetch, ttl=600, stale_ttl=1800, max_size=1000):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._background = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.fallbacks = 0
+
+    async def get(self, city):
+        key = normalize_city(city)
+        entry = self._entries.get(key)
+        if entry:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    task = asyncio.create_task(self._refresh(key, city))
+                    self._background.add(task)
+                    task.add_done_callback(self._background.discard)
+                return value
+
+        if key in self._inflight:
+            self.coalesced += 1
+            return await asyncio.shield(self._inflight[key])
+        self.misses += 1
+        return await self._load(key, city)
+
+    async def _refresh(self, key, city):
+        try:
+            await self._load(key, city)
+        except Exception as e:
+            logger.error(f"Ошибка фонового обновления погоды для {city}: {e}")
+
+    async def _load(self, key, city):
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            try:
+                value, cacheable = await self.fetch(city)
+            except Exception as e:
+                if key not in self._entries:
+                    future.set_exception(e)
+                    # Исключение уже отдано ожидающим; не даём asyncio ругаться на него
+                    future.exception()
+                    raise
+                logger.warning(f"Ошибка запроса погоды для {city}, отдаём устаревший прогноз: {e}")
+                value, cacheable = self._entries[key][0], False
+                self.fallbacks += 1
+            else:
+                if cacheable:
+                    self._store(key, value)
+                elif key in self._entries:
+                    value = self._entries[key][0]
+                    self.fallbacks += 1
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            # Отмена загружающего не должна оставить ожидающих висеть
+            if not future.done():
+                future.set_exception(e if isinstance(e, Exception) else RuntimeError("запрос погоды прерван"))
+                future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def _store(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "fallbacks": self.fallbacks,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Типы апдейтов, у которых есть from_user
+USER_UPDATE_TYPES = ("message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+                     "shipping_query", "pre_checkout_query", "my_chat_member", "chat_member", "chat_join_request")
+
+
+def jump_hash(key, buckets):
+    # Jump consistent hash (Lamping, Veach): при изменении числа воркеров
+    # переезжает только 1/N пользователей, а не почти все, как при key % N
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, j = -1, 0
+    while j < buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+
+def update_user_id(update):
+    for kind in USER_UPDATE_TYPES:
+        event = update.get(kind)
+        if event:
+            user = event.get("from") or {}
+            if "id" in user:
+                return user["id"]
+            chat = event.get("chat") or {}
+            return chat.get("id", 0)
+    return 0
+
+
+# --- ВОРКЕР ---
+class Worker:
+    # Процесс main.py в режиме worker: принимает апдейты своего шарда на
+    # локальном порту. Упавший процесс перезапускается с растущей паузой.
+    def __init__(self, index, port, env, script):
+        self.index = index
+        self.port = port
+        self.env = env
+        self.script = script
+        self.url = f"http://127.0.0.1:{port}/update"
+        self.process = None
+        self.restarts = 0
+        self.ready = asyncio.Event()
+
+    async def start(self):
+        # Своя сессия: Ctrl+C из терминала получает только входной процесс,
+        # а он сам останавливает воркеров
+        self.process = await asyncio.create_subprocess_exec(sys.executable, self.script, env=self.env,
+                                                            start_new_session=True)
+        logger.info(f"Воркер {self.index} запущен, pid {self.process.pid}, порт {self.port}")
+
+    async def supervise(self, stopping, backoff_max=30.0, healthy_after=60.0):
+        backoff = 1.0
+        while not stopping.is_set():
+            started = time.monotonic()
+            await self.start()
+            code = await self.process.wait()
+            self.ready.clear()
+            if stopping.is_set():
+                return
+            self.restarts += 1
+            if time.monotonic() - started > healthy_after:
+                backoff = 1.0
+            logger.error(f"Воркер {self.index} завершился с кодом {code}, перезапуск через {backoff:.0f} с")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, backoff_max)
+
+    async def stop(self, timeout=10.0):
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+
+# --- ШАРДИРОВАНИЕ ---
+class ShardedIngress:
+    # Принимает сырые апдейты и пересылает каждый воркеру по jump_hash от
+    # from_user.id, поэтому состояние FSM и кэш хранилища пользователя живут
+    # в одном процессе. Апдейты одного пользователя уходят строго по порядку,
+    # разных — параллельно, до concurrency запросов на воркер.
+    def __init__(self, workers, secret, concurrency=64, forward_timeout=30.0):
+        self.workers = workers
+        self.secret = secret
+        self.concurrency = concurrency
+        self.forward_timeout = forward_timeout
+        self.session = None
+        self._stopping = asyncio.Event()
+        self._supervisors = []
+        self._semaphores = [asyncio.Semaphore(concurrency) for _ in workers]
+        self._tails = {}
+        self._background = set()
+        self.forwarded = [0] * len(workers)
+        self.failed = 0
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency * len(self.workers)),
+            timeout=aiohttp.ClientTimeout(total=self.forward_timeout),
+        )
+        for worker in self.workers:
+            self._supervisors.append(asyncio.create_task(worker.supervise(self._stopping)))
+        await asyncio.gather(*(self.wait_ready(worker) for worker in self.workers))
+
+    async def wait_ready(self, worker, timeout=60.0):
+        # Воркер готов, когда его HTTP-сервер принимает соединения
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                async with self.session.get(f"http://127.0.0.1:{worker.port}/health") as response:
+                    if response.status == 200:
+                        worker.ready.set()
+                        return True
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+        logger.error(f"Воркер {worker.index} не ответил за {timeout:.0f} с")
+        return False
+
+    async def close(self):
+        self._stopping.set()
+        if self._background:
+            await asyncio.wait(self._background, timeout=self.forward_timeout)
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+        for task in self._supervisors:
+            task.cancel()
+        if self.session is not None:
+            await self.session.close()
+
+    def shard(self, user_id):
+        return jump_hash(user_id, len(self.workers))
+
+    async def _post(self, index, body):
+        worker = self.workers[index]
+        deadline = time.monotonic() + self.forward_timeout
+        while True:
+            if not worker.ready.is_set():
+                await self.wait_ready(worker, max(0.0, deadline - time.monotonic()))
+            try:
+                async with self._semaphores[index]:
+                    async with self.session.post(worker.url, data=body, headers={
+                        SECRET_HEADER: self.secret, "Content-Type": "application/json",
+                    }) as response:
+                        await response.read()
+                        # Ошибку обработчика не повторяем: апдейт мог быть обработан частично
+                        if response.status >= 500:
+                            logger.error(f"Воркер {index} вернул {response.status}")
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                worker.ready.clear()
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"воркер {index} недоступен")
+            await asyncio.sleep(0.2)
+
+    async def forward(self, update, body=None):
+        # update — разобранный dict, body — исходные байты, если они уже есть
+        user_id = update_user_id(update)
+        index = self.shard(user_id)
+        if body is None:
+            body = json.dumps(update).encode()
+        key = (index, user_id)
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        try:
+            if previous is not None:
+                await previous
+            await self._post(index, body)
+            self.forwarded[index] += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Апдейт {update.get('update_id')} не доставлен воркеру {index}: {e}")
+        finally:
+            done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
+
+    def submit(self, update, body=None):
+        task = asyncio.create_task(self.forward(update, body))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def webhook_handler(self, secret_token=None):
+        async def handle(request):
+            if secret_token and request.headers.get(SECRET_HEADER) != secret_token:
+                return web.Response(status=401)
+            body = await request.read()
+            try:
+                update = json.loads(body)
+            except ValueError:
+                return web.Response(status=400)
+            self.submit(update, body)
+            return web.json_response({})
+        return handle
+
+    async def poll(self, bot, allowed_updates=None, timeout=30):
+        # Long polling без разбора в модели aiogram: воркеру уходит исходный JSON
+        url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+        offset = None
+        while not self._stopping.is_set():
+            params = {"timeout": timeout}
+            if offset is not None:
+                params["offset"] = offset
+            if allowed_updates:
+                params["allowed_updates"] = json.dumps(allowed_updates)
+            try:
+                async with self.session.post(url, data=params,
+                                             timeout=aiohttp.ClientTimeout(total=timeout + 10)) as response:
+                    payload = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.error(f"Ошибка getUpdates: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not payload.get("ok"):
+                logger.error(f"getUpdates вернул ошибку: {payload.get('description')}")
+                await asyncio.sleep(payload.get("parameters", {}).get("retry_after", 1))
+                continue
+            for update in payload["result"]:
+                offset = update["update_id"] + 1
+                self.submit(update)
+
+    def stats(self):
+        return {
+            "workers": len(self.workers),
+            "forwarded": sum(self.forwarded),
+            "failed": self.failed,
+            "restarts": sum(worker.restarts for worker in self.workers),
+            "in_flight": len(self._background),
+        }
+
+
+def make_workers(count, base_port, secret, script, env=None):
+    workers = []
+    for index in range(count):
+        worker_env = {
+            **os.environ, **(env or {}),
+            "BOT_MODE": "worker",
+            "WORKERS": str(count),
+            "WORKER_INDEX": str(index),
+            "WORKER_PORT": str(base_port + index),
+            "WORKER_SECRET": secret,
+        }
+        workers.append(Worker(index, base_port + index, worker_env, script))
+    return workers